@@ -0,0 +1,49 @@
+"""
+Per-call OpenAI client vs. the pooled client, against a local stub server.
+
+    python benchmarks/bench_ai_client.py [--requests 20] [--connect-delay 0.03]
+
+``--connect-delay`` is added once per new TCP connection to stand in for the
+TCP + TLS handshake of a remote endpoint.
+"""
+import argparse
+import time
+
+from common import setup_django
+
+
+def run(client_factory, requests):
+    """Return mean milliseconds per chat completion."""
+    start = time.perf_counter()
+    for _ in range(requests):
+        client_factory().chat.completions.create(model="m", messages=[{"role": "user", "content": "hi"}])
+    return (time.perf_counter() - start) / requests * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--connect-delay", type=float, default=0.03)
+    args = parser.parse_args()
+
+    setup_django()
+    from openai import OpenAI
+
+    from home.ai.clients import _build_http_client, get_openai_client, reset_clients
+    from home.tests import StubOpenAIServer
+
+    print(f"{'client':>10} {'ms/request':>11} {'connections':>12}")
+    with StubOpenAIServer(connect_delay=args.connect_delay) as stub:
+        def fresh_client():
+            return OpenAI(base_url=stub.base_url, api_key="stub", http_client=_build_http_client())
+
+        for name, factory in (("per-call", fresh_client),
+                              ("pooled", lambda: get_openai_client(stub.base_url, "stub"))):
+            before = stub.connections
+            per_request_ms = run(factory, args.requests)
+            print(f"{name:>10} {per_request_ms:>11.2f} {stub.connections - before:>12}")
+    reset_clients(close=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Page-view latency while AI requests are in flight (ASGI, async AI views).
+
+    python benchmarks/bench_async_views.py [--concurrency 5 20 50] [--ai-delay 1.0]
+
+Runs against a throwaway test database and a local stub AI server that takes
+``--ai-delay`` seconds per completion. With sync AI views every in-flight
+completion held a worker, so page views queued behind them.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from common import setup_django
+
+
+async def measure(client, concurrency, ai_url, page_url, pages=10):
+    async def ask():
+        await client.post(ai_url, {"ai_input": "Plan a fractions lesson"},
+                          headers={"X-Requested-With": "XMLHttpRequest"})
+
+    async def page_views():
+        await asyncio.sleep(0.05)
+        durations = []
+        for _ in range(pages):
+            start = time.perf_counter()
+            response = await client.get(page_url)
+            assert response.status_code == 200, response.status_code
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    start = time.perf_counter()
+    durations, *_ = await asyncio.gather(page_views(), *(ask() for _ in range(concurrency)))
+    return statistics.median(durations) * 1000, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--ai-delay", type=float, default=1.0)
+    args = parser.parse_args()
+
+    setup_django()
+    from asgiref.sync import async_to_sync, sync_to_async
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import AsyncClient
+    from django.test.utils import setup_test_environment
+    from django.urls import reverse
+
+    from home.tests import StubOpenAIServer
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    user = User.objects.create_user(username="bench", password="bench")
+    client = AsyncClient()
+    ai_url, page_url = reverse("home:createnewlesson"), reverse("home:mylessonplans")
+
+    async def run():
+        await sync_to_async(client.force_login)(user)
+        print(f"{'in-flight AI':>13} {'page ms (median)':>17} {'all done s':>11}")
+        idle_ms, _ = await measure(client, 0, ai_url, page_url)
+        print(f"{0:>13} {idle_ms:>17.1f} {'-':>11}")
+        for concurrency in args.concurrency:
+            page_ms, total_s = await measure(client, concurrency, ai_url, page_url)
+            print(f"{concurrency:>13} {page_ms:>17.1f} {total_s:>11.2f}")
+
+    with StubOpenAIServer(response_delay=args.ai_delay) as stub:
+        settings.BASE_URL = stub.base_url
+        settings.NVIDIA_API_KEY = "stub"
+        settings.AI_HTTP_MAX_CONNECTIONS = max(args.concurrency)
+        # async_to_sync keeps thread-sensitive ORM work on this thread, as under uvicorn.
+        async_to_sync(run)()
+
+
+if __name__ == "__main__":
+    main()
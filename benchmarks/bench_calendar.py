@@ -0,0 +1,93 @@
+"""
+Calendar events: the whole history inlined into the page vs. the date-ranged feed.
+
+    python benchmarks/bench_calendar.py [--lessons 10000] [--years 5] [--schedules 2000]
+
+Fills a throwaway test database with one teacher's lessons, spread over
+``--years`` years, plus schedule entries, and times building the events for
+the calendar: all of them as the pages used to, and one month from the feed.
+"""
+import argparse
+import json
+import random
+from datetime import timedelta
+
+from common import setup_django, timed
+
+
+def populate(lessons, years, schedules):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from home.models import Grade, LessonPlan, LessonSchedule, Subject
+
+    rng = random.Random(42)
+    user = User.objects.create_user(username="teacher", password="pw")
+    subject, grade = Subject.objects.first(), Grade.objects.first()
+    today = timezone.now().date()
+    days = years * 365
+    plans = LessonPlan.objects.bulk_create([
+        LessonPlan(user=user, subject=subject, grade=grade, title=f"Lesson {n}", description="Description " * 20,
+                   learning_objectives="Objectives " * 20, materials_needed="Materials", main_instruction="Main " * 80,
+                   lesson_date=today - timedelta(days=rng.randrange(days)))
+        for n in range(lessons)
+    ], batch_size=2000)
+    LessonSchedule.objects.bulk_create([
+        LessonSchedule(lesson_plan=rng.choice(plans), user=user, scheduled_date=today - timedelta(days=n % days),
+                       class_period=f"Period {n}")
+        for n in range(schedules)
+    ], batch_size=2000)
+    return user, today
+
+
+def inline_events(user):
+    """The events payload as the pages used to inline it: every dated lesson, ``reverse()`` per row."""
+    from django.urls import reverse
+
+    from home.models import LessonPlan
+
+    return json.dumps([{
+        "title": lesson.title,
+        "start": lesson.lesson_date.strftime("%Y-%m-%d"),
+        "url": reverse("home:lesson_detail", args=[lesson.pk]),
+        "allDay": True,
+    } for lesson in LessonPlan.objects.filter(user=user, lesson_date__isnull=False).only("title", "lesson_date")])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lessons", type=int, default=10000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--schedules", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from django.urls import reverse
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        user, today = populate(args.lessons, args.years, args.schedules)
+        client = Client()
+        client.force_login(user)
+        start = today.replace(day=1) - timedelta(days=7)
+        params = {"start": start.isoformat(), "end": (start + timedelta(days=42)).isoformat()}
+
+        def feed():
+            return client.get(reverse("home:calendar_events"), params).content
+
+        print(f"database: {connection.vendor}, {args.lessons} lessons over {args.years} years, "
+              f"{args.schedules} schedule entries")
+        print(f"{'path':>22} {'ms':>8} {'events':>7} {'KB':>8}")
+        for name, func in (("inline, all lessons", lambda: inline_events(user)), ("feed, one month view", feed)):
+            seconds, payload = timed(func, repeat=5)
+            print(f"{name:>22} {seconds * 1000:>8.2f} {len(json.loads(payload)):>7} {len(payload) / 1024:>8.1f}")
+    finally:
+        connection.creation.destroy_test_db(connection.settings_dict["NAME"], verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Prompt size and latency over long AI conversations, with and without compaction.
+
+    python benchmarks/bench_conversations.py [--turns 50] [--reply-words 150] [--prefill-ms-per-1k 40]
+
+Each turn asks a question in a conversation and records the exchange, as the
+lesson assistant does. The stub server answers after ``--prefill-ms-per-1k``
+milliseconds per 1000 prompt tokens, standing in for the model reading the
+prompt; everything else (history lookup, compaction, logging) is measured as is.
+"""
+import argparse
+import statistics
+import time
+
+from common import setup_django
+
+
+def run(user, turns, reply_words, prefill_ms_per_1k, stub):
+    """Return ``[(prompt_tokens, milliseconds), ...]`` for each turn of one conversation."""
+    from home.ai.ai_review import generate_ai_response
+    from home.ai.conversations import get_conversation, history_messages, messages_tokens, record_exchange
+    from home.ai.prompting import count_tokens
+
+    stub.reply = " ".join(["word"] * reply_words)
+    conversation_id = None
+    results = []
+    for turn in range(turns):
+        question = f"Question {turn}: how should I adapt the fractions activity for a mixed-ability class?"
+        start = time.perf_counter()
+        conversation = get_conversation(user, conversation_id, request_type="lesson_assist")
+        history = history_messages(conversation)
+        prompt_tokens = messages_tokens(history) + count_tokens(question)
+        stub.response_delay = prompt_tokens / 1000 * prefill_ms_per_1k / 1000
+        answer = generate_ai_response(question, request_type="lesson_assist", user=user, use_cache=False,
+                                      history=history)
+        record_exchange(conversation, question, answer)
+        conversation_id = conversation.pk
+        results.append((prompt_tokens, (time.perf_counter() - start) * 1000))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--reply-words", type=int, default=150)
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=40.0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    from home.tests import StubOpenAIServer
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        user = User.objects.create_user(username="bench")
+        settings.AI_USER_REQUESTS_PER_MINUTE = 0
+        settings.AI_USER_TOKENS_PER_HOUR = 0
+        results = {}
+        with StubOpenAIServer() as stub:
+            settings.BASE_URL, settings.NVIDIA_API_KEY = stub.base_url, "stub-key"
+            for name, compaction in (("full", False), ("compacted", True)):
+                settings.AI_CONVERSATION_COMPACTION = compaction
+                results[name] = run(user, args.turns, args.reply_words, args.prefill_ms_per_1k, stub)
+
+        print(f"history budget: {settings.AI_CONVERSATION_TOKEN_BUDGET} tokens")
+        print(f"{'turn':>5} {'full tokens':>12} {'full ms':>8} {'compacted tokens':>17} {'compacted ms':>13}")
+        step = max(1, args.turns // 10)
+        for turn in sorted({*range(0, args.turns, step), args.turns - 1}):
+            (full_tokens, full_ms), (compact_tokens, compact_ms) = results["full"][turn], results["compacted"][turn]
+            print(f"{turn + 1:>5} {full_tokens:>12} {full_ms:>8.1f} {compact_tokens:>17} {compact_ms:>13.1f}")
+        for name, rows in results.items():
+            print(f"{name}: {sum(tokens for tokens, _ in rows)} prompt tokens in total, "
+                  f"median {statistics.median(ms for _, ms in rows):.1f} ms/turn")
+    finally:
+        connection.creation.destroy_test_db(connection.settings_dict["NAME"], verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Home dashboard data: the former per-list queries vs. the two-query version and its cache.
+
+    python benchmarks/bench_dashboard.py [--lessons 10000] [--materials 500]
+
+Fills a throwaway test database with one teacher's lessons (a tenth of them
+drafts, a third dated within the next few weeks) and times collecting the
+dashboard's counts and lesson lists, plus a full page load.
+"""
+import argparse
+import random
+from datetime import timedelta
+
+from common import setup_django, timed
+
+
+def populate(lessons, materials):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from home.models import Grade, LessonPlan, Material, Resource, Subject
+
+    rng = random.Random(42)
+    user = User.objects.create_user(username="teacher", password="pw")
+    subjects, grades = list(Subject.objects.all()), list(Grade.objects.all())
+    today = timezone.now().date()
+    LessonPlan.objects.bulk_create([
+        LessonPlan(user=user, subject=rng.choice(subjects), grade=rng.choice(grades), title=f"Lesson {n}",
+                   description="Description " * 20, learning_objectives="Objectives " * 20,
+                   materials_needed="Materials", opening_activity="Opening " * 30, main_instruction="Main " * 80,
+                   closing_activity="Closing " * 30, formative_assessment="Check " * 20,
+                   differentiation_strategies="Support " * 20, is_draft=n % 10 == 0, is_archived=n % 25 == 0,
+                   lesson_date=today + timedelta(days=rng.randint(-300, 30)) if n % 3 == 0 else None)
+        for n in range(lessons)
+    ], batch_size=2000)
+    Material.objects.bulk_create([Material(user=user, title=f"M{n}", content="x") for n in range(materials)])
+    Resource.objects.bulk_create([Resource(user=user, title=f"R{n}", url="https://example.com")
+                                  for n in range(materials)])
+    return user
+
+
+def per_list_queries(user):
+    """The dashboard data as the home view used to collect it (template attribute access included)."""
+    from django.utils import timezone
+
+    from home.models import LessonPlan, Material, Resource
+
+    today = timezone.now().date()
+    recent = list(LessonPlan.objects.filter(user=user, is_archived=False)[:5])
+    counts = (LessonPlan.objects.filter(user=user).count(), Material.objects.filter(user=user).count(),
+              Resource.objects.filter(user=user).count())
+    upcoming = list(LessonPlan.objects.filter(user=user, lesson_date__gte=today,
+                                              lesson_date__lte=today + timedelta(days=7),
+                                              is_archived=False).order_by("lesson_date")[:5])
+    drafts = list(LessonPlan.objects.filter(user=user, is_draft=True, is_archived=False)
+                  .order_by("-updated_at")[:3])
+    for draft in drafts:
+        draft.subject.name, draft.grade.level
+    return counts, recent, upcoming, drafts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lessons", type=int, default=10000)
+    parser.add_argument("--materials", type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext, setup_test_environment
+    from django.urls import reverse
+
+    from home.dashboard import dashboard_data
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        user = populate(args.lessons, args.materials)
+        client = Client()
+        client.force_login(user)
+
+        def two_queries(user):
+            settings.DASHBOARD_CACHE_TTL = 0
+            return dashboard_data(user)
+
+        def cached(user):
+            settings.DASHBOARD_CACHE_TTL = 60
+            return dashboard_data(user)
+
+        def page(user):
+            cache.clear()
+            return client.get(reverse("home:home"))
+
+        print(f"database: {connection.vendor}, {args.lessons} lessons for one teacher")
+        print(f"{'path':>18} {'ms':>8} {'queries':>8}")
+        cached(user)  # warm the cache entry
+        for name, func in (("per-list queries", per_list_queries), ("two queries", two_queries),
+                           ("cached", cached), ("home page (cold)", page)):
+            with CaptureQueriesContext(connection) as queries:
+                func(user)
+            count = len(queries)  # read now: client requests reset the query log
+            seconds, _ = timed(func, user, repeat=5)
+            print(f"{name:>18} {seconds * 1000:>8.2f} {count:>8}")
+    finally:
+        connection.creation.destroy_test_db(connection.settings_dict["NAME"], verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Lesson search: the old ``icontains`` scan vs. the full-text index.
+
+    python benchmarks/bench_lesson_search.py [--lessons 100000] [--teachers 1] [--words 20]
+
+Fills a throwaway test database with synthetic lessons (``--words`` words per
+text field, drawn from a Zipf-distributed vocabulary) and times what ``mylessonplans`` does for a search: count the
+matches and load the first page, for rare, common and prefix queries.
+"""
+import argparse
+import itertools
+import random
+
+from common import setup_django, timed
+
+QUERIES = ("photosynthesis volcano", "students", "fract", "zebra")
+# Real words at the Zipf ranks that make them common, mid-frequency or rare.
+_PLACED_WORDS = {0: "students", 50: "fractions", 3000: "photosynthesis", 4000: "volcano"}
+
+
+def vocabulary(size=5000, seed=7):
+    """Return ``(words, cumulative weights)``: made-up words with Zipf-distributed frequencies."""
+    rng = random.Random(seed)
+    syllables = ["ba", "ko", "ri", "tem", "lu", "sa", "nor", "vi", "pe", "dan", "mi", "go", "zu", "ter"]
+    words = ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+    for rank, word in _PLACED_WORDS.items():
+        words[rank] = word
+    return words, list(itertools.accumulate(1 / (rank + 1) for rank in range(size)))
+
+
+def _text(rng, vocab, words):
+    return " ".join(rng.choices(vocab[0], cum_weights=vocab[1], k=words))
+
+
+def populate(lessons, teachers, words):
+    from django.contrib.auth.models import User
+
+    from home.models import Grade, LessonPlan, Subject
+    from home.search import BODY_FIELDS
+
+    rng = random.Random(42)
+    vocab = vocabulary()
+    users = [User.objects.create_user(username=f"teacher{n}") for n in range(teachers)]
+    subject, grade = Subject.objects.first(), Grade.objects.first()
+    batch = []
+    for n in range(lessons):
+        batch.append(LessonPlan(user=users[n % teachers], subject=subject, grade=grade,
+                                title=_text(rng, vocab, 4), **{field: _text(rng, vocab, words) for field in BODY_FIELDS}))
+        if len(batch) == 2000:
+            LessonPlan.objects.bulk_create(batch)
+            batch = []
+    LessonPlan.objects.bulk_create(batch)
+    return users[0]
+
+
+def icontains_page(user, query):
+    from django.db.models import Q
+
+    from home.models import LessonPlan
+
+    queryset = LessonPlan.objects.filter(user=user).filter(
+        Q(title__icontains=query) | Q(description__icontains=query) | Q(learning_objectives__icontains=query))
+    queryset = queryset.order_by("-updated_at")
+    return queryset.count(), [lesson.pk for lesson in queryset[:10]]
+
+
+def indexed_page(user, query):
+    from home.models import LessonPlan
+    from home.search import search_lessons
+
+    queryset = search_lessons(LessonPlan.objects.filter(user=user), query).order_by("-search_rank", "-updated_at")
+    return queryset.count(), [lesson.pk for lesson in queryset[:10]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lessons", type=int, default=100000)
+    parser.add_argument("--teachers", type=int, default=1)
+    parser.add_argument("--words", type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        seconds, user = timed(populate, args.lessons, args.teachers, args.words, repeat=1)
+        print(f"database: {connection.vendor}, {args.lessons} lessons inserted and indexed in {seconds:.1f} s")
+        print("old path searches title, description and objectives; the index covers all 16 text fields")
+        print(f"{'query':>24} {'old ms':>8} {'old hits':>9} {'indexed ms':>11} {'indexed hits':>13}")
+        for query in QUERIES:
+            old_seconds, (old_hits, _) = timed(icontains_page, user, query)
+            new_seconds, (new_hits, _) = timed(indexed_page, user, query)
+            print(f"{query:>24} {old_seconds * 1000:>8.1f} {old_hits:>9} {new_seconds * 1000:>11.1f} {new_hits:>13}")
+    finally:
+        connection.creation.destroy_test_db(connection.settings_dict["NAME"], verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Serial vs. process-pool PDF text extraction.
+
+    python benchmarks/bench_pdf_extraction.py [--pages 200 500] [--workers 4]
+"""
+import argparse
+import io
+import os
+
+from common import setup_django, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 500])
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+
+    from home.ai.ai_utils import extract_text_from_pdf, shutdown_pdf_pool
+    from home.tests import _build_pdf
+
+    settings.PDF_EXTRACTION_WORKERS = args.workers
+    settings.PDF_MAX_PAGES = 0
+    print(f"CPUs: {os.cpu_count()}, pool workers: {args.workers}")
+    print(f"{'pages':>6} {'serial s':>10} {'parallel s':>11} {'speedup':>8}")
+    try:
+        # Warm the pool so worker start-up is not charged to the first document.
+        extract_text_from_pdf(io.BytesIO(_build_pdf(["warm-up"] * 16)), parallel=True)
+        for page_count in args.pages:
+            lines = " ".join(f"word{n}" for n in range(120))
+            pdf = _build_pdf([f"Page {n}: {lines}" for n in range(page_count)])
+            serial_s, serial_text = timed(lambda: extract_text_from_pdf(io.BytesIO(pdf), parallel=False))
+            parallel_s, parallel_text = timed(lambda: extract_text_from_pdf(io.BytesIO(pdf), parallel=True))
+            assert serial_text == parallel_text, "parallel output differs from serial output"
+            print(f"{page_count:>6} {serial_s:>10.3f} {parallel_s:>11.3f} {serial_s / parallel_s:>7.2f}x")
+    finally:
+        shutdown_pdf_pool()
+
+
+if __name__ == "__main__":
+    main()
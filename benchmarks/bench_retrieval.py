@@ -0,0 +1,98 @@
+"""
+Top-k chunk retrieval vs. sending the whole curriculum text.
+
+    python benchmarks/bench_retrieval.py [--topics 50 200] [--top-k 8] [--vectors 20000 100000]
+
+Builds a synthetic curriculum where each unit is about one topic, then asks
+one question per topic and reports recall@k (did the unit's chunk come back),
+query latency and prompt size compared with the full text.
+
+``--vectors`` also times exhaustive vs. clustered (IVF) cosine search over
+random unit vectors of the hashing embedder's width, with IVF recall@k.
+Random vectors have no cluster structure, so that recall is a worst case.
+"""
+import argparse
+import random
+from collections import Counter
+
+from common import setup_django, timed
+
+
+def build_curriculum(topic_count, rng):
+    filler = "students practise review discuss explain compare record share observe".split()
+    units = []
+    for topic in range(topic_count):
+        keyword = f"topic{topic}"
+        body = " ".join(rng.choice(filler) for _ in range(150))
+        units.append(f"Unit {topic}: {keyword} {keyword}. {body} Key idea of {keyword}. {body}")
+    return "\n".join(units)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--topics", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--vectors", type=int, nargs="*", default=[])
+    parser.add_argument("--dimensions", type=int, default=512)
+    args = parser.parse_args()
+
+    setup_django()
+    from home.ai.prompting import count_tokens
+    from home.ai.retrieval import BM25Index, chunk_text, select_within_budget, tokenize
+
+    rng = random.Random(0)
+    print(f"{'topics':>7} {'chunks':>7} {'index ms':>9} {'query ms':>9} {'recall@k':>9} "
+          f"{'full tok':>9} {'ctx tok':>8}")
+    for topic_count in args.topics:
+        text = build_curriculum(topic_count, rng)
+        chunks = chunk_text(text)
+        index_s, index = timed(lambda: BM25Index([Counter(tokenize(chunk)) for chunk in chunks]))
+
+        hits = 0
+        context_tokens = []
+        query_seconds = []
+        for topic in range(topic_count):
+            query = f"Plan a lesson on topic{topic} for my class"
+            query_s, ranked = timed(index.top_k, query, args.top_k)
+            query_seconds.append(query_s)
+            selected = select_within_budget([chunks[i] for i, _ in ranked], 3000)
+            hits += any(f"topic{topic}" in chunk for chunk in selected)
+            context_tokens.append(sum(count_tokens(chunk) for chunk in selected))
+
+        print(f"{topic_count:>7} {len(chunks):>7} {index_s * 1000:>9.1f} "
+              f"{sum(query_seconds) / topic_count * 1000:>9.3f} {hits / topic_count:>9.2%} "
+              f"{count_tokens(text):>9} {sum(context_tokens) // topic_count:>8}")
+
+    if args.vectors:
+        bench_vectors(args.vectors, args.dimensions, args.top_k)
+
+
+def bench_vectors(row_counts, dimensions, top_k, queries=50):
+    import numpy as np
+
+    from home.ai.vector_store import VectorIndex
+
+    rng = np.random.default_rng(0)
+    print(f"\n{'rows':>8} {'exact ms':>9} {'ivf build s':>12} {'ivf ms':>7} {'ivf recall':>11}")
+    for rows in row_counts:
+        matrix = rng.normal(size=(rows, dimensions)).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        # Queries near stored rows, as real questions are near their passages.
+        picks = rng.choice(rows, size=queries, replace=False)
+        query_matrix = matrix[picks] + rng.normal(scale=0.02, size=(queries, dimensions)).astype(np.float32)
+        exact = VectorIndex(matrix)
+        build_s, clustered = timed(VectorIndex, matrix, ivf_lists=int(rows ** 0.5), nprobe=8, repeat=1)
+        exact_s = clustered_s = 0.0
+        recall = 0.0
+        for query in query_matrix:
+            seconds, expected = timed(exact.search, query, top_k)
+            exact_s += seconds
+            seconds, found = timed(clustered.search, query, top_k)
+            clustered_s += seconds
+            recall += len({row for row, _ in expected} & {row for row, _ in found}) / top_k
+        print(f"{rows:>8} {exact_s / queries * 1000:>9.2f} {build_s:>12.2f} "
+              f"{clustered_s / queries * 1000:>7.2f} {recall / queries:>11.2%}")
+
+
+if __name__ == "__main__":
+    main()
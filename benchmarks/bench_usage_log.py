@@ -0,0 +1,73 @@
+"""
+AIUsageLog write throughput, one INSERT per record vs. buffered bulk_create.
+
+    python benchmarks/bench_usage_log.py [--records 2000] [--threads 1 8] [--buffer-size 50]
+
+Runs against a throwaway test database of the configured engine: SQLite by
+default, PostgreSQL with DB_ENGINE=postgresql DB_NAME=... DB_USERNAME=... set.
+``--threads`` writers log concurrently, as request threads do under load.
+"""
+import argparse
+import threading
+import time
+
+from common import setup_django
+
+
+def run(records, threads):
+    """Return records written per second by *threads* concurrent writers."""
+    from django.db import connections
+
+    from home.ai import usage_log
+
+    def writer(count):
+        for _ in range(count):
+            usage_log.log_usage(request_type="general_chat", prompt_length=120, response_length=800,
+                                latency_ms=900, success=True)
+        connections.close_all()
+
+    workers = [threading.Thread(target=writer, args=(records // threads,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    usage_log.flush()
+    return records // threads * threads / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--buffer-size", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    from home.models import AIUsageLog
+
+    setup_test_environment()
+    # A file database, so writer threads contend for the same write lock as worker processes do.
+    if connection.vendor == "sqlite":
+        connection.settings_dict["TEST"]["NAME"] = "bench_usage_log.sqlite3"
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        print(f"database: {connection.vendor}")
+        print(f"{'threads':>8} {'direct rec/s':>13} {'buffered rec/s':>15}")
+        for threads in args.threads:
+            settings.AI_USAGE_LOG_BUFFER_SIZE = 0
+            direct = run(args.records, threads)
+            settings.AI_USAGE_LOG_BUFFER_SIZE = args.buffer_size
+            buffered = run(args.records, threads)
+            print(f"{threads:>8} {direct:>13.0f} {buffered:>15.0f}")
+        print(f"rows written: {AIUsageLog.objects.count()}")
+    finally:
+        connection.creation.destroy_test_db(connection.settings_dict["NAME"], verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""Shared helpers for the scripts in this directory (run them from the repo root)."""
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    """Make the project importable and configure Django settings."""
+    if str(PROJECT_ROOT) not in sys.path:
+        sys.path.insert(0, str(PROJECT_ROOT))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+    import django  # noqa: PLC0415
+
+    django.setup()
+
+
+def timed(func, *args, repeat=3, **kwargs):
+    """Run *func* *repeat* times; return (median seconds, last result)."""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), result
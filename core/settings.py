@@ -43,6 +43,121 @@ if not NVIDIA_API_KEY:
 BASE_URL = os.getenv("BASE_URL", "https://integrate.api.nvidia.com/v1")
 NVIDIA_MODEL = os.getenv("NVIDIA_MODEL", "meta/llama-3.1-8b-instruct")
 
+# Pooled HTTP connections to the AI endpoint (one client per process, see home/ai/clients.py)
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", 20))
+AI_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_KEEPALIVE_CONNECTIONS", 10))
+AI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY", 60))  # seconds an idle connection is kept
+AI_CONNECT_TIMEOUT = float(os.getenv("AI_CONNECT_TIMEOUT", 5))
+AI_REQUEST_TIMEOUT = float(os.getenv("AI_REQUEST_TIMEOUT", 30))
+
+# Cache of AI responses for identical prompts (see home/ai/response_cache.py).
+# Temperature-0 requests are always cacheable; sampled request types listed in
+# AI_RESPONSE_CACHE_EXCLUDE_TYPES always go to the model. By default these are
+# the sampled (temperature 0.7) chat and lesson-assist answers, so asking again
+# gives a fresh answer; set it to "" to cache them too.
+AI_RESPONSE_CACHE_ALIAS = "ai_responses"
+AI_RESPONSE_CACHE_TTL = int(os.getenv("AI_RESPONSE_CACHE_TTL", 3600))  # seconds, 0 = caching off
+AI_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("AI_RESPONSE_CACHE_MAX_ENTRIES", 1000))
+AI_RESPONSE_CACHE_EXCLUDE_TYPES = [
+    name.strip() for name in os.getenv("AI_RESPONSE_CACHE_EXCLUDE_TYPES", "general_chat,lesson_assist").split(",") if name.strip()
+]
+
+# Concurrent identical AI requests share one upstream call (see home/ai/single_flight.py).
+# AI_SINGLE_FLIGHT_SHARED extends this across processes through the AI response
+# cache, which must then use a shared backend (database, Redis, memcached).
+AI_SINGLE_FLIGHT_SHARED = str2bool(os.getenv("AI_SINGLE_FLIGHT_SHARED", "False"))
+AI_SINGLE_FLIGHT_WAIT = float(os.getenv("AI_SINGLE_FLIGHT_WAIT", 65))  # seconds before a follower gives up
+
+# Limits on upstream AI calls (see home/ai/limits.py), kept in AI_LIMITS_CACHE_ALIAS.
+# That cache must be shared by all worker processes, or each applies its own limits:
+# by default a database table (created by migrations), or AI_LIMITS_CACHE_BACKEND /
+# AI_LIMITS_CACHE_LOCATION for e.g. Redis.
+AI_LIMITS_CACHE_ALIAS = "ai_limits"
+AI_MAX_CONCURRENT_REQUESTS = int(os.getenv("AI_MAX_CONCURRENT_REQUESTS", 8))    # 0 = no cap
+AI_QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT", 10))                      # seconds to wait for a slot
+AI_USER_REQUESTS_PER_MINUTE = int(os.getenv("AI_USER_REQUESTS_PER_MINUTE", 20))  # 0 = unlimited
+AI_USER_TOKENS_PER_HOUR = int(os.getenv("AI_USER_TOKENS_PER_HOUR", 200000))      # 0 = unlimited
+
+# Upstream failure handling (see home/ai/resilience.py). Transient failures are
+# retried with jittered exponential backoff within the deadline of the request
+# type; after AI_BREAKER_FAILURE_THRESHOLD consecutive failures calls fail fast
+# for AI_BREAKER_RESET_TIMEOUT seconds. Breaker state lives in AI_LIMITS_CACHE_ALIAS.
+AI_MAX_ATTEMPTS = int(os.getenv("AI_MAX_ATTEMPTS", 3))
+AI_RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", 0.5))  # seconds
+AI_RETRY_MAX_DELAY = float(os.getenv("AI_RETRY_MAX_DELAY", 4))
+AI_REQUEST_DEADLINE_DEFAULT = float(os.getenv("AI_REQUEST_DEADLINE_DEFAULT", 45))
+AI_REQUEST_DEADLINES = {
+    "general_chat": float(os.getenv("AI_DEADLINE_GENERAL_CHAT", 30)),
+    "lesson_assist": float(os.getenv("AI_DEADLINE_LESSON_ASSIST", 45)),
+    "lesson_review": float(os.getenv("AI_DEADLINE_LESSON_REVIEW", 60)),
+}
+AI_BREAKER_FAILURE_THRESHOLD = int(os.getenv("AI_BREAKER_FAILURE_THRESHOLD", 5))  # 0 = breaker off
+AI_BREAKER_RESET_TIMEOUT = float(os.getenv("AI_BREAKER_RESET_TIMEOUT", 30))
+
+# Curriculum PDF extraction: documents with at least PDF_PARALLEL_MIN_PAGES pages
+# are split across a pool of PDF_EXTRACTION_WORKERS processes.
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 64))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", 1000))              # 0 = no page cap
+PDF_EXTRACTION_TIMEOUT = int(os.getenv("PDF_EXTRACTION_TIMEOUT", 120))  # seconds, 0 = no limit
+
+# OCR of images and scanned PDF pages (requires the tesseract binary)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", 2))
+OCR_MAX_DIMENSION = int(os.getenv("OCR_MAX_DIMENSION", 2000))  # pixels, longest side after downscaling
+
+# Curriculum text is extracted by the background worker (run_worker); until then
+# AI requests skip the file with a "still processing" warning. True extracts it
+# inside the request instead (e.g. for setups without a worker).
+CURRICULUM_INLINE_EXTRACTION = str2bool(os.getenv("CURRICULUM_INLINE_EXTRACTION", "False"))
+
+# Curriculum retrieval: text is split into overlapping chunks and only the
+# top-k chunks relevant to the request (within the token budget) are sent.
+CURRICULUM_CHUNK_WORDS = int(os.getenv("CURRICULUM_CHUNK_WORDS", 180))
+CURRICULUM_CHUNK_OVERLAP = int(os.getenv("CURRICULUM_CHUNK_OVERLAP", 30))
+CURRICULUM_CONTEXT_TOP_K = int(os.getenv("CURRICULUM_CONTEXT_TOP_K", 8))
+CURRICULUM_CONTEXT_TOKEN_BUDGET = int(os.getenv("CURRICULUM_CONTEXT_TOKEN_BUDGET", 3000))
+
+# Prompt assembly (see home/ai/prompting.py): prompts are fitted into
+# AI_MODEL_CONTEXT_TOKENS minus the completion's max_tokens and a safety margin.
+# AI_TOKENIZER is "" (estimate), "tiktoken:<encoding>" or a dotted path to a
+# callable returning the token count of a string.
+AI_TOKENIZER = os.getenv("AI_TOKENIZER", "")
+AI_MODEL_CONTEXT_TOKENS = int(os.getenv("AI_MODEL_CONTEXT_TOKENS", 8192))
+AI_PROMPT_SAFETY_TOKENS = int(os.getenv("AI_PROMPT_SAFETY_TOKENS", 64))
+# Request token usage in the last chunk of streamed completions.
+AI_STREAM_INCLUDE_USAGE = str2bool(os.getenv("AI_STREAM_INCLUDE_USAGE", "True"))
+
+# AIUsageLog writes (see home/ai/usage_log.py): 0 writes each record at once;
+# otherwise records are buffered and saved in batches of this size, or after
+# AI_USAGE_LOG_FLUSH_INTERVAL seconds.
+AI_USAGE_LOG_BUFFER_SIZE = int(os.getenv("AI_USAGE_LOG_BUFFER_SIZE", 0))
+AI_USAGE_LOG_FLUSH_INTERVAL = float(os.getenv("AI_USAGE_LOG_FLUSH_INTERVAL", 5))
+# `manage.py archive_ai_usage` moves usage logs older than this many days
+# (and already rolled up) into compressed files under AI_USAGE_ARCHIVE_DIR.
+AI_USAGE_RETENTION_DAYS = int(os.getenv("AI_USAGE_RETENTION_DAYS", 90))
+AI_USAGE_ARCHIVE_DIR = os.getenv("AI_USAGE_ARCHIVE_DIR", os.path.join(BASE_DIR, "archive", "ai_usage"))
+# Lesson reviews run at once by `manage.py review_lessons` (still capped by AI_MAX_CONCURRENT_REQUESTS).
+AI_REVIEW_BATCH_CONCURRENCY = int(os.getenv("AI_REVIEW_BATCH_CONCURRENCY", 4))
+# Seconds after a lesson save before its AI review is regenerated (saves in between share the job).
+AI_LESSON_REVIEW_DELAY = int(os.getenv("AI_LESSON_REVIEW_DELAY", 60))
+# Token budget for the earlier turns sent with each message of an AI conversation; turns
+# that no longer fit are folded into a summary of at most AI_CONVERSATION_SUMMARY_TOKENS.
+AI_CONVERSATION_TOKEN_BUDGET = int(os.getenv("AI_CONVERSATION_TOKEN_BUDGET", 2048))
+# Off: send the whole history with every message (prompts grow with the conversation).
+AI_CONVERSATION_COMPACTION = str2bool(os.getenv("AI_CONVERSATION_COMPACTION", "True"))
+AI_CONVERSATION_SUMMARY_TOKENS = int(os.getenv("AI_CONVERSATION_SUMMARY_TOKENS", 256))
+
+# Optional semantic search over curriculum chunks: "" (off), "hashing" (local,
+# deterministic) or "openai" (embedding endpoint at BASE_URL). Chunk vectors are
+# stored as .npy matrices in CURRICULUM_VECTOR_DIR; libraries with at least
+# CURRICULUM_VECTOR_IVF_MIN_ROWS chunks are searched through a clustered index.
+CURRICULUM_EMBEDDING_BACKEND = os.getenv("CURRICULUM_EMBEDDING_BACKEND", "")
+CURRICULUM_EMBEDDING_MODEL = os.getenv("CURRICULUM_EMBEDDING_MODEL", "nvidia/nv-embedqa-e5-v5")
+CURRICULUM_EMBEDDING_DIMENSIONS = int(os.getenv("CURRICULUM_EMBEDDING_DIMENSIONS", 512))  # hashing backend
+CURRICULUM_VECTOR_DIR = os.getenv("CURRICULUM_VECTOR_DIR", os.path.join(BASE_DIR, "vector_index"))
+CURRICULUM_VECTOR_IVF_MIN_ROWS = int(os.getenv("CURRICULUM_VECTOR_IVF_MIN_ROWS", 20000))  # 0 = always exhaustive
+CURRICULUM_VECTOR_IVF_NPROBE = int(os.getenv("CURRICULUM_VECTOR_IVF_NPROBE", 8))
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.1/howto/deployment/checklist/
 
@@ -77,7 +192,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "home.middleware.AsyncWhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -133,10 +248,37 @@ else:
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
-            "NAME": "db.sqlite3",
+            "NAME": os.getenv("SQLITE_PATH", "db.sqlite3"),  # shared by the web and worker containers
         }
     }
 
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    },
+    # Local memory evicts least recently used entries beyond MAX_ENTRIES. Use a
+    # shared backend (e.g. django.core.cache.backends.db.DatabaseCache after
+    # `manage.py createcachetable`) to share entries between worker processes.
+    AI_RESPONSE_CACHE_ALIAS: {
+        "BACKEND": os.getenv("AI_RESPONSE_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("AI_RESPONSE_CACHE_LOCATION", "ai-responses"),
+        "TIMEOUT": AI_RESPONSE_CACHE_TTL,
+        "OPTIONS": {"MAX_ENTRIES": AI_RESPONSE_CACHE_MAX_ENTRIES},
+    },
+    # Upstream slots, per-user budgets and circuit breaker state (see AI_LIMITS_CACHE_ALIAS).
+    AI_LIMITS_CACHE_ALIAS: {
+        "BACKEND": os.getenv("AI_LIMITS_CACHE_BACKEND", "django.core.cache.backends.db.DatabaseCache"),
+        "LOCATION": os.getenv("AI_LIMITS_CACHE_LOCATION", "home_ai_limits_cache"),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# Seconds the home dashboard's counts and lesson lists are cached per user (0 = off).
+# Saves and deletes clear a user's entry, but with the default local-memory cache only
+# in the process that handled them; other worker processes catch up after the TTL.
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", 60))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -1,30 +1,33 @@
-#!/usr/bin/env python3
-
-# Copyright (c) 2023 Your Name
-#
-# This file is part of my_project.
-#
-# my_project is free software: you can redistribute it and/or modify
-# it under the terms of the GNU General Public License as published by
-# the Free Software Foundation, either version 3 of the License, or
-# (at your option) any later version.
-#
-# my_project is distributed in the hope that it will be useful,
-# but WITHOUT ANY WARRANTY; without even the implied warranty of
-# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
-# GNU General Public License for more details.
-#
-# You should have received a copy of the GNU General Public License
-# along with my_project. If not, see <https://www.gnu.org/licenses/>.
-
-"""Module documentation goes here."""
-
-import my_module
-
-def main():
-    """The main function."""
-    # Do something interesting here
-    pass
-
-if __name__ == "__main__":
-    main()
+"""
+Gunicorn settings for the Docker image (see Dockerfile).
+
+The app is served over ASGI (core.asgi) by uvicorn workers, so async AI views
+wait on the model without tying up a worker. Set GUNICORN_WORKER_CLASS=sync
+and serve core.wsgi to go back to WSGI.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "uvicorn_worker.UvicornWorker")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 90))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+accesslog = "-"
+loglevel = os.getenv("GUNICORN_LOGLEVEL", "info")
+
+
+def post_fork(server, worker):
+    # Pooled AI clients inherited from the master (with preload_app) share its
+    # sockets; each worker must open its own connections.
+    from home.ai.clients import reset_clients
+
+    reset_clients(close=False)
+
+
+def worker_exit(server, worker):
+    from home.ai import usage_log
+    from home.ai.clients import reset_clients
+
+    usage_log.flush()
+    reset_clients(close=True)
@@ -1,7 +1,8 @@
 # Import the necessary modules
 from django.contrib import admin
-from .models import (Curriculum, Resource, Material,
-                    LessonPlan, Subject, Grade, Standard, LessonSchedule, AIUsageLog)
+from .models import (BackgroundJob, Curriculum, CurriculumText, Resource, Material,
+                    LessonPlan, Subject, Grade, Standard, LessonSchedule, AIUsageLog,
+                    AIUsageRollup)
 
 
 # Admin for new comprehensive models
@@ -76,9 +77,18 @@ class ResourceAdmin(admin.ModelAdmin):
 
 @admin.register(Curriculum)
 class CurriculumAdmin(admin.ModelAdmin):
-    list_display = ('title', 'subject', 'grade', 'user', 'created_at')
-    list_filter = ('subject', 'grade', 'created_at')
+    list_display = ('title', 'subject', 'grade', 'user', 'extraction_status', 'created_at')
+    list_filter = ('subject', 'grade', 'extraction_status', 'created_at')
     search_fields = ('title', 'description')
+    readonly_fields = ('content_hash', 'extraction_status', 'extraction_progress', 'extraction_error')
+
+
+@admin.register(CurriculumText)
+class CurriculumTextAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'extractor_version', 'error', 'created_at')
+    list_filter = ('extractor_version',)
+    search_fields = ('content_hash',)
+    readonly_fields = ('created_at',)
 
 
 @admin.register(LessonSchedule)
@@ -93,9 +103,28 @@ class LessonScheduleAdmin(admin.ModelAdmin):
 
 @admin.register(AIUsageLog)
 class AIUsageLogAdmin(admin.ModelAdmin):
-    list_display = ('created_at', 'user', 'request_type', 'success', 'latency_ms',
-                    'prompt_length', 'used_curriculum_context', 'failure_reason')
-    list_filter = ('success', 'request_type', 'used_curriculum_context', 'created_at')
+    list_display = ('created_at', 'user', 'request_type', 'success', 'latency_ms', 'time_to_first_token_ms',
+                    'queue_wait_ms', 'connect_ms', 'cache_hit', 'coalesced', 'prompt_tokens', 'completion_tokens',
+                    'used_curriculum_context', 'failure_reason')
+    list_filter = ('success', 'request_type', 'used_curriculum_context', 'cache_hit', 'coalesced',
+                   'created_at')
     search_fields = ('user__username', 'failure_reason')
     readonly_fields = ('created_at',)
     ordering = ('-created_at',)
+
+
+@admin.register(AIUsageRollup)
+class AIUsageRollupAdmin(admin.ModelAdmin):
+    list_display = ('period_start', 'period', 'request_type', 'user', 'request_count', 'success_count',
+                    'latency_p50_ms', 'latency_p95_ms', 'latency_p99_ms')
+    list_filter = ('period', 'request_type')
+    search_fields = ('user__username',)
+    ordering = ('-period_start',)
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'status', 'attempts', 'run_after', 'locked_by', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('kind', 'last_error')
+    readonly_fields = ('created_at', 'finished_at', 'locked_at', 'locked_by')
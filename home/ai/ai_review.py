@@ -1,10 +1,34 @@
 # File: ai_review.py
 
+import asyncio
 import time
 import re
-from openai import OpenAI, APITimeoutError, APIConnectionError, APIStatusError
+from dataclasses import dataclass
+from openai import APITimeoutError, APIConnectionError, APIStatusError
 from django.conf import settings
 
+from . import single_flight, usage_log
+from .clients import ConnectTimer, get_async_openai_client, get_openai_client
+from .limits import (
+    QueueTimeout,
+    RateLimitExceeded,
+    UpstreamSlot,
+    acharge_tokens,
+    acheck_user_budget,
+    charge_tokens,
+    check_user_budget,
+)
+from .prompting import count_tokens
+from .resilience import CircuitBreaker, RetryBudget, is_transient
+from .response_cache import (
+    aget_cached_response,
+    aset_cached_response,
+    get_cached_response,
+    is_cacheable,
+    response_cache_key,
+    set_cached_response,
+)
+
 
 # Phrases that indicate inappropriate or out-of-scope prompts
 _BLOCKED_PATTERNS = re.compile(
@@ -16,6 +40,10 @@ _BLOCKED_PATTERNS = re.compile(
 # Minimum useful prompt length (characters)
 _MIN_PROMPT_LENGTH = 5
 
+# Completion parameters (part of the response cache key)
+MAX_TOKENS = 2048
+DEFAULT_TEMPERATURE = 0.7
+
 
 def _validate_prompt(prompt: str) -> str | None:
     """Return an error string if the prompt is invalid/inappropriate, else None."""
@@ -30,101 +58,575 @@ def _validate_prompt(prompt: str) -> str | None:
     return None
 
 
-def review_lesson(lesson: object) -> str:
-    """Return a brief AI-generated review for the given lesson plan."""
-    prompt = (
+def review_prompt(lesson: object) -> str:
+    """The prompt ``review_lesson`` sends for *lesson*; it covers every field the review depends on."""
+    return (
         f"Please review this lesson plan titled '{lesson.title}'. "
         f"Subject: {lesson.subject}. Grade: {lesson.grade}. "
         f"Learning objectives: {lesson.learning_objectives[:300]}. "
         "Provide constructive feedback in 3-5 bullet points."
     )
-    return generate_ai_response(prompt, request_type='lesson_review')
+
+
+def review_rejection(lesson: object) -> str | None:
+    """Why the review prompt of *lesson* would be refused before reaching the model, else None."""
+    return _validate_prompt(review_prompt(lesson))
+
+
+def review_lesson(lesson: object, user=None) -> str:
+    """Return a brief AI-generated review for the given lesson plan."""
+    # Temperature 0 makes the review deterministic, so unchanged lessons are served from the cache.
+    return generate_ai_response(review_prompt(lesson), request_type='lesson_review', user=user, temperature=0)
+
+
+async def areview_lesson(lesson: object, user=None) -> tuple[str, bool]:
+    """Async ``review_lesson`` returning ``(text, success)``."""
+    return await agenerate_ai_result(review_prompt(lesson), request_type='lesson_review', user=user,
+                                     temperature=0)
+
+
+_MISSING_KEY_MESSAGE = "Error: NVIDIA_API_KEY not configured. Please set it in your .env file."
+
+
+def _ai_settings():
+    """Return ``(api_key, base_url, model)`` from settings."""
+    return (
+        getattr(settings, "NVIDIA_API_KEY", None),
+        getattr(settings, "BASE_URL", "https://integrate.api.nvidia.com/v1"),
+        review_model(),
+    )
+
+
+def review_model() -> str:
+    """Name of the model that answers AI requests, including lesson reviews."""
+    return getattr(settings, "NVIDIA_MODEL", "meta/llama-3.1-8b-instruct")
+
+
+def _log_usage(**fields):
+    """Record an AIUsageLog row (possibly buffered); best-effort – never crash if the log write fails."""
+    usage_log.log_usage(**fields)
+
+
+async def _alog_usage(**fields):
+    """Async-safe ``_log_usage`` for async views."""
+    await usage_log.alog_usage(**fields)
+
+
+_INTERRUPTED_MESSAGE = "The response was interrupted. Please try again."
+
+
+def _chat_messages(prompt, history):
+    """Chat completion messages: the earlier turns in *history*, then *prompt* from the user."""
+    return [*(history or ()), {"role": "user", "content": prompt}]
+
+
+def _messages_text(messages):
+    """All message text, for prompt sizes and token estimates."""
+    return "\n".join(message["content"] for message in messages)
+
+
+def _usage_tokens(usage, name, text):
+    """Token count reported in the API ``usage`` field, or an estimate for *text*."""
+    value = getattr(usage, name, None)
+    return value if isinstance(value, int) else count_tokens(text)
+
+
+def _failure_message(last_error: str) -> str:
+    if last_error == "rate_limited":
+        return (
+            "You have reached the limit for AI requests for now. "
+            "Please wait a little before asking again; you can keep editing your lesson meanwhile."
+        )
+    if last_error == "queue_timeout":
+        return (
+            "The AI assistant is busy helping other teachers right now. "
+            "Please try again in a moment."
+        )
+    if last_error == "timeout":
+        return (
+            "The AI service is taking too long to respond right now. "
+            "Please try again in a moment, or continue editing your lesson manually."
+        )
+    return (
+        "The AI assistant is temporarily unavailable. "
+        "Please try again shortly. You can continue editing your lesson in the meantime."
+    )
+
+
+def _error_reason(exc: Exception) -> str:
+    if isinstance(exc, APITimeoutError):
+        return "timeout"
+    if isinstance(exc, APIConnectionError):
+        return "connection_error"
+    if isinstance(exc, APIStatusError):
+        return f"api_status_{exc.status_code}"
+    return type(exc).__name__
+
+
+
+
+@dataclass
+class _Request:
+    """A validated AI request: what its sync, async and streaming paths share."""
+    user: object
+    request_type: str
+    used_curriculum_context: bool
+    temperature: float
+    api_key: str
+    base_url: str
+    model: str
+    messages: list
+    prompt_text: str
+    key: str
+    cacheable: bool
+    start_ms: int
+
+    def elapsed_ms(self) -> int:
+        return int(time.monotonic() * 1000) - self.start_ms
+
+    def log_fields(self, response_length: int = 0, **fields) -> dict:
+        """AIUsageLog fields of this request, with the latency up to now."""
+        return dict(
+            user=self.user,
+            request_type=self.request_type,
+            prompt_length=len(self.prompt_text),
+            used_curriculum_context=self.used_curriculum_context,
+            response_length=response_length,
+            latency_ms=self.elapsed_ms(),
+            **fields,
+        )
+
+
+def _prepare_request(prompt, request_type, user, used_curriculum_context, temperature, use_cache, history):
+    """Return ``(request, None)``, or ``(None, message)`` when *prompt* cannot be sent."""
+    validation_error = _validate_prompt(prompt)
+    if validation_error:
+        return None, validation_error
+
+    api_key, base_url, model = _ai_settings()
+    if not api_key:
+        return None, _MISSING_KEY_MESSAGE
+
+    messages = _chat_messages(prompt, history)
+    return _Request(
+        user=user,
+        request_type=request_type,
+        used_curriculum_context=used_curriculum_context,
+        temperature=temperature,
+        api_key=api_key,
+        base_url=base_url,
+        model=model,
+        messages=messages,
+        prompt_text=_messages_text(messages),
+        key=response_cache_key(model, prompt, temperature, MAX_TOKENS, history),
+        cacheable=is_cacheable(request_type, temperature, use_cache),
+        start_ms=int(time.monotonic() * 1000),
+    ), None
+
+
+def _reused_response_fields(request, response_text="", success=True, **fields):
+    """AIUsageLog fields for a request answered without its own upstream call."""
+    return request.log_fields(len(response_text) if success else 0, success=success, **fields)
+
+
+def _upstream_log_fields(request, response_text, usage, last_error, slot, connect_timer, **fields):
+    """AIUsageLog fields for a request that called upstream itself; an empty answer counts as a failure."""
+    failure_reason = last_error or ("" if response_text else "empty_response")
+    return request.log_fields(
+        len(response_text),
+        prompt_tokens=_usage_tokens(usage, "prompt_tokens", request.prompt_text) if response_text else None,
+        completion_tokens=_usage_tokens(usage, "completion_tokens", response_text) if response_text else None,
+        queue_wait_ms=slot.queue_wait_ms,
+        connect_ms=connect_timer.connect_ms,
+        success=not failure_reason,
+        failure_reason=failure_reason,
+        **fields,
+    )
+
+
+def _gate(request):
+    """
+    Answer *request* from the response cache, or refuse it over the user's budget.
+
+    Returns ``(text, success)`` for a request that is settled that way (and
+    logged), or ``None`` when it has to be sent upstream.
+    """
+    if request.cacheable:
+        cached = get_cached_response(request.key)
+        if cached is not None:
+            _log_usage(**_reused_response_fields(request, cached, cache_hit=True))
+            return cached, True
+    try:
+        check_user_budget(request.user, count_tokens(request.prompt_text))
+    except RateLimitExceeded:
+        _log_usage(**_reused_response_fields(request, success=False, failure_reason="rate_limited"))
+        return _failure_message("rate_limited"), False
+    return None
+
+
+async def _agate(request):
+    """Async ``_gate``."""
+    if request.cacheable:
+        cached = await aget_cached_response(request.key)
+        if cached is not None:
+            await _alog_usage(**_reused_response_fields(request, cached, cache_hit=True))
+            return cached, True
+    try:
+        await acheck_user_budget(request.user, count_tokens(request.prompt_text))
+    except RateLimitExceeded:
+        await _alog_usage(**_reused_response_fields(request, success=False, failure_reason="rate_limited"))
+        return _failure_message("rate_limited"), False
+    return None
+
+
+def _record_success(request, response_text, log_fields):
+    """Log a successful upstream call, charge its tokens to the user and cache the answer."""
+    _log_usage(**log_fields)
+    charge_tokens(request.user, log_fields["completion_tokens"])
+    if request.cacheable:
+        set_cached_response(request.key, response_text)
+    return response_text, True
+
+
+async def _arecord_success(request, response_text, log_fields):
+    """Async ``_record_success``."""
+    await _alog_usage(**log_fields)
+    await acharge_tokens(request.user, log_fields["completion_tokens"])
+    if request.cacheable:
+        await aset_cached_response(request.key, response_text)
+    return response_text, True
+
+
+def _record_failure(log_fields):
+    """Log a failed upstream call and return ``(message for the user, False)``."""
+    _log_usage(**log_fields)
+    return _failure_message(log_fields["failure_reason"]), False
+
+
+async def _arecord_failure(log_fields):
+    """Async ``_record_failure``."""
+    await _alog_usage(**log_fields)
+    return _failure_message(log_fields["failure_reason"]), False
+
+
+def _record_breaker(breaker, exc):
+    """Count a failed attempt against the circuit *breaker*."""
+    # Anything but a transient failure shows the upstream is reachable.
+    if is_transient(exc):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+async def _arecord_breaker(breaker, exc):
+    """Async ``_record_breaker``."""
+    if is_transient(exc):
+        await breaker.arecord_failure()
+    else:
+        await breaker.arecord_success()
 
 
 def generate_ai_response(prompt: str, request_type: str = 'general_chat',
-                          user=None, used_curriculum_context: bool = False) -> str:
+                          user=None, used_curriculum_context: bool = False,
+                          temperature: float = DEFAULT_TEMPERATURE,
+                          use_cache: bool | None = None, history: list | None = None) -> str:
     """
     Send *prompt* to the NVIDIA NIM API and return the generated text.
 
     - Validates prompt quality/safety before sending.
-    - Applies a request timeout and single retry on transient failures.
+    - Sends *history* (earlier ``{"role", "content"}`` messages) ahead of *prompt*.
+    - Answers identical cacheable requests from the response cache
+      (*use_cache* forces or skips the cache for this call).
+    - Shares one upstream call between concurrent identical requests.
+    - Retries transient failures with jittered backoff within the deadline of
+      *request_type*, and fails fast while the upstream circuit is open.
     - Logs every request to AIUsageLog (best-effort, non-blocking).
     """
-    # Lazy import to avoid circular dependency at module level
-    from home.models import AIUsageLog  # noqa: PLC0415
+    request, error = _prepare_request(prompt, request_type, user, used_curriculum_context, temperature,
+                                      use_cache, history)
+    if error:
+        return error
+    settled = _gate(request)
+    if settled is not None:
+        return settled[0]
 
-    validation_error = _validate_prompt(prompt)
-    if validation_error:
-        return validation_error
+    def call_upstream():
+        client = get_openai_client(base_url=request.base_url, api_key=request.api_key)
+        breaker = CircuitBreaker(request.base_url)
+        budget = RetryBudget(request_type)
+        slot = UpstreamSlot(request_type)
+        last_error = ""
+        response_text = ""
+        usage = None
 
-    api_key = getattr(settings, "NVIDIA_API_KEY", None)
-    if not api_key:
-        return "Error: NVIDIA_API_KEY not configured. Please set it in your .env file."
-    base_url = getattr(settings, "BASE_URL", "https://integrate.api.nvidia.com/v1")
-    model = getattr(settings, "NVIDIA_MODEL", "meta/llama-3.1-8b-instruct")
+        with ConnectTimer() as connect_timer:
+            while True:
+                if not breaker.allow():
+                    last_error = last_error or "circuit_open"
+                    break
+                try:
+                    with slot:
+                        response = client.chat.completions.create(
+                            model=request.model,
+                            messages=request.messages,
+                            max_tokens=MAX_TOKENS,
+                            temperature=temperature,
+                            timeout=budget.attempt_timeout(),
+                        )
+                    response_text = response.choices[0].message.content or ""
+                    usage = response.usage
+                    last_error = ""
+                    breaker.record_success()
+                    break
+                except QueueTimeout:
+                    last_error = "queue_timeout"
+                    break
+                except Exception as exc:  # noqa: BLE001
+                    last_error = _error_reason(exc)
+                    _record_breaker(breaker, exc)
+                    delay = budget.next_delay(exc)
+                    if delay is None:
+                        break
+                    time.sleep(delay)
 
-    client = OpenAI(
-        base_url=base_url,
-        api_key=api_key,
-    )
+        log_fields = _upstream_log_fields(request, response_text, usage, last_error, slot, connect_timer)
+        if log_fields["success"]:
+            return _record_success(request, response_text, log_fields)
+        return _record_failure(log_fields)
 
-    start_ms = int(time.monotonic() * 1000)
+    (response_text, success), coalesced = single_flight.run(request.key, call_upstream)
+    if coalesced:
+        _log_usage(**_reused_response_fields(request, response_text, success, coalesced=True))
+    return response_text
+
+
+async def agenerate_ai_response(prompt: str, request_type: str = 'general_chat',
+                                user=None, used_curriculum_context: bool = False,
+                                temperature: float = DEFAULT_TEMPERATURE,
+                                use_cache: bool | None = None, history: list | None = None) -> str:
+    """
+    Async ``generate_ai_response`` using ``AsyncOpenAI``, for async views.
+
+    Waiting on the model does not hold a worker thread, so slow completions
+    cannot starve ordinary page views.
+    """
+    response_text, _ = await agenerate_ai_result(prompt, request_type, user, used_curriculum_context,
+                                                 temperature, use_cache, history)
+    return response_text
+
+
+async def agenerate_ai_result(prompt: str, request_type: str = 'general_chat',
+                              user=None, used_curriculum_context: bool = False,
+                              temperature: float = DEFAULT_TEMPERATURE,
+                              use_cache: bool | None = None, history: list | None = None) -> tuple[str, bool]:
+    """``agenerate_ai_response`` returning ``(text, success)``; on failure *text* is the message for the user."""
+    request, error = _prepare_request(prompt, request_type, user, used_curriculum_context, temperature,
+                                      use_cache, history)
+    if error:
+        return error, False
+    settled = await _agate(request)
+    if settled is not None:
+        return settled
+
+    async def call_upstream():
+        client = get_async_openai_client(base_url=request.base_url, api_key=request.api_key)
+        breaker = CircuitBreaker(request.base_url)
+        budget = RetryBudget(request_type)
+        slot = UpstreamSlot(request_type)
+        last_error = ""
+        response_text = ""
+        usage = None
+
+        with ConnectTimer() as connect_timer:
+            while True:
+                if not await breaker.aallow():
+                    last_error = last_error or "circuit_open"
+                    break
+                try:
+                    async with slot:
+                        response = await client.chat.completions.create(
+                            model=request.model,
+                            messages=request.messages,
+                            max_tokens=MAX_TOKENS,
+                            temperature=temperature,
+                            timeout=budget.attempt_timeout(),
+                        )
+                    response_text = response.choices[0].message.content or ""
+                    usage = response.usage
+                    last_error = ""
+                    await breaker.arecord_success()
+                    break
+                except QueueTimeout:
+                    last_error = "queue_timeout"
+                    break
+                except Exception as exc:  # noqa: BLE001
+                    last_error = _error_reason(exc)
+                    await _arecord_breaker(breaker, exc)
+                    delay = budget.next_delay(exc)
+                    if delay is None:
+                        break
+                    await asyncio.sleep(delay)
+
+        log_fields = _upstream_log_fields(request, response_text, usage, last_error, slot, connect_timer)
+        if log_fields["success"]:
+            return await _arecord_success(request, response_text, log_fields)
+        return await _arecord_failure(log_fields)
+
+    (response_text, success), coalesced = await single_flight.arun(request.key, call_upstream)
+    if coalesced:
+        await _alog_usage(**_reused_response_fields(request, response_text, success, coalesced=True))
+    return response_text, success
+
+
+def stream_ai_response(prompt: str, request_type: str = 'general_chat',
+                       user=None, used_curriculum_context: bool = False,
+                       temperature: float = DEFAULT_TEMPERATURE,
+                       use_cache: bool | None = None, history: list | None = None):
+    """
+    Stream the completion for *prompt*, yielding ``(event, text)`` pairs.
+
+    ``event`` is ``"token"`` for generated text or ``"error"`` for a user-facing
+    message (validation failures, unavailable service, interrupted stream).
+    A cached response is sent as a single token, and concurrent identical
+    requests relay the tokens of one upstream stream. Transient failures are
+    retried as in ``generate_ai_response`` while no token has been sent yet. The AIUsageLog row, including
+    time to first token, is written when the stream ends.
+    """
+    request, error = _prepare_request(prompt, request_type, user, used_curriculum_context, temperature,
+                                      use_cache, history)
+    if error:
+        yield "error", error
+        return
+    settled = _gate(request)
+    if settled is not None:
+        text, success = settled
+        yield ("token" if success else "error"), text
+        return
+
+    with single_flight.join(request.key) as (flight, leader):
+        if leader:
+            yield from _stream_upstream(request, flight)
+        else:
+            yield from _follow_stream(request, flight)
+
+
+def _stream_options():
+    """Ask for token usage in the final stream chunk, unless the endpoint does not support it."""
+    if getattr(settings, "AI_STREAM_INCLUDE_USAGE", True):
+        return {"stream_options": {"include_usage": True}}
+    return {}
+
+
+def _stream_upstream(request, flight):
+    """Stream the completion of *request* from upstream, publishing each token to *flight* for followers."""
+    client = get_openai_client(base_url=request.base_url, api_key=request.api_key)
+    breaker = CircuitBreaker(request.base_url)
+    budget = RetryBudget(request.request_type)
+    slot = UpstreamSlot(request.request_type)
+    first_token_ms = None
     last_error = ""
-    response_text = ""
-
-    for attempt in range(2):
-        try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2048,
-                temperature=0.7,
-                timeout=30,
-            )
-            response_text = response.choices[0].message.content or ""
-            break
-        except APITimeoutError:
-            last_error = "timeout"
-            if attempt == 0:
-                continue
-        except APIConnectionError:
-            last_error = "connection_error"
-            if attempt == 0:
-                continue
-        except APIStatusError as exc:
-            last_error = f"api_status_{exc.status_code}"
-            break
-        except Exception as exc:  # noqa: BLE001
-            last_error = type(exc).__name__
-            break
-
-    latency_ms = int(time.monotonic() * 1000) - start_ms
-    success = bool(response_text) and not last_error
-
-    # Best-effort logging – never crash if the log write fails
+    response_parts = []
+    usage = None
+    logged = False
+
     try:
-        AIUsageLog.objects.create(
-            user=user,
-            request_type=request_type,
-            prompt_length=len(prompt),
-            used_curriculum_context=used_curriculum_context,
-            response_length=len(response_text),
-            latency_ms=latency_ms,
-            success=success,
-            failure_reason=last_error,
-        )
-    except Exception:  # noqa: BLE001
-        pass
-
-    if not success:
-        if last_error == "timeout":
-            return (
-                "The AI service is taking too long to respond right now. "
-                "Please try again in a moment, or continue editing your lesson manually."
-            )
-        return (
-            "The AI assistant is temporarily unavailable. "
-            "Please try again shortly. You can continue editing your lesson in the meantime."
-        )
+        with ConnectTimer() as connect_timer:
+            while True:
+                if not breaker.allow():
+                    last_error = last_error or "circuit_open"
+                    break
+                last_error = ""
+                try:
+                    with slot:
+                        stream = client.chat.completions.create(
+                            model=request.model,
+                            messages=request.messages,
+                            max_tokens=MAX_TOKENS,
+                            temperature=request.temperature,
+                            stream=True,
+                            **_stream_options(),
+                            timeout=budget.attempt_timeout(),
+                        )
+                        with stream:
+                            for chunk in stream:
+                                # With include_usage the last chunk has no choices, only usage.
+                                usage = getattr(chunk, "usage", None) or usage
+                                text = chunk.choices[0].delta.content if chunk.choices else None
+                                if not text:
+                                    continue
+                                if first_token_ms is None:
+                                    first_token_ms = request.elapsed_ms()
+                                response_parts.append(text)
+                                flight.publish(text)
+                                slot.renew()
+                                yield "token", text
+                    breaker.record_success()
+                    break
+                except QueueTimeout:
+                    last_error = "queue_timeout"
+                    break
+                except Exception as exc:  # noqa: BLE001
+                    last_error = _error_reason(exc)
+                    _record_breaker(breaker, exc)
+                    # Tokens already sent cannot be taken back, so only retry before the first one.
+                    delay = budget.next_delay(exc) if first_token_ms is None else None
+                    if delay is None:
+                        break
+                    time.sleep(delay)
+
+        response_text = "".join(response_parts)
+        log_fields = _upstream_log_fields(request, response_text, usage, last_error, slot, connect_timer,
+                                          time_to_first_token_ms=first_token_ms)
+        logged = True
+        if log_fields["success"]:
+            flight.finish((response_text, True))
+            _record_success(request, response_text, log_fields)
+        elif first_token_ms is None:
+            message, _ = _record_failure(log_fields)
+            flight.finish((message, False))
+            yield "error", message
+        else:
+            _record_failure(log_fields)
+            yield "error", _INTERRUPTED_MESSAGE
+    finally:
+        # The client disconnected and the generator was closed early.
+        if not logged:
+            _log_usage(**_upstream_log_fields(request, "".join(response_parts), usage, "client_disconnected", slot,
+                                              connect_timer, time_to_first_token_ms=first_token_ms))
+
+
+def _follow_stream(request, flight):
+    """Relay the tokens of a stream led by an identical concurrent request."""
+    first_token_ms = None
+    response_length = 0
+    failure_reason = "client_disconnected"
+
+    try:
+        for text in flight.follow():
+            if first_token_ms is None:
+                first_token_ms = request.elapsed_ms()
+            response_length += len(text)
+            yield "token", text
 
-    return response_text
\ No newline at end of file
+        if flight.result is None:
+            # The leader timed out, was interrupted or its client went away.
+            failure_reason = "coalesced_stream_interrupted"
+            yield "error", _INTERRUPTED_MESSAGE if response_length else _failure_message("")
+        else:
+            text, success = flight.result
+            failure_reason = "" if success else "coalesced_failure"
+            if not success:
+                yield "error", text
+            elif not response_length:
+                # Result of a leader in another process: nothing was relayed yet.
+                first_token_ms = request.elapsed_ms()
+                response_length = len(text)
+                yield "token", text
+    finally:
+        _log_usage(**request.log_fields(
+            response_length,
+            time_to_first_token_ms=first_token_ms,
+            coalesced=True,
+            success=not failure_reason,
+            failure_reason=failure_reason,
+        ))
@@ -1,10 +1,22 @@
+import atexit
+import collections
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import contextlib
 import csv
+import hashlib
 import io
 import logging
+import multiprocessing
+import os
 from pathlib import Path
+import shutil
 import tempfile
+import threading
+import time
 
 import PyPDF2
+from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +46,9 @@ except Exception:  # pragma: no cover - optional dependency
     textract = None
 
 
+# Bump whenever extraction output changes so cached curriculum text is regenerated.
+EXTRACTOR_VERSION = 3
+
 SUPPORTED_CURRICULUM_EXTENSIONS = {
     ".pdf",
     ".docx",
@@ -65,15 +80,269 @@ def _read_file_bytes(file_stream):
     return data
 
 
-def extract_text_from_pdf(pdf_file_stream):
-    """Extract plain text from a PDF file-like object."""
-    text = ""
+@contextlib.contextmanager
+def _local_file_path(file_stream, suffix=""):
+    """
+    Yield a filesystem path with the contents of *file_stream*.
+
+    A stream backed by a local file (e.g. a ``FileField`` on the default
+    storage) is used in place; anything else is copied in chunks to a
+    temporary file, so the contents are never held in memory at once.
+    """
+    path = getattr(getattr(file_stream, "file", file_stream), "name", None)
+    if isinstance(path, str) and os.path.isfile(path):
+        yield path
+        return
+    file_stream.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+        shutil.copyfileobj(file_stream, temp_file)
+    try:
+        yield temp_file.name
+    finally:
+        os.unlink(temp_file.name)
+
+
+def compute_content_hash(file_stream, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file-like object's contents."""
+    digest = hashlib.sha256()
+    file_stream.seek(0)
+    while chunk := file_stream.read(chunk_size):
+        digest.update(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+    file_stream.seek(0)
+    return digest.hexdigest()
+
+
+def _extraction_setting(name, default):
+    return getattr(settings, name, default)
+
+
+_pdf_pool = None
+_pdf_pool_pid = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool():
+    """Return the process-wide PDF extraction pool, creating it lazily (and again after fork)."""
+    global _pdf_pool, _pdf_pool_pid
+    with _pdf_pool_lock:
+        if _pdf_pool is None or _pdf_pool_pid != os.getpid():
+            # "spawn" keeps workers free of inherited DB connections and lock state.
+            _pdf_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=_extraction_setting("PDF_EXTRACTION_WORKERS", 2),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pdf_pool_pid = os.getpid()
+        return _pdf_pool
+
+
+def shutdown_pdf_pool(wait=True):
+    """Shut down the PDF extraction pool; the next parallel extraction starts a fresh one."""
+    global _pdf_pool, _pdf_pool_pid
+    with _pdf_pool_lock:
+        pool, _pdf_pool, _pdf_pool_pid = _pdf_pool, None, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+atexit.register(shutdown_pdf_pool, wait=False)
+
+
+def _extract_pdf_page_range(pdf_path, start, stop):
+    """Worker entry point: extract text for pages ``start:stop`` of the PDF at *pdf_path*."""
+    with open(pdf_path, "rb") as pdf_file:
+        reader = PyPDF2.PdfReader(pdf_file)
+        return [reader.pages[index].extract_text() or "" for index in range(start, stop)]
+
+
+def _extract_pdf_pages_serial(reader, page_count, progress, deadline):
+    """
+    Text layer of the first *page_count* pages, in order.
+
+    Progress counts pages that produced text; scanned pages are counted when
+    ``_ocr_scanned_pages`` finishes them.
+    """
+    pages = []
+    done_pages = 0
+    for index in range(page_count):
+        if deadline is not None and time.monotonic() > deadline:
+            logger.warning("PDF extraction timed out after %d of %d pages", index, page_count)
+            break
+        pages.append(reader.pages[index].extract_text() or "")
+        if progress and pages[-1].strip():
+            done_pages += 1
+            progress(done_pages, page_count)
+    return pages
+
+
+def _extract_pdf_pages_parallel(pdf_path, page_count, progress, deadline):
+    """``_extract_pdf_pages_serial`` with chunks of pages extracted in the PDF extraction pool."""
+    workers = _extraction_setting("PDF_EXTRACTION_WORKERS", 2)
+    chunk_size = max(8, -(-page_count // (workers * 4)))
+    ranges = [(start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+
+    pool = _get_pdf_pool()
+    futures = {
+        pool.submit(_extract_pdf_page_range, pdf_path, start, stop): position
+        for position, (start, stop) in enumerate(ranges)
+    }
+    # Pages from chunks that miss the deadline stay None rather than shifting later pages.
+    pages = [None] * page_count
+    done_pages = 0
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        for future in concurrent.futures.as_completed(futures, timeout=timeout):
+            start, stop = ranges[futures[future]]
+            pages[start:stop] = future.result()
+            done_pages += sum(1 for page in pages[start:stop] if page.strip())
+            if progress:
+                progress(done_pages, page_count)
+    except concurrent.futures.TimeoutError:
+        logger.warning("PDF extraction timed out after %d of %d chunks",
+                       sum(future.done() for future in futures), len(ranges))
+        for future in futures:
+            future.cancel()
+    return pages
+
+def _ocr_available():
+    return pytesseract is not None and Image is not None
+
+
+def _prepare_image_for_ocr(image):
+    """Return a grayscale copy of *image* no larger than ``OCR_MAX_DIMENSION`` pixels per side."""
+    max_dimension = _extraction_setting("OCR_MAX_DIMENSION", 2000)
+    if image.format == "JPEG":
+        # Let the JPEG decoder scale down while decoding instead of materialising full size.
+        image.draft("L", (max_dimension, max_dimension))
+    prepared = image.convert("L")
+    prepared.thumbnail((max_dimension, max_dimension))
+    return prepared
+
+
+def _ocr_image(image):
+    return (pytesseract.image_to_string(_prepare_image_for_ocr(image)) or "").strip()
+
+
+def _ocr_image_bytes(data):
+    with Image.open(io.BytesIO(data)) as image:
+        return _ocr_image(image)
+
+
+def _largest_page_image(page):
+    """Return the encoded bytes of the largest image on a PDF page (the scan), or None."""
     try:
-        pdf_file_stream.seek(0)
-        reader = PyPDF2.PdfReader(pdf_file_stream)
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return text.strip()
+        images = page.images
+    except Exception:  # noqa: BLE001 - unsupported image filters, etc.
+        logger.warning("Could not read images from PDF page", exc_info=True)
+        return None
+    return max((image.data for image in images), key=len, default=None)
+
+
+def iter_ocr_pdf_pages(reader, page_indexes, page_cache=None, deadline=None):
+    """
+    Yield ``(page_index, text)`` for scanned PDF pages, in order.
+
+    Page images are pulled from *reader* lazily and OCRed in a thread pool of
+    ``OCR_WORKERS`` threads, with at most twice that many pages in flight, so
+    memory stays flat however long the document is. *page_cache* (an object
+    with ``get(page_index)`` and ``set(page_index, text)``) lets an interrupted
+    document resume: cached pages are yielded without OCR and new results are
+    written back as they complete. Stops early once *deadline* passes.
+    """
+    workers = _extraction_setting("OCR_WORKERS", 2)
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr")
+    in_flight = collections.deque()
+
+    def resolve(index, result):
+        if not isinstance(result, concurrent.futures.Future):
+            return index, result
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        text = result.result(timeout=timeout)
+        if page_cache is not None:
+            page_cache.set(index, text)
+        return index, text
+
+    try:
+        for index in page_indexes:
+            cached = page_cache.get(index) if page_cache is not None else None
+            if cached is not None:
+                in_flight.append((index, cached))
+            else:
+                # Read the page image here: the PDF reader is not safe to share across threads.
+                image_data = _largest_page_image(reader.pages[index])
+                in_flight.append((index, pool.submit(_ocr_image_bytes, image_data) if image_data else ""))
+            while in_flight and (
+                len(in_flight) > workers * 2
+                or not isinstance(in_flight[0][1], concurrent.futures.Future)
+            ):
+                yield resolve(*in_flight.popleft())
+        while in_flight:
+            yield resolve(*in_flight.popleft())
+    except concurrent.futures.TimeoutError:
+        logger.warning("OCR timed out with %d page(s) unfinished", len(in_flight) + 1)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _ocr_scanned_pages(reader, pages, page_count, page_cache, progress, deadline):
+    """Fill in pages without a text layer by OCRing their scanned images."""
+    scanned = [index for index, page in enumerate(pages) if page is not None and not page.strip()]
+    if not scanned or not _ocr_available():
+        return
+    done_pages = sum(1 for page in pages if page and page.strip())
+    try:
+        for index, text in iter_ocr_pdf_pages(reader, scanned, page_cache, deadline):
+            pages[index] = text
+            done_pages += 1
+            if progress:
+                progress(done_pages, page_count)
+    except Exception:  # noqa: BLE001 - e.g. tesseract binary missing; keep the text layer
+        logger.warning("OCR of scanned PDF pages failed", exc_info=True)
+
+
+def extract_text_from_pdf(pdf_file_stream, progress=None, max_pages=None, timeout=None, parallel=None,
+                          page_cache=None):
+    """
+    Extract plain text from a PDF file-like object.
+
+    Large documents are split into page ranges and extracted in a shared process
+    pool; pages are always joined in document order. Pages without a text layer
+    (scans) are OCRed page by page, see ``iter_ocr_pdf_pages``; *page_cache* is
+    passed through to it. At most *max_pages* pages are read, and extraction
+    stops after *timeout* seconds, returning the pages finished so far. Both
+    default to the ``PDF_MAX_PAGES`` and ``PDF_EXTRACTION_TIMEOUT`` settings.
+    *progress*, if given, is called as ``progress(done_pages, total_pages)``.
+    """
+    if max_pages is None:
+        max_pages = _extraction_setting("PDF_MAX_PAGES", 1000)
+    if timeout is None:
+        timeout = _extraction_setting("PDF_EXTRACTION_TIMEOUT", 120)
+    deadline = time.monotonic() + timeout if timeout else None
+    try:
+        # The reader seeks into the file for each object it needs, so only the
+        # pages' text (the result) grows with the document, not the PDF itself.
+        with _local_file_path(pdf_file_stream, suffix=".pdf") as pdf_path, open(pdf_path, "rb") as pdf_file:
+            reader = PyPDF2.PdfReader(pdf_file)
+            page_count = len(reader.pages)
+            if max_pages and page_count > max_pages:
+                logger.warning("PDF has %d pages; extracting the first %d", page_count, max_pages)
+                page_count = max_pages
+            if parallel is None:
+                parallel = (
+                    _extraction_setting("PDF_EXTRACTION_WORKERS", 2) > 1
+                    and page_count >= _extraction_setting("PDF_PARALLEL_MIN_PAGES", 64)
+                )
+
+            if parallel:
+                try:
+                    pages = _extract_pdf_pages_parallel(pdf_path, page_count, progress, deadline)
+                except BrokenProcessPool:
+                    logger.warning("PDF extraction pool broke; falling back to serial extraction")
+                    shutdown_pdf_pool(wait=False)
+                    pages = _extract_pdf_pages_serial(reader, page_count, progress, deadline)
+            else:
+                pages = _extract_pdf_pages_serial(reader, page_count, progress, deadline)
+            _ocr_scanned_pages(reader, pages, page_count, page_cache, progress, deadline)
+        return "\n".join(page for page in pages if page).strip()
     except Exception:
         logger.exception("Error extracting text from PDF")
         return None
@@ -118,11 +387,11 @@ def _extract_text_from_csv(file_stream):
 
 
 def _extract_text_from_image(file_stream):
-    if pytesseract is None or Image is None:
+    if not _ocr_available():
         raise ValueError("Image OCR extraction is unavailable on this server.")
-    data = _read_file_bytes(file_stream)
-    image = Image.open(io.BytesIO(data))
-    return (pytesseract.image_to_string(image) or "").strip()
+    file_stream.seek(0)
+    with Image.open(file_stream) as image:
+        return _ocr_image(image)
 
 
 def _extract_with_textract(file_stream, filename):
@@ -136,14 +405,19 @@ def _extract_with_textract(file_stream, filename):
     return extracted.decode("utf-8", errors="ignore").strip()
 
 
-def extract_text_from_file(file_stream, filename, content_type=None):
-    """Extract text from a supported uploaded curriculum file."""
+def extract_text_from_file(file_stream, filename, content_type=None, progress=None, page_cache=None):
+    """
+    Extract text from a supported uploaded curriculum file.
+
+    *progress* and *page_cache* are forwarded to the PDF extractor, which can
+    report per-page progress and resume OCR from cached pages.
+    """
     ext = Path(filename or "").suffix.lower()
     logger.info("Attempting extraction for file '%s' (ext=%s, type=%s)", filename, ext, content_type)
 
     try:
         if ext == ".pdf":
-            text = extract_text_from_pdf(file_stream)
+            text = extract_text_from_pdf(file_stream, progress=progress, page_cache=page_cache)
         elif ext == ".docx":
             text = _extract_text_from_docx(file_stream)
         elif ext == ".pptx":
@@ -0,0 +1,107 @@
+"""
+Reviews of many lesson plans at once, stored as ``LessonReview`` rows.
+
+A lesson is reviewed again only when the hash of its review prompt (which
+covers every field the review reads) and the model name differs from the one
+stored with its last review. Reviews run concurrently, at most
+``AI_REVIEW_BATCH_CONCURRENCY`` at a time, on one event loop. They also go
+through the usual upstream slot cap and circuit breaker.
+"""
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass, field
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+
+from home.models import LessonPlan, LessonReview
+
+from .ai_review import areview_lesson, review_model, review_prompt, review_rejection
+from .clients import scoped_async_clients
+
+
+@dataclass
+class BatchReviewResult:
+    reviewed: list = field(default_factory=list)  # lesson ids with a new review
+    unchanged: list = field(default_factory=list)  # lesson ids whose stored review is current
+    failed: dict = field(default_factory=dict)  # lesson id -> message
+    rejected: dict = field(default_factory=dict)  # lesson id -> why its prompt is refused
+    missing: list = field(default_factory=list)  # requested ids that do not exist
+    seconds: float = 0.0  # wall-clock time of the reviews
+    sequential_seconds: float = 0.0  # sum of the individual review times
+
+
+def review_content_hash(lesson):
+    """Hash identifying what a review of *lesson* would be based on."""
+    return hashlib.sha256(f"{review_model()}\0{review_prompt(lesson)}".encode()).hexdigest()
+
+
+def _concurrency():
+    return max(1, min(getattr(settings, "AI_REVIEW_BATCH_CONCURRENCY", 4),
+                      getattr(settings, "AI_MAX_CONCURRENT_REQUESTS", 8) or 1))
+
+
+async def _review_all(lessons, user, concurrency):
+    """Review *lessons* concurrently; runs on the short-lived loop of ``async_to_sync``."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def review(lesson):
+        async with semaphore:
+            start = time.monotonic()
+            text, success = await areview_lesson(lesson, user=user)
+            return lesson, text, success, time.monotonic() - start
+
+    async with scoped_async_clients():
+        return await asyncio.gather(*(review(lesson) for lesson in lessons))
+
+
+def review_lessons(lesson_ids, user=None, force=False, concurrency=None, queryset=None):
+    """
+    Review the lessons with *lesson_ids* and store the results.
+
+    Lessons whose stored review is current are skipped unless *force*.
+    *queryset* limits which lessons may be reviewed (e.g. one teacher's).
+    *user* is charged for the requests. Call from synchronous code only.
+    """
+    lesson_ids = list(dict.fromkeys(int(pk) for pk in lesson_ids))
+    lessons = (queryset if queryset is not None else LessonPlan.objects.all()) \
+        .filter(pk__in=lesson_ids).select_related('subject', 'grade')
+    lessons = {lesson.pk: lesson for lesson in lessons}
+    stored = dict(LessonReview.objects.filter(lesson_id__in=lessons).values_list('lesson_id', 'content_hash'))
+
+    result = BatchReviewResult(missing=[pk for pk in lesson_ids if pk not in lessons])
+    pending = []
+    for pk in lesson_ids:
+        lesson = lessons.get(pk)
+        if lesson is None:
+            continue
+        lesson.review_hash = review_content_hash(lesson)
+        if not force and stored.get(pk) == lesson.review_hash:
+            result.unchanged.append(pk)
+        elif rejection := review_rejection(lesson):
+            result.rejected[pk] = rejection
+        else:
+            pending.append(lesson)
+
+    start = time.monotonic()
+    outcomes = async_to_sync(_review_all)(pending, user, concurrency or _concurrency()) if pending else []
+    result.seconds = time.monotonic() - start
+
+    model = review_model()
+    for lesson, text, success, seconds in outcomes:
+        result.sequential_seconds += seconds
+        if not success:
+            result.failed[lesson.pk] = text
+            continue
+        LessonReview.objects.update_or_create(
+            lesson=lesson, defaults={'feedback': text, 'error': '', 'content_hash': lesson.review_hash,
+                                     'model': model})
+        result.reviewed.append(lesson.pk)
+    # A rejected prompt stays rejected until the lesson changes, so the rejection is
+    # stored like a review and the lesson is not tried again for the same content.
+    for pk, rejection in result.rejected.items():
+        LessonReview.objects.update_or_create(
+            lesson=lessons[pk], defaults={'feedback': '', 'error': rejection[:255],
+                                          'content_hash': lessons[pk].review_hash, 'model': model})
+    return result
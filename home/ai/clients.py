@@ -0,0 +1,199 @@
+"""
+Process-wide pooled OpenAI clients.
+
+Creating an ``OpenAI`` client per request throws away its httpx connection
+pool, so every chat message paid for a new TCP + TLS handshake. Clients are
+created lazily, one per (base URL, API key), and reused by every thread in the
+process. After a fork (gunicorn workers) the inherited clients are dropped
+without closing them, because their sockets belong to the parent.
+
+``AsyncOpenAI`` clients are bound to the event loop that first uses them, so
+they are pooled per loop as well. That suits the long-lived loop of an ASGI
+server; code that runs a short-lived loop (``async_to_sync`` from a command or
+job handler) wraps its work in ``scoped_async_clients()``, which closes the
+clients it created before the loop goes away.
+
+The SDK's own retries are disabled (``max_retries=0``): retries, backoff and
+the circuit breaker are handled by ``home.ai.resilience``.
+"""
+import asyncio
+import contextlib
+import contextvars
+import os
+import threading
+import time
+import weakref
+
+import httpx
+from django.conf import settings
+from openai import AsyncOpenAI, OpenAI
+
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> {key: AsyncOpenAI}
+_clients_lock = threading.Lock()
+_clients_pid = os.getpid()
+
+# Per thread / asyncio task, so concurrent requests do not share timings.
+_connect_timing = contextvars.ContextVar("ai_connect_timing", default=None)
+# {key: AsyncOpenAI} of the innermost ``scoped_async_clients()`` block, if any.
+_scoped_async_clients = contextvars.ContextVar("ai_scoped_async_clients", default=None)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _trace(event_name, info):
+    """httpcore trace hook: accumulate time spent opening connections for the current context."""
+    timing = _connect_timing.get()
+    if timing is None:
+        return
+    if event_name in ("connection.connect_tcp.started", "connection.start_tls.started"):
+        timing["started"] = time.perf_counter()
+    elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+        if timing["started"] is not None:
+            timing["seconds"] += time.perf_counter() - timing["started"]
+            timing["started"] = None
+        if event_name == "connection.connect_tcp.complete":
+            timing["connections"] += 1
+
+
+async def _atrace(event_name, info):
+    _trace(event_name, info)
+
+
+class _TracedTransport(httpx.HTTPTransport):
+    def handle_request(self, request):
+        request.extensions["trace"] = _trace
+        return super().handle_request(request)
+
+
+class _AsyncTracedTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request):
+        request.extensions["trace"] = _atrace
+        return await super().handle_async_request(request)
+
+
+class ConnectTimer:
+    """
+    Context manager measuring new connections opened by the current thread or task.
+
+    ``connections`` is 0 and ``connect_ms`` ~0 when a pooled connection was reused.
+    """
+
+    def __enter__(self):
+        self._timing = {"seconds": 0.0, "connections": 0, "started": None}
+        self._token = _connect_timing.set(self._timing)
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            _connect_timing.reset(self._token)
+        except ValueError:
+            # Exited from another context (e.g. a generator closed elsewhere).
+            pass
+        return False
+
+    @property
+    def connections(self):
+        return self._timing["connections"]
+
+    @property
+    def connect_ms(self):
+        return int(self._timing["seconds"] * 1000)
+
+
+def _http_limits():
+    return httpx.Limits(
+        max_connections=_setting("AI_HTTP_MAX_CONNECTIONS", 20),
+        max_keepalive_connections=_setting("AI_HTTP_MAX_KEEPALIVE_CONNECTIONS", 10),
+        keepalive_expiry=_setting("AI_HTTP_KEEPALIVE_EXPIRY", 60),
+    )
+
+
+def _http_timeout():
+    return httpx.Timeout(_setting("AI_REQUEST_TIMEOUT", 30), connect=_setting("AI_CONNECT_TIMEOUT", 5))
+
+
+def _build_http_client():
+    return httpx.Client(transport=_TracedTransport(limits=_http_limits()), timeout=_http_timeout())
+
+
+def _build_async_http_client():
+    return httpx.AsyncClient(transport=_AsyncTracedTransport(limits=_http_limits()), timeout=_http_timeout())
+
+
+def reset_clients(close=False):
+    """
+    Forget all pooled clients.
+
+    Called after fork with ``close=False`` (the sockets are shared with the
+    parent) and at worker exit with ``close=True``. Async clients are only
+    forgotten: closing them needs their event loop.
+    """
+    global _clients_pid
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        _async_clients.clear()
+        _clients_pid = os.getpid()
+    if close:
+        for client in clients:
+            client.close()
+
+
+def _client_key(base_url, api_key):
+    if os.getpid() != _clients_pid:
+        reset_clients(close=False)
+    return (
+        base_url or _setting("BASE_URL", "https://integrate.api.nvidia.com/v1"),
+        api_key or _setting("NVIDIA_API_KEY", None),
+    )
+
+
+def get_openai_client(base_url=None, api_key=None):
+    """Return the shared ``OpenAI`` client for *base_url* / *api_key* (settings by default)."""
+    key = _client_key(base_url, api_key)
+    base_url, api_key = key
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(base_url=base_url, api_key=api_key, max_retries=0, http_client=_build_http_client())
+            _clients[key] = client
+    return client
+
+
+def get_async_openai_client(base_url=None, api_key=None):
+    """Return the shared ``AsyncOpenAI`` client for the running event loop (or ``scoped_async_clients`` block)."""
+    key = _client_key(base_url, api_key)
+    base_url, api_key = key
+    loop_clients = _scoped_async_clients.get()
+    with _clients_lock:
+        if loop_clients is None:
+            loop_clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+        client = loop_clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(base_url=base_url, api_key=api_key, max_retries=0,
+                                 http_client=_build_async_http_client())
+            loop_clients[key] = client
+    return client
+
+
+@contextlib.asynccontextmanager
+async def scoped_async_clients():
+    """
+    Give the block its own ``AsyncOpenAI`` clients and close them when it ends.
+
+    For event loops that only live for one call, such as the loop
+    ``async_to_sync`` starts: clients pooled for such a loop would keep their
+    connections open after it is gone. Tasks started inside the block share
+    its clients.
+    """
+    clients = {}
+    token = _scoped_async_clients.set(clients)
+    try:
+        yield
+    finally:
+        _scoped_async_clients.reset(token)
+        for client in clients.values():
+            await client.close()
@@ -0,0 +1,108 @@
+"""
+Multi-turn AI conversations stored per user (and optionally per lesson).
+
+Each successful exchange is saved as two ``ConversationTurn`` rows, and the
+next request sends the earlier turns along with the new prompt.
+
+With ``AI_CONVERSATION_COMPACTION`` on (the default) those messages stay
+within ``AI_CONVERSATION_TOKEN_BUDGET`` tokens however long the conversation
+gets: only the newest turns that fit are sent, and older ones are folded into
+a running summary of at most ``AI_CONVERSATION_SUMMARY_TOKENS`` tokens, sent
+first as a system message. The summary is extractive (the opening of each
+turn), so compaction needs no extra model call; once folded, a turn is never
+read again. With compaction off every turn is sent.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from home.models import Conversation, ConversationTurn
+
+from .prompting import count_tokens, truncate_to_tokens
+
+SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+# Each folded turn keeps about this many tokens of its opening.
+_SUMMARY_LINE_TOKENS = 48
+_ROLE_LABELS = dict(ConversationTurn.ROLE_CHOICES)
+
+
+def _compaction():
+    return getattr(settings, "AI_CONVERSATION_COMPACTION", True)
+
+
+def _token_budget():
+    return getattr(settings, "AI_CONVERSATION_TOKEN_BUDGET", 2048)
+
+
+def _summary_budget():
+    return min(getattr(settings, "AI_CONVERSATION_SUMMARY_TOKENS", 256), _token_budget() // 2)
+
+
+def get_conversation(user, conversation_id=None, lesson=None, request_type="general_chat"):
+    """
+    Return the conversation *conversation_id* of *user*, or a new unsaved one
+    (saved with its first exchange) if the id is empty or not one of theirs.
+    """
+    if conversation_id:
+        try:
+            return Conversation.objects.get(pk=int(conversation_id), user=user)
+        except (Conversation.DoesNotExist, TypeError, ValueError):
+            pass
+    return Conversation(user=user, lesson=lesson, request_type=request_type)
+
+
+def messages_tokens(messages):
+    """Token count of the text of chat *messages*."""
+    return sum(count_tokens(message["content"]) for message in messages)
+
+
+def _fold(summary, turns):
+    """*summary* extended with the openings of *turns*, oldest lines dropped to fit."""
+    lines = summary.splitlines() if summary else []
+    lines += [f"{_ROLE_LABELS[role]}: {truncate_to_tokens(' '.join(content.split()), _SUMMARY_LINE_TOKENS)}"
+              for _, role, content, _ in turns]
+    budget = _summary_budget() - count_tokens(SUMMARY_HEADER)
+    while lines and count_tokens("\n".join(lines)) > budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def history_messages(conversation):
+    """
+    Chat messages for the earlier turns of *conversation*, within the token
+    budget. Compacting saves the updated summary on the conversation.
+    """
+    if conversation.pk is None:
+        return []
+    turns = list(conversation.turns.filter(pk__gt=conversation.summarized_through)
+                 .values_list("pk", "role", "content", "tokens"))
+    if _compaction():
+        # Keep the newest turns that fit next to the summary, starting at a user turn.
+        room = _token_budget() - _summary_budget()
+        keep_from = len(turns)
+        while keep_from and turns[keep_from - 1][3] <= room:
+            room -= turns[keep_from - 1][3]
+            keep_from -= 1
+        while keep_from < len(turns) and turns[keep_from][1] != ConversationTurn.USER:
+            keep_from += 1
+        if keep_from:
+            folded, turns = turns[:keep_from], turns[keep_from:]
+            conversation.summary = _fold(conversation.summary, folded)
+            conversation.summarized_through = folded[-1][0]
+            Conversation.objects.filter(pk=conversation.pk).update(
+                summary=conversation.summary, summarized_through=conversation.summarized_through)
+    messages = [{"role": role, "content": content} for _, role, content, _ in turns]
+    if conversation.summary:
+        messages.insert(0, {"role": "system", "content": SUMMARY_HEADER + conversation.summary})
+    return messages
+
+
+def record_exchange(conversation, user_text, assistant_text):
+    """Save a user message and the assistant's reply as the next turns of *conversation*."""
+    with transaction.atomic():
+        conversation.save()  # creates a new conversation; otherwise bumps updated_at
+        ConversationTurn.objects.bulk_create([
+            ConversationTurn(conversation=conversation, role=ConversationTurn.USER, content=user_text,
+                             tokens=count_tokens(user_text)),
+            ConversationTurn(conversation=conversation, role=ConversationTurn.ASSISTANT, content=assistant_text,
+                             tokens=count_tokens(assistant_text)),
+        ])
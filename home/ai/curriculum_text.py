@@ -0,0 +1,184 @@
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError
+
+from .ai_utils import EXTRACTOR_VERSION, compute_content_hash, extract_text_from_file
+from .retrieval import store_chunks
+from .vector_store import discard_vectors
+
+logger = logging.getLogger(__name__)
+
+
+def _curriculum_filename(curriculum):
+    return curriculum.file.name or curriculum.title
+
+
+def ensure_content_hash(curriculum):
+    """Compute and persist the content hash for curricula uploaded before hashing existed."""
+    if curriculum.content_hash:
+        return curriculum.content_hash
+    with curriculum.file.open('rb') as file_stream:
+        curriculum.content_hash = compute_content_hash(file_stream)
+    type(curriculum).objects.filter(pk=curriculum.pk).update(content_hash=curriculum.content_hash)
+    return curriculum.content_hash
+
+
+class PageTextCache:
+    """Per-page OCR results for one file version, so an interrupted extraction resumes."""
+
+    def __init__(self, content_hash):
+        from home.models import CurriculumPageText  # noqa: PLC0415
+
+        self._queryset = CurriculumPageText.objects.filter(
+            content_hash=content_hash, extractor_version=EXTRACTOR_VERSION,
+        )
+        self._content_hash = content_hash
+        self._pages = dict(self._queryset.values_list('page_number', 'text'))
+
+    def get(self, page_number):
+        return self._pages.get(page_number)
+
+    def set(self, page_number, text):
+        self._queryset.update_or_create(
+            content_hash=self._content_hash, extractor_version=EXTRACTOR_VERSION,
+            page_number=page_number, defaults={'text': text},
+        )
+        self._pages[page_number] = text
+
+    def clear(self):
+        self._queryset.delete()
+        self._pages.clear()
+
+
+def set_extraction_state(curriculum, **fields):
+    """Update extraction status fields without re-running the save signals."""
+    for name, value in fields.items():
+        setattr(curriculum, name, value)
+    type(curriculum).objects.filter(pk=curriculum.pk).update(**fields)
+
+
+def _mark_finished(curriculum, stored):
+    status = curriculum.EXTRACTION_FAILED if stored.error else curriculum.EXTRACTION_READY
+    if (curriculum.extraction_status, curriculum.extraction_error) != (status, stored.error):
+        set_extraction_state(curriculum, extraction_status=status, extraction_progress=100,
+                             extraction_error=stored.error)
+
+
+def extract_and_store(curriculum, force=False, heartbeat=None):
+    """
+    Extract text for *curriculum* and persist it keyed by content hash and extractor version.
+
+    Extraction errors (``ValueError``) are stored too, so a broken upload is not
+    re-parsed on every chat message. Status and progress are recorded on the
+    curriculum row as extraction proceeds, and *heartbeat* is called with each
+    progress report. Returns the ``CurriculumText`` row.
+    """
+    from home.models import CurriculumText  # noqa: PLC0415
+
+    content_hash = ensure_content_hash(curriculum)
+    lookup = {'content_hash': content_hash, 'extractor_version': EXTRACTOR_VERSION}
+    if not force:
+        cached = CurriculumText.objects.filter(**lookup).first()
+        if cached is not None:
+            _mark_finished(curriculum, cached)
+            return cached
+
+    set_extraction_state(curriculum, extraction_status=curriculum.EXTRACTION_PROCESSING,
+                         extraction_progress=0, extraction_error='')
+
+    def report_progress(done, total):
+        if heartbeat is not None:
+            heartbeat()
+        percent = min(99, done * 100 // max(total, 1))
+        if percent > curriculum.extraction_progress:
+            set_extraction_state(curriculum, extraction_progress=percent)
+
+    page_cache = PageTextCache(content_hash)
+    if force:
+        page_cache.clear()
+    text, error = '', ''
+    try:
+        with curriculum.file.open('rb') as file_stream:
+            text = extract_text_from_file(file_stream, _curriculum_filename(curriculum),
+                                          progress=report_progress, page_cache=page_cache)
+    except ValueError as exc:
+        error = str(exc)[:255]
+
+    try:
+        stored, _ = CurriculumText.objects.update_or_create(
+            **lookup, defaults={'text': text, 'error': error},
+        )
+    except IntegrityError:
+        # Another request extracted the same file version concurrently.
+        stored = CurriculumText.objects.get(**lookup)
+    store_chunks(stored)
+    # The full text is stored now; per-page results were only needed for resuming.
+    page_cache.clear()
+    _mark_finished(curriculum, stored)
+    return stored
+
+
+class ExtractionPending(ValueError):
+    """The curriculum's text has not been extracted yet (the background job is pending or running)."""
+
+
+def _stored_text(curriculum):
+    from home.models import CurriculumText  # noqa: PLC0415
+
+    if not curriculum.content_hash:
+        return None
+    stored = CurriculumText.objects.filter(
+        content_hash=curriculum.content_hash, extractor_version=EXTRACTOR_VERSION,
+    ).first()
+    if stored is not None:
+        _mark_finished(curriculum, stored)
+    return stored
+
+
+def get_curriculum_text_record(curriculum, extract=None):
+    """
+    Return the ``CurriculumText`` row for *curriculum*.
+
+    The text is extracted by the background worker; until it is stored this
+    raises ``ExtractionPending``. With *extract* (default: the
+    ``CURRICULUM_INLINE_EXTRACTION`` setting) it is extracted here instead, at
+    most once per file version.
+
+    Raises ``ValueError`` with a user-facing message when the file cannot be used.
+    """
+    if not curriculum.file:
+        raise ValueError("No file is attached to this curriculum.")
+    if extract is None:
+        extract = getattr(settings, 'CURRICULUM_INLINE_EXTRACTION', False)
+    stored = extract_and_store(curriculum) if extract else _stored_text(curriculum)
+    if stored is None:
+        if curriculum.extraction_status == curriculum.EXTRACTION_FAILED and curriculum.extraction_error:
+            raise ValueError(curriculum.extraction_error)
+        raise ExtractionPending("Its text is still being extracted; it will be used once that finishes.")
+    if stored.error:
+        raise ValueError(stored.error)
+    return stored
+
+
+def get_curriculum_text(curriculum, extract=None):
+    """Return the extracted text for *curriculum* (see ``get_curriculum_text_record``)."""
+    return get_curriculum_text_record(curriculum, extract=extract).text
+
+
+def discard_orphaned_texts(content_hashes):
+    """Delete cached text for hashes no longer referenced by any curriculum."""
+    from home.models import Curriculum, CurriculumPageText, CurriculumText  # noqa: PLC0415
+
+    content_hashes = {h for h in content_hashes if h}
+    if not content_hashes:
+        return 0
+    still_used = set(
+        Curriculum.objects.filter(content_hash__in=content_hashes).values_list('content_hash', flat=True)
+    )
+    CurriculumPageText.objects.filter(content_hash__in=content_hashes - still_used).delete()
+    discard_vectors(content_hashes - still_used)
+    deleted, _ = CurriculumText.objects.filter(content_hash__in=content_hashes - still_used).delete()
+    if deleted:
+        logger.info("Discarded %d cached curriculum text row(s)", deleted)
+    return deleted
@@ -0,0 +1,119 @@
+"""
+Text embedding backends for semantic curriculum search.
+
+``CURRICULUM_EMBEDDING_BACKEND`` selects the backend:
+
+- ``""`` (default): semantic search is off and retrieval is purely lexical.
+- ``"hashing"``: deterministic local feature-hashing embedder; no network, used in tests.
+- ``"openai"``: an OpenAI-compatible ``/embeddings`` endpoint reached with the same
+  ``BASE_URL`` / ``NVIDIA_API_KEY`` settings as chat completions.
+"""
+import hashlib
+import logging
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except Exception:  # pragma: no cover - optional dependency
+    np = None
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class EmbeddingError(Exception):
+    """Raised when a backend cannot produce embeddings."""
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words and word bigrams into *dimensions* buckets."""
+
+    def __init__(self, dimensions=512):
+        self.dimensions = dimensions
+        self.key = f"hashing-{dimensions}"
+
+    def _bucket(self, feature):
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dimensions, 1.0 if value >> 63 else -1.0
+
+    def _embed(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = _WORD_RE.findall(text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                column, sign = self._bucket(feature)
+                matrix[row, column] += sign
+        return _normalize(matrix)
+
+    def embed_documents(self, texts):
+        return self._embed(texts)
+
+    def embed_query(self, text):
+        return self._embed([text])[0]
+
+
+class OpenAIEmbedder:
+    """Embeddings from an OpenAI-compatible endpoint, requested in batches."""
+
+    def __init__(self, model, batch_size=64):
+        self.model = model
+        self.batch_size = batch_size
+        self.key = "openai-" + re.sub(r"[^A-Za-z0-9.-]+", "_", model)
+
+    def _client(self):
+        from .clients import get_openai_client  # noqa: PLC0415
+
+        if not getattr(settings, "NVIDIA_API_KEY", None):
+            raise EmbeddingError("NVIDIA_API_KEY not configured.")
+        return get_openai_client()
+
+    def _embed(self, texts, input_type):
+        from openai import OpenAIError  # noqa: PLC0415
+
+        client = self._client()
+        rows = []
+        try:
+            for start in range(0, len(texts), self.batch_size):
+                response = client.embeddings.create(
+                    model=self.model,
+                    input=texts[start:start + self.batch_size],
+                    encoding_format="float",
+                    # Retrieval models on NIM embed passages and queries differently.
+                    extra_body={"input_type": input_type, "truncate": "END"},
+                )
+                rows.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        except OpenAIError as exc:
+            raise EmbeddingError(str(exc)) from exc
+        return _normalize(np.asarray(rows, dtype=np.float32))
+
+    def embed_documents(self, texts):
+        return self._embed(texts, "passage")
+
+    def embed_query(self, text):
+        return self._embed([text], "query")[0]
+
+
+def get_embedder():
+    """Return the configured embedder, or ``None`` when semantic search is off."""
+    backend = getattr(settings, "CURRICULUM_EMBEDDING_BACKEND", "")
+    if not backend:
+        return None
+    if np is None:
+        logger.warning("CURRICULUM_EMBEDDING_BACKEND is set but numpy is not installed.")
+        return None
+    if backend == "hashing":
+        return HashingEmbedder(getattr(settings, "CURRICULUM_EMBEDDING_DIMENSIONS", 512))
+    if backend == "openai":
+        return OpenAIEmbedder(getattr(settings, "CURRICULUM_EMBEDDING_MODEL", "nvidia/nv-embedqa-e5-v5"))
+    raise ImproperlyConfigured(f"Unknown CURRICULUM_EMBEDDING_BACKEND: {backend!r}")
@@ -0,0 +1,228 @@
+"""
+Limits on upstream AI calls.
+
+- At most ``AI_MAX_CONCURRENT_REQUESTS`` calls are in flight at once. Each call
+  leases one of that many slots in the ``AI_LIMITS_CACHE_ALIAS`` cache and
+  queues for up to ``AI_QUEUE_TIMEOUT`` seconds when all are taken. Leases
+  last as long as the request type's deadline and expire on their own, so a
+  crashed worker cannot hold a slot forever; streams renew theirs as tokens arrive.
+- Each user may send ``AI_USER_REQUESTS_PER_MINUTE`` requests and use
+  ``AI_USER_TOKENS_PER_HOUR`` estimated prompt + response tokens, counted in
+  fixed windows.
+
+That cache is a database table by default (``AI_LIMITS_CACHE_BACKEND`` can
+point it at Redis or memcached), so the limits hold across all worker
+processes. With a local-memory backend they would apply per process.
+"""
+import asyncio
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .resilience import request_deadline
+
+_POLL_INTERVAL = 0.05
+_MINUTE = 60
+_HOUR = 3600
+
+
+class RateLimitExceeded(Exception):
+    """The user has used up a request or token budget; ``retry_after`` is in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"AI budget exhausted, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class QueueTimeout(Exception):
+    """No upstream slot became free within ``AI_QUEUE_TIMEOUT``."""
+
+
+def _cache():
+    return caches[getattr(settings, "AI_LIMITS_CACHE_ALIAS", "default")]
+
+
+def _window(length):
+    """Return ``(window index, seconds until it ends)`` for fixed windows of *length* seconds."""
+    now = time.time()
+    return int(now // length), int(length - now % length) + 1
+
+
+def _user_limits():
+    return (
+        getattr(settings, "AI_USER_REQUESTS_PER_MINUTE", 20),
+        getattr(settings, "AI_USER_TOKENS_PER_HOUR", 200000),
+    )
+
+
+def _counter_key(kind, user_id, window):
+    return f"ai-limit:{kind}:{user_id}:{window}"
+
+
+def _increment(cache, key, amount, timeout):
+    cache.add(key, 0, timeout=timeout)
+    try:
+        return cache.incr(key, amount)
+    except ValueError:  # expired between add() and incr()
+        cache.set(key, amount, timeout=timeout)
+        return amount
+
+
+async def _aincrement(cache, key, amount, timeout):
+    await cache.aadd(key, 0, timeout=timeout)
+    try:
+        return await cache.aincr(key, amount)
+    except ValueError:
+        await cache.aset(key, amount, timeout=timeout)
+        return amount
+
+
+def check_user_budget(user, prompt_tokens):
+    """
+    Count one request of *prompt_tokens* against *user*'s budgets.
+
+    Raises ``RateLimitExceeded`` when a budget is used up. Requests without a
+    user are not limited here (the global cap still applies).
+    """
+    user_id = getattr(user, "pk", None)
+    if user_id is None:
+        return
+    request_limit, token_limit = _user_limits()
+    cache = _cache()
+    hour, hour_left = _window(_HOUR)
+    tokens_key = _counter_key("tokens", user_id, hour)
+    if token_limit and cache.get(tokens_key, 0) >= token_limit:
+        raise RateLimitExceeded(hour_left)
+    if request_limit:
+        minute, minute_left = _window(_MINUTE)
+        if _increment(cache, _counter_key("requests", user_id, minute), 1, minute_left) > request_limit:
+            raise RateLimitExceeded(minute_left)
+    if token_limit:
+        _increment(cache, tokens_key, prompt_tokens, hour_left)
+
+
+async def acheck_user_budget(user, prompt_tokens):
+    user_id = getattr(user, "pk", None)
+    if user_id is None:
+        return
+    request_limit, token_limit = _user_limits()
+    cache = _cache()
+    hour, hour_left = _window(_HOUR)
+    tokens_key = _counter_key("tokens", user_id, hour)
+    if token_limit and await cache.aget(tokens_key, 0) >= token_limit:
+        raise RateLimitExceeded(hour_left)
+    if request_limit:
+        minute, minute_left = _window(_MINUTE)
+        if await _aincrement(cache, _counter_key("requests", user_id, minute), 1, minute_left) > request_limit:
+            raise RateLimitExceeded(minute_left)
+    if token_limit:
+        await _aincrement(cache, tokens_key, prompt_tokens, hour_left)
+
+
+def charge_tokens(user, tokens):
+    """Add response *tokens* to *user*'s hourly token count."""
+    user_id = getattr(user, "pk", None)
+    if user_id is None or not _user_limits()[1] or not tokens:
+        return
+    hour, hour_left = _window(_HOUR)
+    _increment(_cache(), _counter_key("tokens", user_id, hour), tokens, hour_left)
+
+
+async def acharge_tokens(user, tokens):
+    user_id = getattr(user, "pk", None)
+    if user_id is None or not _user_limits()[1] or not tokens:
+        return
+    hour, hour_left = _window(_HOUR)
+    await _aincrement(_cache(), _counter_key("tokens", user_id, hour), tokens, hour_left)
+
+
+class UpstreamSlot:
+    """
+    Context manager (sync or async) holding one of the global in-flight slots.
+
+    ``queue_wait_ms`` is the total time spent waiting for a free slot (a slot
+    may be re-entered, e.g. once per retry). Raises ``QueueTimeout`` if none
+    became free within ``AI_QUEUE_TIMEOUT``.
+    """
+
+    def __init__(self, request_type=None):
+        self.queue_wait_ms = 0
+        self._key = None
+        self._token = uuid.uuid4().hex
+        self._limit = getattr(settings, "AI_MAX_CONCURRENT_REQUESTS", 8)
+        # Outlasts any attempt within the request's deadline; a lease outliving
+        # its holder only delays others, one that expires early breaks the cap.
+        self._lease = int(max(getattr(settings, "AI_REQUEST_TIMEOUT", 30), request_deadline(request_type))) + 10
+        self._renewed_at = 0.0
+
+    def _slot_keys(self):
+        # Start at a random slot so waiting callers do not all race for slot 0.
+        first = random.randrange(self._limit)
+        return [f"ai-limit:slot:{(first + offset) % self._limit}" for offset in range(self._limit)]
+
+    def _renew_due(self):
+        if self._key is None or time.monotonic() - self._renewed_at < self._lease / 3:
+            return False
+        self._renewed_at = time.monotonic()
+        return True
+
+    def renew(self):
+        """Extend the lease of the held slot, e.g. while a stream outlasts it; cheap to call per token."""
+        if self._renew_due():
+            cache = _cache()
+            if cache.get(self._key) == self._token:
+                cache.touch(self._key, self._lease)
+
+    def _deadline(self, start):
+        return start + getattr(settings, "AI_QUEUE_TIMEOUT", 10)
+
+    def __enter__(self):
+        if not self._limit:
+            return self
+        cache = _cache()
+        start = time.monotonic()
+        while True:
+            for key in self._slot_keys():
+                if cache.add(key, self._token, timeout=self._lease):
+                    self._key, self._renewed_at = key, time.monotonic()
+                    self.queue_wait_ms += int((time.monotonic() - start) * 1000)
+                    return self
+            if time.monotonic() >= self._deadline(start):
+                self.queue_wait_ms += int((time.monotonic() - start) * 1000)
+                raise QueueTimeout()
+            time.sleep(_POLL_INTERVAL)
+
+    def __exit__(self, *exc_info):
+        if self._key is not None:
+            cache = _cache()
+            if cache.get(self._key) == self._token:
+                cache.delete(self._key)
+            self._key = None
+        return False
+
+    async def __aenter__(self):
+        if not self._limit:
+            return self
+        cache = _cache()
+        start = time.monotonic()
+        while True:
+            for key in self._slot_keys():
+                if await cache.aadd(key, self._token, timeout=self._lease):
+                    self._key, self._renewed_at = key, time.monotonic()
+                    self.queue_wait_ms += int((time.monotonic() - start) * 1000)
+                    return self
+            if time.monotonic() >= self._deadline(start):
+                self.queue_wait_ms += int((time.monotonic() - start) * 1000)
+                raise QueueTimeout()
+            await asyncio.sleep(_POLL_INTERVAL)
+
+    async def __aexit__(self, *exc_info):
+        if self._key is not None:
+            cache = _cache()
+            if await cache.aget(self._key) == self._token:
+                await cache.adelete(self._key)
+            self._key = None
+        return False
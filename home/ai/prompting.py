@@ -0,0 +1,117 @@
+"""
+Prompt assembly within the model's context window.
+
+Token counts come from the tokenizer selected by ``AI_TOKENIZER``:
+
+- ``""`` (default): the fast heuristic of about four characters per token.
+- ``"tiktoken:<encoding>"``: a tiktoken encoding, if tiktoken is installed.
+- a dotted path to a callable taking a string and returning its token count.
+
+A prompt may use ``AI_MODEL_CONTEXT_TOKENS`` minus the tokens reserved for the
+completion and ``AI_PROMPT_SAFETY_TOKENS``. The teacher's request is kept
+whole whenever possible; curriculum context gets the remaining room and is cut
+at a sentence boundary when it does not fit.
+"""
+import functools
+import logging
+import re
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except Exception:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+CONTEXT_HEADER = "\n\n--- Relevant Curriculum Context ---"
+TRUNCATION_MARKER = " [...]"
+
+# Context with less room than this is left out rather than cut to a stub.
+_MIN_CONTEXT_TOKENS = 32
+_SENTENCE_END_RE = re.compile(r"[.!?](?=\s)|\n")
+
+
+def estimate_tokens(text):
+    """Cheap model-token estimate (about four characters per token for English)."""
+    return -(-len(text) // 4)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_tokenizer(spec):
+    if not spec:
+        return estimate_tokens
+    if spec.startswith("tiktoken:"):
+        if tiktoken is None:
+            logger.warning("AI_TOKENIZER=%s but tiktoken is not installed; estimating tokens.", spec)
+            return estimate_tokens
+        encoding = tiktoken.get_encoding(spec.split(":", 1)[1])
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    return import_string(spec)
+
+
+def count_tokens(text):
+    """Token count of *text* according to the configured tokenizer."""
+    return _load_tokenizer(getattr(settings, "AI_TOKENIZER", ""))(text)
+
+
+def prompt_token_budget(reserve_tokens):
+    """Tokens a prompt may use when *reserve_tokens* are kept free for the completion."""
+    return (
+        getattr(settings, "AI_MODEL_CONTEXT_TOKENS", 8192)
+        - reserve_tokens
+        - getattr(settings, "AI_PROMPT_SAFETY_TOKENS", 64)
+    )
+
+
+def truncate_to_tokens(text, budget):
+    """
+    Return *text* cut to at most *budget* tokens, ending at a sentence (or
+    failing that, word) boundary and marked with ``TRUNCATION_MARKER``.
+    """
+    if count_tokens(text) <= budget:
+        return text
+    if budget <= count_tokens(TRUNCATION_MARKER):
+        return ""
+    # Longest prefix that fits, found by bisection so any tokenizer works.
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle] + TRUNCATION_MARKER) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text[:low]
+    sentence_ends = [match.end() for match in _SENTENCE_END_RE.finditer(cut)]
+    if sentence_ends and sentence_ends[-1] > len(cut) // 2:
+        cut = cut[:sentence_ends[-1]]
+    elif " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    cut = cut.rstrip()
+    return cut + TRUNCATION_MARKER if cut else ""
+
+
+def context_token_budget(user_input, reserve_tokens):
+    """Room left for curriculum context next to *user_input*, capped by CURRICULUM_CONTEXT_TOKEN_BUDGET."""
+    room = prompt_token_budget(reserve_tokens) - count_tokens(user_input) - count_tokens(CONTEXT_HEADER)
+    return max(0, min(room, getattr(settings, "CURRICULUM_CONTEXT_TOKEN_BUDGET", 3000)))
+
+
+def build_prompt(user_input, context_text="", reserve_tokens=0):
+    """
+    Return ``(prompt, prompt_tokens, used_context)`` for *user_input* followed by
+    *context_text*, fitted to the prompt budget.
+    """
+    budget = prompt_token_budget(reserve_tokens)
+    request = truncate_to_tokens(user_input, budget)
+    if request != user_input:
+        logger.warning("AI request truncated to fit the %s-token prompt budget.", budget)
+    context = ""
+    if context_text:
+        room = budget - count_tokens(request) - count_tokens(CONTEXT_HEADER)
+        if room >= _MIN_CONTEXT_TOKENS:
+            context = truncate_to_tokens(context_text, room)
+    prompt = request + CONTEXT_HEADER + context if context else request
+    return prompt, count_tokens(prompt), bool(context)
@@ -0,0 +1,168 @@
+"""
+Failure handling for upstream AI calls: circuit breaker, retry backoff and deadlines.
+
+The circuit breaker keeps its state in the ``AI_LIMITS_CACHE_ALIAS`` cache (a
+database table by default), so all worker processes trip and reset it together:
+
+- closed: calls go through; consecutive upstream failures are counted.
+- open: after ``AI_BREAKER_FAILURE_THRESHOLD`` consecutive failures, calls fail
+  fast for ``AI_BREAKER_RESET_TIMEOUT`` seconds.
+- half-open: after that, a single probe call is let through; its success
+  closes the breaker, its failure opens it again.
+
+Retries use exponential backoff with full jitter and stop at the deadline of
+the request type (``AI_REQUEST_DEADLINES``).
+"""
+import hashlib
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Don't start an attempt that would have less than this many seconds to run.
+_MIN_ATTEMPT_SECONDS = 1.0
+
+
+def is_transient(exc):
+    """True for failures worth retrying that also indicate an unhealthy upstream."""
+    if isinstance(exc, (APITimeoutError, APIConnectionError)):
+        return True
+    return isinstance(exc, APIStatusError) and (exc.status_code == 429 or exc.status_code >= 500)
+
+
+def backoff_delay(retry):
+    """Seconds to wait before retry number *retry* (1-based): full-jitter exponential backoff."""
+    base = getattr(settings, "AI_RETRY_BASE_DELAY", 0.5)
+    cap = getattr(settings, "AI_RETRY_MAX_DELAY", 4)
+    return random.uniform(0, min(cap, base * 2 ** (retry - 1)))
+
+
+def request_deadline(request_type):
+    """Total seconds a request of *request_type* may spend on upstream attempts and backoff."""
+    deadlines = getattr(settings, "AI_REQUEST_DEADLINES", {})
+    return deadlines.get(request_type, getattr(settings, "AI_REQUEST_DEADLINE_DEFAULT", 45))
+
+
+class RetryBudget:
+    """Attempt count and deadline for one request."""
+
+    def __init__(self, request_type):
+        self.deadline = time.monotonic() + request_deadline(request_type)
+        self.max_attempts = getattr(settings, "AI_MAX_ATTEMPTS", 3)
+        self.attempts = 0
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def attempt_timeout(self):
+        """Timeout for the next attempt: the per-request timeout, cut to the time left."""
+        self.attempts += 1
+        return max(0.0, min(getattr(settings, "AI_REQUEST_TIMEOUT", 30), self.remaining()))
+
+    def next_delay(self, exc):
+        """Backoff before retrying after *exc*, or ``None`` if it should not be retried."""
+        if not is_transient(exc) or self.attempts >= self.max_attempts:
+            return None
+        delay = backoff_delay(self.attempts)
+        if self.remaining() - delay < _MIN_ATTEMPT_SECONDS:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """Circuit breaker for one upstream endpoint, shared through the cache."""
+
+    def __init__(self, endpoint):
+        digest = hashlib.sha256(endpoint.encode()).hexdigest()[:16]
+        self._failures_key = f"ai-breaker:{digest}:failures"
+        self._opened_key = f"ai-breaker:{digest}:opened"
+        self._probe_key = f"ai-breaker:{digest}:probe"
+        self.threshold = getattr(settings, "AI_BREAKER_FAILURE_THRESHOLD", 5)
+        self.reset_timeout = getattr(settings, "AI_BREAKER_RESET_TIMEOUT", 30)
+        self.probing = False  # this caller holds the half-open probe
+
+    def _cache(self):
+        return caches[getattr(settings, "AI_LIMITS_CACHE_ALIAS", "default")]
+
+    def _state(self, opened_at):
+        if opened_at is None:
+            return CLOSED
+        if time.time() - opened_at < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    def state(self):
+        return self._state(self._cache().get(self._opened_key))
+
+    def allow(self):
+        """Return whether a call may go upstream now (claiming the probe when half-open)."""
+        if not self.threshold:
+            return True
+        cache = self._cache()
+        state = self._state(cache.get(self._opened_key))
+        if state == HALF_OPEN:
+            self.probing = cache.add(self._probe_key, 1, timeout=self.reset_timeout)
+            return self.probing
+        return state == CLOSED
+
+    def record_success(self):
+        if self.threshold:
+            self._cache().delete_many([self._failures_key, self._opened_key, self._probe_key])
+
+    def record_failure(self):
+        if not self.threshold:
+            return
+        cache = self._cache()
+        if cache.get(self._opened_key) is not None:
+            # Only a failed probe keeps the breaker open for another reset period;
+            # calls that were already in flight when it opened do not push it back.
+            if self.probing:
+                self.probing = False
+                cache.set(self._opened_key, time.time(), timeout=None)
+                cache.delete(self._probe_key)
+            return
+        cache.add(self._failures_key, 0, timeout=None)
+        try:
+            failures = cache.incr(self._failures_key)
+        except ValueError:
+            failures = 1
+            cache.set(self._failures_key, failures, timeout=None)
+        if failures >= self.threshold:
+            cache.set(self._opened_key, time.time(), timeout=None)
+
+    async def aallow(self):
+        if not self.threshold:
+            return True
+        cache = self._cache()
+        state = self._state(await cache.aget(self._opened_key))
+        if state == HALF_OPEN:
+            self.probing = await cache.aadd(self._probe_key, 1, timeout=self.reset_timeout)
+            return self.probing
+        return state == CLOSED
+
+    async def arecord_success(self):
+        if self.threshold:
+            await self._cache().adelete_many([self._failures_key, self._opened_key, self._probe_key])
+
+    async def arecord_failure(self):
+        if not self.threshold:
+            return
+        cache = self._cache()
+        if await cache.aget(self._opened_key) is not None:
+            if self.probing:
+                self.probing = False
+                await cache.aset(self._opened_key, time.time(), timeout=None)
+                await cache.adelete(self._probe_key)
+            return
+        await cache.aadd(self._failures_key, 0, timeout=None)
+        try:
+            failures = await cache.aincr(self._failures_key)
+        except ValueError:
+            failures = 1
+            await cache.aset(self._failures_key, failures, timeout=None)
+        if failures >= self.threshold:
+            await cache.aset(self._opened_key, time.time(), timeout=None)
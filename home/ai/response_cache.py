@@ -0,0 +1,84 @@
+"""
+Cache of AI responses for identical requests.
+
+Entries are keyed by a hash of (model, normalized prompt, temperature,
+max_tokens and any earlier conversation messages) and stored in the ``AI_RESPONSE_CACHE_ALIAS`` cache, whose
+TIMEOUT and MAX_ENTRIES bound their lifetime and number (the local-memory
+backend evicts least recently used entries first). Only successful responses
+are stored.
+"""
+import hashlib
+import json
+import logging
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_KEY_PREFIX = "ai-response:v1:"
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so trivially different copies of a prompt share an entry."""
+    return _WHITESPACE_RE.sub(" ", prompt).strip()
+
+
+def response_cache_key(model, prompt, temperature, max_tokens, history=None):
+    fields = [model, normalize_prompt(prompt), float(temperature), int(max_tokens)]
+    if history:
+        fields.append([[message["role"], normalize_prompt(message["content"])] for message in history])
+    payload = json.dumps(fields)
+    return _KEY_PREFIX + hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_response_cache():
+    try:
+        return caches[getattr(settings, "AI_RESPONSE_CACHE_ALIAS", "default")]
+    except InvalidCacheBackendError:
+        logger.warning("AI response cache alias is not configured; caching disabled.")
+        return None
+
+
+def is_cacheable(request_type, temperature, use_cache=None):
+    """
+    Decide whether a request may be answered from (and stored in) the cache.
+
+    *use_cache* forces the decision per call. Otherwise deterministic requests
+    (temperature 0) are always cacheable, and sampled ones unless their request
+    type is listed in ``AI_RESPONSE_CACHE_EXCLUDE_TYPES`` (by default the
+    chat and lesson-assist types, whose answers are meant to vary).
+    """
+    if use_cache is not None:
+        return use_cache
+    if not getattr(settings, "AI_RESPONSE_CACHE_TTL", 3600):
+        return False
+    if temperature == 0:
+        return True
+    excluded = getattr(settings, "AI_RESPONSE_CACHE_EXCLUDE_TYPES", ("general_chat", "lesson_assist"))
+    return request_type not in excluded
+
+
+def get_cached_response(key):
+    cache = get_response_cache()
+    return cache.get(key) if cache is not None else None
+
+
+def set_cached_response(key, text):
+    cache = get_response_cache()
+    if cache is not None and text:
+        cache.set(key, text)
+
+
+async def aget_cached_response(key):
+    cache = get_response_cache()
+    return await cache.aget(key) if cache is not None else None
+
+
+async def aset_cached_response(key, text):
+    cache = get_response_cache()
+    if cache is not None and text:
+        await cache.aset(key, text)
@@ -0,0 +1,265 @@
+"""
+Chunking and BM25 retrieval over extracted curriculum text.
+
+Curriculum text is split into overlapping word windows when it is extracted;
+each chunk's term counts are stored with it (``CurriculumChunk``) so building
+an index at request time never re-tokenizes documents. Only the chunks most
+relevant to the teacher's request are sent to the model.
+
+When an embedding backend is configured (see ``embeddings.py``), chunk vectors
+are stored alongside and the lexical and semantic rankings are fused.
+"""
+import logging
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.db.models import F
+
+from .embeddings import EmbeddingError, get_embedder
+from .prompting import count_tokens
+from .vector_store import build_vector_index, load_vectors, store_vectors, vector_path
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_WORD_SPAN_RE = re.compile(r"\S+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the their them "
+    "they this to was were will with what which who how can could should would do does did i you "
+    "we our your my me us please help".split()
+)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def tokenize(text):
+    """Lower-case word tokens with stopwords removed."""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def chunk_text(text, chunk_words=None, overlap_words=None):
+    """
+    Split *text* into overlapping windows of about *chunk_words* words.
+
+    Chunks are slices of the original string, so line breaks and formatting survive.
+    """
+    chunk_words = chunk_words or _setting("CURRICULUM_CHUNK_WORDS", 180)
+    if overlap_words is None:
+        overlap_words = _setting("CURRICULUM_CHUNK_OVERLAP", 30)
+    spans = [match.span() for match in _WORD_SPAN_RE.finditer(text)]
+    if not spans:
+        return []
+    step = max(1, chunk_words - overlap_words)
+    chunks = []
+    for start in range(0, len(spans), step):
+        window = spans[start:start + chunk_words]
+        chunks.append(text[window[0][0]:window[-1][1]])
+        if start + chunk_words >= len(spans):
+            break
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of documents, scored through a sparse inverted index."""
+
+    def __init__(self, term_counts, k1=1.5, b=0.75):
+        """*term_counts* is a list of ``{term: count}`` dicts, one per document."""
+        self.k1 = k1
+        self.b = b
+        self.size = len(term_counts)
+        self.lengths = [sum(counts.values()) for counts in term_counts]
+        self.average_length = (sum(self.lengths) / self.size) if self.size else 0.0
+        self.postings = {}
+        for doc_index, counts in enumerate(term_counts):
+            for term, count in counts.items():
+                self.postings.setdefault(term, []).append((doc_index, count))
+        self.idf = {
+            term: math.log(1 + (self.size - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def scores(self, query):
+        """Return ``{doc_index: score}`` for documents sharing at least one term with *query*."""
+        scores = {}
+        k1, b, average_length = self.k1, self.b, self.average_length or 1.0
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_index, count in self.postings[term]:
+                norm = k1 * (1 - b + b * self.lengths[doc_index] / average_length)
+                scores[doc_index] = scores.get(doc_index, 0.0) + idf * count * (k1 + 1) / (count + norm)
+        return scores
+
+    def top_k(self, query, k):
+        """Return up to *k* ``(doc_index, score)`` pairs, best first."""
+        ranked = sorted(self.scores(query).items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:k]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Merge several best-first lists of document indexes into one (RRF)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_index in enumerate(ranking):
+            fused[doc_index] = fused.get(doc_index, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused, key=lambda doc_index: (-fused[doc_index], doc_index))
+
+
+def select_within_budget(items, budget_tokens, text=lambda item: item, count=count_tokens):
+    """
+    Greedily keep *items* (best first) whose text fits in *budget_tokens*.
+
+    *count* measures text in tokens; the prompt builder's tokenizer by default,
+    so the selected context also fits when the prompt is assembled.
+    """
+    selected = []
+    used = 0
+    for item in items:
+        cost = count(text(item))
+        if used + cost > budget_tokens:
+            continue
+        selected.append(item)
+        used += cost
+    return selected
+
+
+# ---------------------------------------------------------------------------
+# Persistence
+# ---------------------------------------------------------------------------
+
+def store_chunks(curriculum_text):
+    """(Re)build the stored chunks for a ``CurriculumText`` row."""
+    from home.models import CurriculumChunk  # noqa: PLC0415
+
+    curriculum_text.chunks.all().delete()
+    if curriculum_text.error or not curriculum_text.text:
+        return []
+    texts = chunk_text(curriculum_text.text)
+    rows = [
+        CurriculumChunk(
+            curriculum_text=curriculum_text,
+            ordinal=ordinal,
+            text=chunk,
+            term_counts=dict(Counter(tokenize(chunk))),
+        )
+        for ordinal, chunk in enumerate(texts)
+    ]
+    rows = CurriculumChunk.objects.bulk_create(rows)
+    embedder = get_embedder()
+    if embedder is not None and texts:
+        try:
+            store_vectors(vector_path(curriculum_text.content_hash, curriculum_text.extractor_version, embedder),
+                          texts, embedder)
+        except EmbeddingError as exc:
+            # Vectors are rebuilt lazily the next time the index is loaded.
+            logger.warning("Could not embed curriculum chunks: %s", exc)
+    return rows
+
+
+def _load_vector_index(curriculum_texts, chunks, embedder):
+    """Build a ``VectorIndex`` whose rows line up with *chunks* (embedding any missing documents)."""
+    chunks_by_hash = {}
+    for chunk in chunks:
+        chunks_by_hash.setdefault(chunk['content_hash'], []).append(chunk['text'])
+    versions = {text.content_hash: text.extractor_version for text in curriculum_texts}
+    matrices = []
+    for content_hash, texts in chunks_by_hash.items():
+        path = vector_path(content_hash, versions[content_hash], embedder)
+        matrix = load_vectors(path, len(texts))
+        if matrix is None:
+            matrix = store_vectors(path, texts, embedder)
+        matrices.append(matrix)
+    return build_vector_index(matrices) if matrices else None
+
+
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+_INDEX_CACHE_SIZE = 32
+
+
+def clear_index_cache():
+    with _index_cache_lock:
+        _index_cache.clear()
+
+
+def load_index(curriculum_texts):
+    """
+    Return ``(chunks, bm25_index, vector_index)`` for the given ``CurriculumText`` rows.
+
+    Chunks are fully determined by file content, extractor version and chunk
+    settings, so built indexes are kept in a small per-process LRU keyed by
+    those and never need invalidating. ``vector_index`` is ``None`` when no
+    embedding backend is configured or embedding failed.
+    """
+    from home.models import CurriculumChunk  # noqa: PLC0415
+
+    embedder = get_embedder()
+    key = (
+        tuple(sorted((text.content_hash, text.extractor_version) for text in curriculum_texts)),
+        _setting("CURRICULUM_CHUNK_WORDS", 180),
+        _setting("CURRICULUM_CHUNK_OVERLAP", 30),
+        embedder.key if embedder is not None else None,
+    )
+    with _index_cache_lock:
+        if key in _index_cache:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+
+    for text in curriculum_texts:
+        if not text.error and text.text and not text.chunks.exists():
+            store_chunks(text)
+    chunks = list(
+        CurriculumChunk.objects.filter(curriculum_text__in=[text.pk for text in curriculum_texts])
+        .order_by('curriculum_text__content_hash', 'ordinal')
+        .values('ordinal', 'text', 'term_counts', content_hash=F('curriculum_text__content_hash'))
+    )
+    vector_index = None
+    if embedder is not None:
+        try:
+            vector_index = _load_vector_index(curriculum_texts, chunks, embedder)
+        except EmbeddingError as exc:
+            logger.warning("Semantic curriculum search unavailable, using keywords only: %s", exc)
+            # Not cached, so vectors are retried on the next request.
+            return chunks, BM25Index([chunk['term_counts'] for chunk in chunks]), None
+    loaded = (chunks, BM25Index([chunk['term_counts'] for chunk in chunks]), vector_index)
+    with _index_cache_lock:
+        _index_cache[key] = loaded
+        while len(_index_cache) > _INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return loaded
+
+
+def retrieve_chunks(curriculum_texts, query, top_k=None, budget_tokens=None):
+    """
+    Return the chunks most relevant to *query* that fit in *budget_tokens*.
+
+    Result is a list of chunk dicts (``content_hash``, ``ordinal``, ``text``) in
+    document order. Keyword (BM25) and, when configured, embedding rankings
+    are fused. Without a usable query, the opening chunks of each document
+    are used instead.
+    """
+    top_k = top_k or _setting("CURRICULUM_CONTEXT_TOP_K", 8)
+    if budget_tokens is None:
+        budget_tokens = _setting("CURRICULUM_CONTEXT_TOKEN_BUDGET", 3000)
+    chunks, index, vector_index = load_index(curriculum_texts)
+    rankings = [[doc_index for doc_index, _ in index.top_k(query, top_k)]]
+    if vector_index is not None and tokenize(query):
+        try:
+            query_vector = get_embedder().embed_query(query)
+        except EmbeddingError as exc:
+            logger.warning("Could not embed curriculum query: %s", exc)
+        else:
+            rankings.append([row for row, _ in vector_index.search(query_vector, top_k)])
+    ranked = [chunks[doc_index] for doc_index in reciprocal_rank_fusion(rankings)[:top_k]]
+    if not ranked:
+        ranked = sorted(chunks, key=lambda chunk: (chunk['ordinal'], chunk['content_hash']))[:top_k]
+
+    selected = select_within_budget(ranked, budget_tokens, text=lambda chunk: chunk['text'])
+    return sorted(selected, key=lambda chunk: (chunk['content_hash'], chunk['ordinal']))
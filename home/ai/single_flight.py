@@ -0,0 +1,226 @@
+"""
+Coalescing of concurrent identical AI requests ("single flight").
+
+The first request for a key becomes the leader and calls the model; identical
+requests arriving while it runs wait for its result instead of issuing their
+own call. Flights are tracked in memory per process (threads), with a
+separate registry per event loop for async views.
+
+With ``AI_SINGLE_FLIGHT_SHARED`` the leader also claims a lock in the AI
+response cache, and leaders in other processes wait for its published result.
+This only helps when that cache is shared between processes (database, Redis,
+memcached); with the default local-memory cache each process coalesces alone.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .response_cache import get_response_cache
+
+_LOCK_SUFFIX = ":flight-lock"
+_RESULT_SUFFIX = ":flight-result"
+_RESULT_TTL = 10  # seconds a published result stays readable for waiting processes
+_POLL_INTERVAL = 0.05
+
+_flights = {}
+_flights_lock = threading.Lock()
+_async_flights = weakref.WeakKeyDictionary()  # event loop -> {key: Future}
+
+
+def _wait_timeout():
+    """Longest a follower waits for a leader before calling the model itself."""
+    return getattr(settings, "AI_SINGLE_FLIGHT_WAIT", 65)
+
+
+def _shared_cache():
+    if not getattr(settings, "AI_SINGLE_FLIGHT_SHARED", False):
+        return None
+    return get_response_cache()
+
+
+class Flight:
+    """
+    One in-progress upstream call.
+
+    The leader may ``publish`` partial results (streamed tokens) before it
+    ``finish``-es with the final result; ``None`` means it gave up without one.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.parts = []
+        self.result = None
+        self.done = False
+
+    def publish(self, part):
+        with self._condition:
+            self.parts.append(part)
+            self._condition.notify_all()
+
+    def finish(self, result):
+        with self._condition:
+            if not self.done:
+                self.result = result
+                self.done = True
+                self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        """Return the leader's result, or ``None`` if it failed or *timeout* passed."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.done, _wait_timeout() if timeout is None else timeout)
+            return self.result
+
+    def follow(self, timeout=None):
+        """Yield published parts as they arrive until the flight finishes or *timeout* passes."""
+        deadline = time.monotonic() + (_wait_timeout() if timeout is None else timeout)
+        sent = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.done or len(self.parts) > sent,
+                                         max(0.0, deadline - time.monotonic()))
+                parts = self.parts[sent:]
+                done = self.done
+            yield from parts
+            sent += len(parts)
+            if done or not parts:
+                return
+
+
+def _claim_or_wait(cache, key, timeout):
+    """
+    Claim the cross-process lock for *key*, or wait for the process holding it.
+
+    Returns ``(result, claimed)``; both are falsy if the wait timed out.
+    """
+    deadline = time.monotonic() + timeout
+    waited = False
+    while True:
+        if cache.add(key + _LOCK_SUFFIX, os.getpid(), timeout=timeout):
+            # The leader we waited for may have published and released in between polls.
+            result = cache.get(key + _RESULT_SUFFIX) if waited else None
+            if result is not None:
+                cache.delete(key + _LOCK_SUFFIX)
+                return result, False
+            return None, True
+        result = cache.get(key + _RESULT_SUFFIX)
+        if result is not None or time.monotonic() >= deadline:
+            return result, False
+        waited = True
+        time.sleep(_POLL_INTERVAL)
+
+
+def _release(cache, key, result):
+    if result is not None:
+        cache.set(key + _RESULT_SUFFIX, result, timeout=_RESULT_TTL)
+    cache.delete(key + _LOCK_SUFFIX)
+
+
+@contextmanager
+def join(key):
+    """
+    Join the flight for *key*, yielding ``(flight, leader)``.
+
+    The leader calls the model and must ``finish`` the flight; everyone else
+    reads ``flight.wait()`` / ``flight.follow()``. When another process already
+    leads, the flight is finished with its result and nobody here is leader.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+    if not leader:
+        yield flight, False
+        return
+
+    cache = _shared_cache()
+    claimed = False
+    try:
+        if cache is not None:
+            remote, claimed = _claim_or_wait(cache, key, _wait_timeout())
+            if remote is not None:
+                flight.finish(remote)
+                leader = False
+        yield flight, leader
+    finally:
+        with _flights_lock:
+            if _flights.get(key) is flight:
+                del _flights[key]
+        flight.finish(None)
+        if claimed:
+            _release(cache, key, flight.result)
+
+
+def run(key, call):
+    """
+    Return ``(call(), False)``, or ``(result, True)`` when an identical call already
+    in flight supplied the result.
+    """
+    with join(key) as (flight, leader):
+        if leader:
+            result = call()
+            flight.finish(result)
+            return result, False
+        result = flight.wait()
+    if result is None:
+        return call(), False
+    return result, True
+
+
+async def _aclaim_or_wait(cache, key, timeout):
+    deadline = time.monotonic() + timeout
+    waited = False
+    while True:
+        if await cache.aadd(key + _LOCK_SUFFIX, os.getpid(), timeout=timeout):
+            result = await cache.aget(key + _RESULT_SUFFIX) if waited else None
+            if result is not None:
+                await cache.adelete(key + _LOCK_SUFFIX)
+                return result, False
+            return None, True
+        result = await cache.aget(key + _RESULT_SUFFIX)
+        if result is not None or time.monotonic() >= deadline:
+            return result, False
+        waited = True
+        await asyncio.sleep(_POLL_INTERVAL)
+
+
+async def arun(key, call):
+    """``run`` for coroutine functions, coalescing within the running event loop."""
+    loop = asyncio.get_running_loop()
+    flights = _async_flights.setdefault(loop, {})
+    future = flights.get(key)
+    if future is not None:
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), _wait_timeout())
+        except asyncio.TimeoutError:
+            result = None
+        if result is None:
+            return await call(), False
+        return result, True
+
+    future = flights[key] = loop.create_future()
+    cache = _shared_cache()
+    claimed = False
+    try:
+        if cache is not None:
+            remote, claimed = await _aclaim_or_wait(cache, key, _wait_timeout())
+            if remote is not None:
+                future.set_result(remote)
+                return remote, True
+        result = await call()
+        future.set_result(result)
+        return result, False
+    finally:
+        if flights.get(key) is future:
+            del flights[key]
+        if not future.done():
+            future.set_result(None)
+        if claimed:
+            if future.result() is not None:
+                await cache.aset(key + _RESULT_SUFFIX, future.result(), timeout=_RESULT_TTL)
+            await cache.adelete(key + _LOCK_SUFFIX)
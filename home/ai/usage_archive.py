@@ -0,0 +1,119 @@
+"""
+Archiving of old AIUsageLog rows.
+
+Rows older than the cutoff are read in primary-key order, one batch of at most
+``batch_size`` rows at a time (keyset pagination: ``id > last id``, no OFFSET
+scans). Each batch is written to its own compressed file, and only then deleted
+in a short transaction of its own, so no lock is held for long.
+
+Only rows already included in the rollups (id up to the rollup watermark) are
+archived, and the cutoff is moved back to the start of its day, so whole hour
+and day buckets are archived. The rollups thus stay complete. Should a bucket
+still lose only part of its rows (a row rolled up late into an old period), the
+rollup code keeps that bucket's rollup instead of recomputing it from the rows
+left.
+
+A run can be stopped at any point. Batch files are named after their first
+row id. A batch that was written but not deleted is therefore written again,
+under the same name, on the next run.
+
+Formats:
+- ``jsonl``: gzip-compressed JSON lines.
+- ``parquet``: columnar; needs the optional ``pyarrow`` package.
+"""
+import gzip
+import json
+import os
+import time
+from dataclasses import dataclass
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from home.models import AIUsageLog
+
+from .usage_rollups import day_start, rollup_watermark
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except Exception:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+FORMATS = ("jsonl", "parquet")
+_EXTENSIONS = {"jsonl": ".jsonl.gz", "parquet": ".parquet"}
+
+
+@dataclass
+class ArchiveResult:
+    rows: int = 0
+    files: int = 0
+    seconds: float = 0.0
+    held_back: int = 0  # old rows kept because they are not rolled up yet
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def _columns():
+    return [field.attname for field in AIUsageLog._meta.concrete_fields]
+
+
+def _write_jsonl(path, columns, rows):
+    with gzip.open(path, "wt", encoding="utf-8") as handle:
+        for row in rows:
+            handle.write(json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder))
+            handle.write("\n")
+
+
+def _write_parquet(path, columns, rows):
+    table = pyarrow.table({name: list(values) for name, values in zip(columns, zip(*rows))})
+    pyarrow.parquet.write_table(table, path, compression="zstd")
+
+
+def _write_batch(archive_dir, fmt, columns, rows):
+    path = os.path.join(archive_dir, f"ai_usage_log-{rows[0][0]:012d}{_EXTENSIONS[fmt]}")
+    partial = path + ".partial"
+    (_write_parquet if fmt == "parquet" else _write_jsonl)(partial, columns, rows)
+    os.replace(partial, path)
+    return path
+
+
+def archive_usage_logs(cutoff, archive_dir, batch_size=5000, fmt="jsonl", progress=None):
+    """
+    Move AIUsageLog rows created before the day of *cutoff* into files under
+    *archive_dir*. The cutoff is floored to the start of its (rollup) day.
+
+    *progress*, if given, is called with ``(path, rows)`` after each batch.
+    Raises ``ValueError`` for an unknown or unavailable format.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown archive format {fmt!r}; use one of {', '.join(FORMATS)}.")
+    if fmt == "parquet" and pyarrow is None:
+        raise ValueError("The parquet archive format needs pyarrow (pip install pyarrow).")
+    os.makedirs(archive_dir, exist_ok=True)
+
+    result = ArchiveResult()
+    start = time.monotonic()
+    watermark = rollup_watermark()
+    old_rows = AIUsageLog.objects.filter(created_at__lt=day_start(cutoff))
+    archivable = old_rows.filter(pk__lte=watermark)
+    columns = _columns()
+    last_id = 0
+    while True:
+        rows = list(archivable.filter(pk__gt=last_id).order_by("pk").values_list(*columns)[:batch_size])
+        if not rows:
+            break
+        path = _write_batch(archive_dir, fmt, columns, rows)
+        first_id, last_id = rows[0][0], rows[-1][0]
+        with transaction.atomic():
+            # The same filter over the batch's id range matches exactly the rows just written.
+            archivable.filter(pk__gte=first_id, pk__lte=last_id).delete()
+        result.rows += len(rows)
+        result.files += 1
+        if progress is not None:
+            progress(path, len(rows))
+    result.seconds = time.monotonic() - start
+    result.held_back = old_rows.count()
+    return result
@@ -0,0 +1,131 @@
+"""
+AIUsageLog writes, optionally buffered in memory.
+
+With ``AI_USAGE_LOG_BUFFER_SIZE`` set to 0 (the default) every record is
+written straight away. Otherwise records are collected per process and saved
+with one ``bulk_create`` when the buffer holds that many, or when its oldest
+record is ``AI_USAGE_LOG_FLUSH_INTERVAL`` seconds old (a timer thread makes
+sure quiet periods are flushed too). The buffer is flushed when the process
+exits normally and from gunicorn's ``worker_exit`` hook; records still buffered
+when a process is killed are lost.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_oldest = None  # monotonic time the oldest buffered record was added
+_timer = None
+
+
+def _buffer_size():
+    return getattr(settings, "AI_USAGE_LOG_BUFFER_SIZE", 0)
+
+
+def _flush_interval():
+    return getattr(settings, "AI_USAGE_LOG_FLUSH_INTERVAL", 5)
+
+
+def _build(fields):
+    from home.models import AIUsageLog  # noqa: PLC0415
+
+    return AIUsageLog(**fields)
+
+
+def _write(records):
+    from home.models import AIUsageLog  # noqa: PLC0415
+
+    try:
+        AIUsageLog.objects.bulk_create(records)
+    except Exception:  # noqa: BLE001
+        logger.warning("Dropped %s AI usage log records.", len(records), exc_info=True)
+
+
+def _take(force):
+    """Remove and return the buffered records if they are due (or *force*)."""
+    global _oldest, _timer
+    with _buffer_lock:
+        due = len(_buffer) >= _buffer_size() or (
+            _oldest is not None and time.monotonic() - _oldest >= _flush_interval())
+        if not _buffer or not (force or due):
+            return []
+        records = _buffer[:]
+        _buffer.clear()
+        _oldest = None
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+        return records
+
+
+def _append(record):
+    """Buffer *record*; return whether the buffer should be flushed now."""
+    global _oldest, _timer
+    with _buffer_lock:
+        _buffer.append(record)
+        if _oldest is None:
+            _oldest = time.monotonic()
+            _timer = threading.Timer(_flush_interval(), _flush_from_timer)
+            _timer.daemon = True
+            _timer.start()
+        return len(_buffer) >= _buffer_size() or time.monotonic() - _oldest >= _flush_interval()
+
+
+def _flush_from_timer():
+    try:
+        flush(force=False)
+    finally:
+        # Timer threads are not reused; don't leave their connections open.
+        connections.close_all()
+
+
+def flush(force=True):
+    """Write buffered records; with ``force=False`` only if a threshold was reached."""
+    records = _take(force)
+    if records:
+        _write(records)
+    return len(records)
+
+
+def pending():
+    """Number of records waiting in the buffer."""
+    with _buffer_lock:
+        return len(_buffer)
+
+
+def log_usage(**fields):
+    """Record one AI interaction; best-effort – never raises."""
+    try:
+        record = _build(fields)
+    except Exception:  # noqa: BLE001
+        logger.warning("Invalid AI usage log record.", exc_info=True)
+        return
+    if not _buffer_size():
+        _write([record])
+    elif _append(record):
+        flush(force=False)
+
+
+async def alog_usage(**fields):
+    """``log_usage`` for async code; only flushes touch the database."""
+    if not _buffer_size():
+        await sync_to_async(log_usage)(**fields)
+        return
+    try:
+        record = _build(fields)
+    except Exception:  # noqa: BLE001
+        logger.warning("Invalid AI usage log record.", exc_info=True)
+        return
+    if _append(record):
+        await sync_to_async(flush)(force=False)
+
+
+atexit.register(flush)
@@ -0,0 +1,132 @@
+"""
+Hourly and daily rollups of AIUsageLog (see ``AIUsageRollup``).
+
+``update_rollups`` recomputes only the hours and days that received log rows
+since the last run, i.e. rows with an id above the highest ``last_log_id``
+rolled up so far. Buffered rows saved late therefore still land in the bucket
+of their ``created_at``. A bucket is rebuilt from its raw rows, because
+latency percentiles cannot be merged from partial results. A bucket whose
+rolled-up rows were partly archived is therefore never rebuilt (see
+``has_archived_rows``); rows added to it later are left out of its rollup.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from home.models import AIUsageLog, AIUsageRollup
+
+_PERIODS = (
+    (AIUsageRollup.HOUR, TruncHour, timedelta(hours=1)),
+    (AIUsageRollup.DAY, TruncDay, timedelta(days=1)),
+)
+_LOG_FIELDS = ('request_type', 'user_id', 'success', 'latency_ms', 'prompt_length', 'response_length',
+               'prompt_tokens', 'completion_tokens')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list (0 for an empty one)."""
+    if not sorted_values:
+        return 0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def rollup_watermark():
+    """Highest AIUsageLog id already included in the rollups."""
+    return AIUsageRollup.objects.aggregate(last=Max('last_log_id'))['last'] or 0
+
+
+def day_start(moment):
+    """Start of the daily bucket holding *moment* (midnight in the current time zone, as ``TruncDay``)."""
+    return timezone.localtime(moment).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def has_archived_rows(period, start, length):
+    """Whether rows already rolled up into the bucket are missing from AIUsageLog (archived)."""
+    rolled_up = AIUsageRollup.objects.filter(period=period, period_start=start, user=None).aggregate(
+        requests=Sum('request_count'), last_log_id=Max('last_log_id'))
+    if not rolled_up['requests']:
+        return False
+    remaining = AIUsageLog.objects.filter(created_at__gte=start, created_at__lt=start + length,
+                                          pk__lte=rolled_up['last_log_id']).count()
+    return remaining < rolled_up['requests']
+
+
+class _Bucket:
+    def __init__(self):
+        self.latencies = []
+        self.success_count = 0
+        self.prompt_length_total = 0
+        self.response_length_total = 0
+        self.prompt_tokens_total = 0
+        self.completion_tokens_total = 0
+
+    def add(self, success, latency_ms, prompt_length, response_length, prompt_tokens, completion_tokens):
+        self.latencies.append(latency_ms)
+        self.success_count += bool(success)
+        self.prompt_length_total += prompt_length
+        self.response_length_total += response_length
+        self.prompt_tokens_total += prompt_tokens or 0
+        self.completion_tokens_total += completion_tokens or 0
+
+    def to_rollup(self, **fields):
+        self.latencies.sort()
+        return AIUsageRollup(
+            request_count=len(self.latencies),
+            success_count=self.success_count,
+            latency_p50_ms=percentile(self.latencies, 0.50),
+            latency_p95_ms=percentile(self.latencies, 0.95),
+            latency_p99_ms=percentile(self.latencies, 0.99),
+            prompt_length_total=self.prompt_length_total,
+            response_length_total=self.response_length_total,
+            prompt_tokens_total=self.prompt_tokens_total,
+            completion_tokens_total=self.completion_tokens_total,
+            **fields,
+        )
+
+
+def _rebuild_bucket(period, start, length, last_log_id):
+    if has_archived_rows(period, start, length):
+        return False
+    buckets = defaultdict(_Bucket)
+    rows = (AIUsageLog.objects
+            .filter(created_at__gte=start, created_at__lt=start + length, pk__lte=last_log_id)
+            .values_list(*_LOG_FIELDS))
+    for request_type, user_id, *values in rows.iterator(chunk_size=5000):
+        buckets[request_type, None].add(*values)
+        if user_id is not None:
+            buckets[request_type, user_id].add(*values)
+    with transaction.atomic():
+        AIUsageRollup.objects.filter(period=period, period_start=start).delete()
+        AIUsageRollup.objects.bulk_create([
+            bucket.to_rollup(period=period, period_start=start, request_type=request_type, user_id=user_id,
+                             last_log_id=last_log_id)
+            for (request_type, user_id), bucket in buckets.items()
+        ])
+    return True
+
+
+def update_rollups(rebuild=False):
+    """
+    Bring the rollups up to date with AIUsageLog and return the number of
+    ``(period, start)`` buckets recomputed. *rebuild* recomputes every bucket
+    that still has raw rows (rollups of archived periods are kept, including
+    periods archived only in part).
+    """
+    watermark = 0 if rebuild else rollup_watermark()
+    last_log_id = AIUsageLog.objects.aggregate(last=Max('pk'))['last'] or 0
+    if last_log_id <= watermark:
+        return 0
+    new_rows = AIUsageLog.objects.filter(pk__gt=watermark, pk__lte=last_log_id)
+    rebuilt = 0
+    for period, trunc, length in _PERIODS:
+        starts = (new_rows.annotate(bucket=trunc('created_at')).order_by()
+                  .values_list('bucket', flat=True).distinct())
+        for start in sorted(starts):
+            rebuilt += _rebuild_bucket(period, start, length, last_log_id)
+    return rebuilt
@@ -0,0 +1,117 @@
+"""
+Float32 embedding matrices for curriculum chunks, stored as ``.npy`` files.
+
+There is one file per extracted file version and embedder, with rows in chunk
+ordinal order. Files are never modified in place (identical uploads share them),
+so they are opened memory-mapped and need no invalidation beyond deletion when
+the text itself is discarded.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .embeddings import np
+
+
+def vector_dir():
+    return Path(getattr(settings, "CURRICULUM_VECTOR_DIR", Path(settings.BASE_DIR) / "vector_index"))
+
+
+def vector_path(content_hash, extractor_version, embedder):
+    return vector_dir() / f"{content_hash}-v{extractor_version}-{embedder.key}.npy"
+
+
+def store_vectors(path, texts, embedder):
+    """Embed *texts* and atomically write the matrix to *path*; returns the matrix."""
+    matrix = embedder.embed_documents(list(texts))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            np.save(tmp_file, matrix)
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    return matrix
+
+
+def load_vectors(path, rows):
+    """Memory-map the matrix at *path*, or return ``None`` if it is missing or stale."""
+    try:
+        matrix = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    return matrix if matrix.shape[0] == rows else None
+
+
+def discard_vectors(content_hashes):
+    directory = vector_dir()
+    for content_hash in content_hashes:
+        for path in directory.glob(f"{content_hash}-*.npy"):
+            path.unlink(missing_ok=True)
+
+
+class VectorIndex:
+    """
+    Cosine top-k over L2-normalized rows.
+
+    Small matrices are searched exhaustively. With ``ivf_lists`` set, rows are
+    clustered with spherical k-means and a query only scores the rows in its
+    ``nprobe`` nearest clusters (an inverted-file index).
+    """
+
+    def __init__(self, matrix, ivf_lists=0, nprobe=8):
+        self.matrix = matrix
+        self.nprobe = nprobe
+        self.centroids = None
+        self.lists = []
+        if ivf_lists and matrix.shape[0] > ivf_lists:
+            self._train_ivf(ivf_lists)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def _train_ivf(self, list_count, iterations=10):
+        matrix = np.asarray(self.matrix, dtype=np.float32)
+        rng = np.random.default_rng(0)
+        centroids = matrix[rng.choice(len(matrix), size=list_count, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(matrix @ centroids.T, axis=1)
+            for list_index in range(list_count):
+                members = matrix[assignments == list_index]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[list_index] = centroid / (np.linalg.norm(centroid) or 1.0)
+        assignments = np.argmax(matrix @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [np.flatnonzero(assignments == list_index) for list_index in range(list_count)]
+
+    def search(self, query, k):
+        """Return up to *k* ``(row, score)`` pairs, best first."""
+        if not len(self) or k <= 0:
+            return []
+        if self.centroids is None:
+            candidates = None
+            scores = self.matrix @ query
+        else:
+            probe = np.argsort(-(self.centroids @ query))[:self.nprobe]
+            candidates = np.concatenate([self.lists[list_index] for list_index in probe])
+            scores = self.matrix[candidates] @ query
+        k = min(k, len(scores))
+        if not k:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        rows = best if candidates is None else candidates[best]
+        return [(int(row), float(scores[index])) for row, index in zip(rows, best)]
+
+
+def build_vector_index(matrices):
+    """Combine per-document matrices (in chunk order) into one ``VectorIndex``."""
+    matrix = matrices[0] if len(matrices) == 1 else np.concatenate(matrices)
+    ivf_min_rows = getattr(settings, "CURRICULUM_VECTOR_IVF_MIN_ROWS", 20000)
+    ivf_lists = int(len(matrix) ** 0.5) if ivf_min_rows and len(matrix) >= ivf_min_rows else 0
+    return VectorIndex(matrix, ivf_lists=ivf_lists, nprobe=getattr(settings, "CURRICULUM_VECTOR_IVF_NPROBE", 8))
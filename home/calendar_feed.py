@@ -0,0 +1,86 @@
+"""
+Calendar events for FullCalendar, one visible date range at a time.
+
+The calendar pages no longer embed a teacher's whole history. FullCalendar
+fetches ``home:calendar_events`` with the ``start``/``end`` of the range it
+shows, and gets back the dated lessons and scheduled lessons in that range.
+
+- Rows are read as tuples (``values_list``). Lessons come from the
+  ``(user, lesson_date, title)`` index without touching the table, and
+  schedules from the ``(user, scheduled_date, ...)`` unique index.
+- Event URLs are filled into a path reversed once per request, not once per row.
+"""
+from datetime import datetime, timedelta
+
+from django.urls import reverse
+from django.utils.dateparse import parse_date
+
+from .models import LessonPlan, LessonSchedule
+
+MAX_RANGE = timedelta(days=400)  # a year view plus the padding weeks FullCalendar adds
+_PK_PLACEHOLDER = 2147483647
+
+
+def parse_range(start, end):
+    """
+    Return the ``(start, end)`` dates of a FullCalendar request, or ``None``.
+
+    FullCalendar sends ISO 8601 timestamps (``2024-05-26T00:00:00+02:00``); only
+    the date part is used. ``end`` is exclusive.
+    """
+    try:
+        start, end = parse_date((start or "")[:10]), parse_date((end or "")[:10])
+    except ValueError:
+        return None
+    if start is None or end is None or not start < end <= start + MAX_RANGE:
+        return None
+    return start, end
+
+
+def _detail_url_template():
+    return reverse("home:lesson_detail", args=[_PK_PLACEHOLDER]).replace(str(_PK_PLACEHOLDER), "{}")
+
+
+def lesson_events(lessons, start, end):
+    """Events for the lessons of *lessons* dated in ``[start, end)``."""
+    url = _detail_url_template()
+    return [
+        {"title": title, "start": lesson_date.isoformat(), "url": url.format(pk), "allDay": True}
+        for pk, title, lesson_date in lessons.for_calendar(start, end)
+    ]
+
+
+def schedule_events(schedules, start, end):
+    """Events for the entries of *schedules* (``LessonSchedule``) in ``[start, end)``."""
+    url = _detail_url_template()
+    rows = schedules.filter(scheduled_date__gte=start, scheduled_date__lt=end).values_list(
+        "lesson_plan_id", "lesson_plan__title", "scheduled_date", "start_time", "end_time", "class_period", "status")
+    events = []
+    for lesson_pk, title, day, start_time, end_time, class_period, status in rows:
+        event = {"title": f"{title} ({class_period})" if class_period else title, "url": url.format(lesson_pk)}
+        if start_time:
+            event["start"] = datetime.combine(day, start_time).isoformat()
+            if end_time:
+                event["end"] = datetime.combine(day, end_time).isoformat()
+        else:
+            event["start"], event["allDay"] = day.isoformat(), True
+        if status == "cancelled":
+            event["classNames"] = ["fc-event-cancelled"]
+        events.append(event)
+    return events
+
+
+def calendar_events(user, start, end, lessons=None):
+    """
+    Lesson and schedule events of *user* in ``[start, end)``.
+
+    *lessons* narrows the lessons (and the schedules of those lessons), e.g. to
+    the current search on "My Lesson Plans"; by default all of the user's
+    lessons are included.
+    """
+    schedules = LessonSchedule.objects.filter(user=user)
+    if lessons is None:
+        lessons = LessonPlan.objects.filter(user=user)
+    else:
+        schedules = schedules.filter(lesson_plan__in=lessons.values("pk"))
+    return lesson_events(lessons, start, end) + schedule_events(schedules, start, end)
@@ -0,0 +1,92 @@
+"""
+Data for the home dashboard, in two queries.
+
+- One query for the lesson, material and resource counts (scalar subqueries).
+- One query for the recent, upcoming and draft lesson lists: each list's ids
+  come from a sliced subquery, and the rows are split back into lists here.
+
+The result is cached per user for ``DASHBOARD_CACHE_TTL`` seconds (0 turns
+caching off) in the default cache. Saving or deleting one of the user's
+lessons, materials or resources drops the entry (see ``home.signals``).
+Bulk ``update()``/``bulk_create()`` send no signals, so the entry expires
+after the TTL instead. With several worker processes and the default
+local-memory cache, other processes also see a change only after the TTL.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import LessonPlan, Material, Resource
+
+RECENT_COUNT = 5
+UPCOMING_COUNT = 5
+UPCOMING_DAYS = 7
+DRAFT_COUNT = 3
+
+
+def _cache_key(user_id):
+    return f"home_dashboard:{user_id}"
+
+
+def _count(model):
+    """Scalar subquery counting the outer user's rows of *model*."""
+    rows = model.objects.filter(user=OuterRef("pk")).order_by().values("user").annotate(n=Count("pk")).values("n")
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def _counts(user):
+    return get_user_model().objects.filter(pk=user.pk).values(
+        total_lessons=_count(LessonPlan),
+        total_materials=_count(Material),
+        total_resources=_count(Resource),
+    ).get()
+
+
+def _lesson_lists(user, today):
+    last_day = today + timedelta(days=UPCOMING_DAYS)
+    upcoming = Q(lesson_date__gte=today, lesson_date__lte=last_day)
+    lessons = LessonPlan.objects.filter(user=user, is_archived=False)
+    ids = lessons.values("pk")
+    # Each list's ids come from its own sliced subquery, so the database can stop
+    # after the first few rows instead of ranking every lesson of the user.
+    rows = LessonPlan.objects.for_list().filter(
+        Q(pk__in=ids.order_by("-updated_at", "-pk")[:RECENT_COUNT])
+        | Q(pk__in=ids.filter(upcoming).order_by("lesson_date", "title", "pk")[:UPCOMING_COUNT])
+        | Q(pk__in=ids.filter(is_draft=True).order_by("-updated_at", "-pk")[:DRAFT_COUNT])
+    ).order_by()
+    newest_first = sorted(rows, key=lambda lesson: (lesson.updated_at, lesson.pk), reverse=True)
+    # Every row of a list is in ``rows`` and any extra row ranks below them, so
+    # the head of each ordering is exactly that list.
+    return {
+        "recent_lessons": newest_first[:RECENT_COUNT],
+        "upcoming_lessons": sorted(
+            (lesson for lesson in rows if lesson.lesson_date and today <= lesson.lesson_date <= last_day),
+            key=lambda lesson: (lesson.lesson_date, lesson.title, lesson.pk),
+        )[:UPCOMING_COUNT],
+        "draft_lessons": [lesson for lesson in newest_first if lesson.is_draft][:DRAFT_COUNT],
+    }
+
+
+def dashboard_data(user):
+    """Counts and lesson lists for *user*'s dashboard, from the cache when possible."""
+    today = timezone.now().date()
+    ttl = getattr(settings, "DASHBOARD_CACHE_TTL", 60)
+    if ttl:
+        cached = cache.get(_cache_key(user.pk))
+        # "Upcoming" depends on the day, so an entry from an earlier day is stale.
+        if cached is not None and cached["date"] == today:
+            return cached["data"]
+    data = {**_counts(user), **_lesson_lists(user, today)}
+    if ttl:
+        cache.set(_cache_key(user.pk), {"date": today, "data": data}, ttl)
+    return data
+
+
+def invalidate_dashboard(user_id):
+    """Drop the cached dashboard of the user with *user_id*."""
+    cache.delete(_cache_key(user_id))
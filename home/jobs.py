@@ -0,0 +1,162 @@
+"""
+Minimal database-backed job queue.
+
+Jobs are rows in ``BackgroundJob``; handlers are plain functions registered with
+``@job_handler('<kind>')`` (see ``home/tasks.py``) and executed by
+``python manage.py run_worker``. Claiming uses a conditional UPDATE so several
+workers can share the table on SQLite and PostgreSQL alike. Long-running
+handlers call ``heartbeat()`` so their job is not mistaken for one whose worker died.
+"""
+import contextvars
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+# The job the current worker is running, for heartbeat().
+_current_job = contextvars.ContextVar('current_job', default=None)
+
+
+def job_handler(kind):
+    """Register *func* as the handler for jobs of the given kind."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, delay_seconds=0, max_attempts=3):
+    """Add a job to the queue and return it."""
+    return BackgroundJob.objects.create(
+        kind=kind,
+        payload=payload or {},
+        run_after=timezone.now() + timedelta(seconds=delay_seconds),
+        max_attempts=max_attempts,
+    )
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _lock_timeout():
+    return getattr(settings, 'JOB_LOCK_TIMEOUT_SECONDS', 600)
+
+
+def heartbeat():
+    """
+    Refresh the lock of the running job, so ``requeue_stale_jobs`` leaves it alone.
+
+    Cheap to call often: the row is updated at most every tenth of the lock timeout.
+    Does nothing outside a job.
+    """
+    job = _current_job.get()
+    if job is None:
+        return
+    now = timezone.now()
+    if job.locked_at is not None and now - job.locked_at < timedelta(seconds=_lock_timeout() / 10):
+        return
+    if BackgroundJob.objects.filter(pk=job.pk, status=BackgroundJob.RUNNING, locked_by=job.locked_by) \
+            .update(locked_at=now):
+        job.locked_at = now
+
+
+def requeue_stale_jobs():
+    """
+    Return jobs whose worker died mid-run to the queue.
+
+    A job that has used up its attempts is marked failed instead, so a job that
+    kills its worker (e.g. out of memory while parsing a file) is not retried forever.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=_lock_timeout())
+    stale = BackgroundJob.objects.filter(status=BackgroundJob.RUNNING, locked_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=BackgroundJob.FAILED, locked_by='', locked_at=None, finished_at=now,
+        last_error="WorkerLost: the worker stopped while running the job",
+    )
+    if failed:
+        logger.error("Marked %d stale job(s) failed after their last attempt", failed)
+    return stale.update(status=BackgroundJob.QUEUED, locked_by='', locked_at=None)
+
+
+def claim_next_job(worker_id):
+    """Atomically mark the next due job as running for *worker_id*, or return None."""
+    now = timezone.now()
+    candidates = (
+        BackgroundJob.objects.filter(status=BackgroundJob.QUEUED, run_after__lte=now)
+        .order_by('run_after', 'pk')
+        .values_list('pk', flat=True)[:10]
+    )
+    for pk in candidates:
+        claimed = BackgroundJob.objects.filter(pk=pk, status=BackgroundJob.QUEUED).update(
+            status=BackgroundJob.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return BackgroundJob.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """
+    Execute a claimed job and record the outcome, rescheduling failures with backoff.
+
+    The outcome is dropped if the job lost its lock meanwhile (it was requeued
+    as stale and may be running elsewhere).
+    """
+    handler = JOB_HANDLERS.get(job.kind)
+    worker_id = job.locked_by
+    token = _current_job.set(job)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind '{job.kind}'")
+        handler(**job.payload)
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Job %s failed", job)
+        job.last_error = f"{type(exc).__name__}: {exc}"
+        if handler is not None and job.attempts < job.max_attempts:
+            job.status = BackgroundJob.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=30 * 2 ** (job.attempts - 1))
+        else:
+            job.status = BackgroundJob.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = BackgroundJob.DONE
+        job.finished_at = timezone.now()
+    finally:
+        _current_job.reset(token)
+    job.locked_by = ''
+    job.locked_at = None
+    finished = BackgroundJob.objects.filter(pk=job.pk, status=BackgroundJob.RUNNING, locked_by=worker_id).update(
+        status=job.status, run_after=job.run_after, last_error=job.last_error, finished_at=job.finished_at,
+        locked_by='', locked_at=None,
+    )
+    if not finished:
+        logger.warning("Job %s lost its lock while running; its outcome is discarded", job)
+        return False
+    return job.status == BackgroundJob.DONE
+
+
+def run_pending_jobs(worker_id=None, max_jobs=None):
+    """Run due jobs until the queue is empty (or *max_jobs* ran); return the number run."""
+    import home.tasks  # noqa: F401, PLC0415 - registers handlers
+
+    worker_id = worker_id or default_worker_id()
+    ran = 0
+    while max_jobs is None or ran < max_jobs:
+        job = claim_next_job(worker_id)
+        if job is None:
+            break
+        run_job(job)
+        ran += 1
+    return ran
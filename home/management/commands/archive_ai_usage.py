@@ -0,0 +1,47 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from home.ai.usage_archive import FORMATS, archive_usage_logs
+
+
+class Command(BaseCommand):
+    help = ("Move AI usage logs older than the retention period into compressed archive files. "
+            "Rollups are kept; run rollup_ai_usage first so recent rows can be archived.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Keep this many days of logs (default: AI_USAGE_RETENTION_DAYS).")
+        parser.add_argument('--archive-dir', default=None,
+                            help="Directory for archive files (default: AI_USAGE_ARCHIVE_DIR).")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Rows per archive file and delete transaction.")
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else settings.AI_USAGE_RETENTION_DAYS
+        archive_dir = options['archive_dir'] or settings.AI_USAGE_ARCHIVE_DIR
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        def progress(path, rows):
+            self.stdout.write(f"  {os.path.basename(path)}: {rows} row(s)")
+
+        try:
+            result = archive_usage_logs(timezone.now() - timedelta(days=days), archive_dir,
+                                        batch_size=options['batch_size'], fmt=options['format'],
+                                        progress=progress if options['verbosity'] > 1 else None)
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {result.rows} row(s) to {result.files} file(s) in {result.seconds:.1f}s "
+            f"({result.rows_per_second:.0f} rows/s)."
+        ))
+        if result.held_back:
+            self.stdout.write(self.style.WARNING(
+                f"{result.held_back} old row(s) are not rolled up yet and were kept; run rollup_ai_usage."
+            ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from home.ai.curriculum_text import extract_and_store
+from home.models import Curriculum
+
+
+class Command(BaseCommand):
+    help = "Extract and cache text for existing curriculum uploads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only backfill curricula owned by this username.")
+        parser.add_argument('--force', action='store_true',
+                            help="Re-extract even when cached text exists for the current extractor version.")
+
+    def handle(self, *args, **options):
+        curriculums = Curriculum.objects.exclude(file='').exclude(file__isnull=True).order_by('pk')
+        if options['user']:
+            curriculums = curriculums.filter(user__username=options['user'])
+
+        stored = failed = missing = 0
+        for curriculum in curriculums.iterator():
+            try:
+                result = extract_and_store(curriculum, force=options['force'])
+            except OSError as exc:
+                missing += 1
+                self.stderr.write(f"  {curriculum.file.name}: file unavailable ({exc})")
+                continue
+            if result.error:
+                failed += 1
+                self.stderr.write(f"  {curriculum.file.name}: {result.error}")
+            else:
+                stored += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {stored} curriculum file(s); {failed} failed extraction, {missing} missing."
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from home.ai.batch_review import review_lessons
+from home.models import LessonPlan
+
+
+class Command(BaseCommand):
+    help = "Review many lesson plans with the AI assistant and store the reviews (unchanged lessons are skipped)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('lesson_ids', nargs='*', type=int, help="Lesson plan ids to review.")
+        parser.add_argument('--teacher', help="Review all non-archived lessons of this username.")
+        parser.add_argument('--subject', help="With --teacher: only lessons of this subject name.")
+        parser.add_argument('--force', action='store_true', help="Review lessons even if their review is current.")
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help="Reviews in flight at once (default: AI_REVIEW_BATCH_CONCURRENCY).")
+
+    def handle(self, *args, **options):
+        lesson_ids = list(options['lesson_ids'])
+        if options['teacher']:
+            lessons = LessonPlan.objects.filter(user__username=options['teacher'], is_archived=False)
+            if options['subject']:
+                lessons = lessons.filter(subject__name=options['subject'])
+            lesson_ids += lessons.order_by('pk').values_list('pk', flat=True)
+        if not lesson_ids:
+            raise CommandError("Give lesson ids or --teacher.")
+
+        result = review_lessons(lesson_ids, force=options['force'], concurrency=options['concurrency'])
+
+        for pk, message in {**result.failed, **result.rejected}.items():
+            self.stderr.write(f"  lesson {pk}: {message}")
+        if result.missing:
+            self.stderr.write(f"  not found: {', '.join(map(str, result.missing))}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Reviewed {len(result.reviewed)} lesson(s); {len(result.unchanged)} unchanged, "
+            f"{len(result.failed)} failed, {len(result.rejected)} rejected. {result.seconds:.1f}s wall-clock "
+            f"vs {result.sequential_seconds:.1f}s of review time one after another."
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from home.ai.usage_rollups import update_rollups
+
+
+class Command(BaseCommand):
+    help = "Update the hourly and daily AI usage rollups with new AIUsageLog rows (run it periodically, e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Recompute every rollup from the raw logs instead of only new rows.")
+
+    def handle(self, *args, **options):
+        rebuilt = update_rollups(rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f"Recomputed {rebuilt} rollup period(s)."))
@@ -0,0 +1,37 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from home.jobs import default_worker_id, requeue_stale_jobs, run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued background jobs (curriculum text extraction, etc.)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Drain the queue once and exit instead of polling.")
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help="Seconds to wait between polls when the queue is empty.")
+
+    def handle(self, *args, **options):
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        worker_id = default_worker_id()
+        self.stdout.write(f"Worker {worker_id} started.")
+        total = 0
+        while not self._stopping:
+            requeue_stale_jobs()
+            ran = run_pending_jobs(worker_id=worker_id)
+            total += ran
+            if options['once']:
+                break
+            if not ran:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker_id} stopped after {total} job(s)."))
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
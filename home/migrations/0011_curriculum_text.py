@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0010_lessonplan_is_archived_lessonplan_is_draft'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='curriculum',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='SHA-256 of the uploaded file contents', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='CurriculumText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('extractor_version', models.PositiveSmallIntegerField()),
+                ('text', models.TextField(blank=True, default='')),
+                ('error', models.CharField(blank=True, default='', help_text='User-facing extraction error, if extraction failed', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Curriculum Text',
+                'verbose_name_plural': 'Curriculum Texts',
+                'unique_together': {('content_hash', 'extractor_version')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0012_background_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurriculumPageText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('extractor_version', models.PositiveSmallIntegerField()),
+                ('page_number', models.PositiveIntegerField(help_text='Zero-based page index')),
+                ('text', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'unique_together': {('content_hash', 'extractor_version', 'page_number')},
+            },
+        ),
+    ]
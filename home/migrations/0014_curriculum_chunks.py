@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0013_curriculum_page_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurriculumChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordinal', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('term_counts', models.JSONField(default=dict)),
+                ('curriculum_text', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='home.curriculumtext')),
+            ],
+            options={
+                'ordering': ['curriculum_text', 'ordinal'],
+                'unique_together': {('curriculum_text', 'ordinal')},
+            },
+        ),
+    ]
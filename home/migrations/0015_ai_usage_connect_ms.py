@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0014_curriculum_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='connect_ms',
+            field=models.IntegerField(default=0, help_text='Part of latency spent opening connections (0 when a pooled connection was reused)'),
+        ),
+    ]
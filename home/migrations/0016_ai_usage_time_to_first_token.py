@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0015_ai_usage_connect_ms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='time_to_first_token_ms',
+            field=models.IntegerField(blank=True, help_text='Streamed responses only: wait before the first token', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0016_ai_usage_time_to_first_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='cache_hit',
+            field=models.BooleanField(default=False, help_text='Answered from the response cache'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0017_ai_usage_cache_hit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='coalesced',
+            field=models.BooleanField(default=False, help_text='Shared the upstream call of an identical concurrent request'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0018_ai_usage_coalesced'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='queue_wait_ms',
+            field=models.IntegerField(default=0, help_text='Part of latency spent waiting for a free upstream slot'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0019_ai_usage_queue_wait'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='completion_tokens',
+            field=models.IntegerField(blank=True, help_text='From the API usage field (estimated if not reported)', null=True),
+        ),
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='prompt_tokens',
+            field=models.IntegerField(blank=True, help_text='From the API usage field (estimated if not reported)', null=True),
+        ),
+    ]
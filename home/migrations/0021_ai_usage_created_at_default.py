@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0020_ai_usage_token_counts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aiusagelog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('home', '0021_ai_usage_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('period_start', models.DateTimeField()),
+                ('request_type', models.CharField(choices=[('lesson_assist', 'Lesson Assistance'), ('lesson_review', 'Lesson Review'), ('general_chat', 'General Chat')], max_length=50)),
+                ('request_count', models.IntegerField(default=0)),
+                ('success_count', models.IntegerField(default=0)),
+                ('latency_p50_ms', models.IntegerField(default=0)),
+                ('latency_p95_ms', models.IntegerField(default=0)),
+                ('latency_p99_ms', models.IntegerField(default=0)),
+                ('prompt_length_total', models.BigIntegerField(default=0)),
+                ('response_length_total', models.BigIntegerField(default=0)),
+                ('prompt_tokens_total', models.BigIntegerField(default=0)),
+                ('completion_tokens_total', models.BigIntegerField(default=0)),
+                ('last_log_id', models.BigIntegerField(default=0, help_text='Highest AIUsageLog id included when computed')),
+            ],
+            options={
+                'verbose_name': 'AI Usage Rollup',
+                'verbose_name_plural': 'AI Usage Rollups',
+                'ordering': ['-period_start', 'request_type'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='aiusagelog',
+            index=models.Index(fields=['created_at', 'request_type'], name='home_aiusage_created_type'),
+        ),
+        migrations.AddIndex(
+            model_name='aiusagelog',
+            index=models.Index(fields=['user', 'created_at'], name='home_aiusage_user_created'),
+        ),
+        migrations.AddField(
+            model_name='aiusagerollup',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ai_usage_rollups', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='aiusagerollup',
+            index=models.Index(fields=['period', 'period_start'], name='home_airollup_period_start'),
+        ),
+        migrations.AddIndex(
+            model_name='aiusagerollup',
+            index=models.Index(fields=['user', 'period', 'period_start'], name='home_airollup_user_period'),
+        ),
+    ]
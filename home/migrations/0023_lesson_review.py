@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0022_ai_usage_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LessonReview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feedback', models.TextField()),
+                ('content_hash', models.CharField(help_text='Hash of the model and review prompt', max_length=64)),
+                ('model', models.CharField(blank=True, default='', max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('lesson', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ai_review', to='home.lessonplan')),
+            ],
+        ),
+    ]
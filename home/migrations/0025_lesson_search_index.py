@@ -0,0 +1,66 @@
+from django.db import migrations
+
+# Frozen copies of home.search.FTS_TABLE and SEARCH_FIELDS.
+FTS_TABLE = 'home_lessonplan_fts'
+SEARCH_FIELDS = (
+    'title', 'description', 'learning_objectives', 'essential_question', 'materials_needed',
+    'opening_activity', 'main_instruction', 'guided_practice', 'independent_practice',
+    'closing_activity', 'formative_assessment', 'summative_assessment',
+    'differentiation_strategies', 'homework_assignment', 'extension_activities', 'reflection_notes',
+)
+PG_INDEX = 'home_lessonplan_search'
+
+
+def _sqlite_statements():
+    columns = ', '.join(SEARCH_FIELDS)
+    new = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+    old = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+    insert = f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new});"
+    delete = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old});"
+    return [
+        # External content: the text stays in home_lessonplan, the FTS table only holds the index.
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({columns}, "
+        f"content='home_lessonplan', content_rowid='id', tokenize='porter unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON home_lessonplan BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON home_lessonplan BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF {columns} ON home_lessonplan "
+        f"BEGIN {delete} {insert} END",
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+    ]
+
+
+def create_search_index(apps, schema_editor):
+    """Create (or restore) the lesson full-text index; safe to run again."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in _sqlite_statements():
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+
+        # Must match home.search.search_vector() for queries to use the index.
+        vector = (SearchVector('title', weight='A', config='english')
+                  + SearchVector(*SEARCH_FIELDS[1:], weight='B', config='english'))
+        schema_editor.add_index(apps.get_model('home', 'LessonPlan'), GinIndex(vector, name=PG_INDEX))
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for suffix in ('insert', 'delete', 'update'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX IF EXISTS {PG_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0024_conversations'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, reverse_code=drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0025_lesson_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lessonplan',
+            index=models.Index(fields=['user', 'lesson_date', 'title'], name='home_lesson_user_date'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0026_lesson_calendar_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='curriculum',
+            index=models.Index(fields=['user', 'updated_at'], name='home_curric_user_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='lessonplan',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['user', 'updated_at'], name='home_lesson_user_active'),
+        ),
+        migrations.AddIndex(
+            model_name='lessonplan',
+            index=models.Index(condition=models.Q(('is_archived', False), ('is_draft', True)), fields=['user', 'updated_at'], name='home_lesson_user_drafts'),
+        ),
+        migrations.AddIndex(
+            model_name='lessonplan',
+            index=models.Index(condition=models.Q(('is_archived', False), ('is_draft', False)), fields=['user', 'updated_at'], name='home_lesson_user_published'),
+        ),
+        migrations.AddIndex(
+            model_name='lessonplan',
+            index=models.Index(condition=models.Q(('is_archived', True)), fields=['user', 'updated_at'], name='home_lesson_user_archived'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['user', 'updated_at'], name='home_material_user_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['user', 'updated_at'], name='home_resource_user_updated'),
+        ),
+    ]
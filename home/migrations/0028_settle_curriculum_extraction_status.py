@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# Frozen copy of home.ai.ai_utils.EXTRACTOR_VERSION when this migration was written.
+EXTRACTOR_VERSION = 3
+UNSETTLED = ('pending', 'processing')
+
+
+def settle_extraction_status(apps, schema_editor):
+    """
+    Give curricula uploaded before the job queue (0012 marked them all pending)
+    a final status: ready or failed when their text is already stored, otherwise
+    an extraction job. Curricula that already have a queued or running job are left alone.
+    """
+    BackgroundJob = apps.get_model('home', 'BackgroundJob')
+    Curriculum = apps.get_model('home', 'Curriculum')
+    CurriculumText = apps.get_model('home', 'CurriculumText')
+
+    with_job = {
+        payload.get('curriculum_id')
+        for payload in BackgroundJob.objects.filter(
+            kind='extract_curriculum', status__in=('queued', 'running'),
+        ).values_list('payload', flat=True)
+    }
+    stored_errors = dict(
+        CurriculumText.objects.filter(extractor_version=EXTRACTOR_VERSION).values_list('content_hash', 'error')
+    )
+    jobs = []
+    for curriculum in Curriculum.objects.filter(extraction_status__in=UNSETTLED).exclude(pk__in=with_job):
+        if not curriculum.file:
+            status, error = 'failed', "No file is attached to this curriculum."
+        elif curriculum.content_hash and curriculum.content_hash in stored_errors:
+            error = stored_errors[curriculum.content_hash]
+            status = 'failed' if error else 'ready'
+        else:
+            jobs.append(BackgroundJob(kind='extract_curriculum',
+                                      payload={'curriculum_id': curriculum.pk, 'force': False}))
+            continue
+        Curriculum.objects.filter(pk=curriculum.pk).update(
+            extraction_status=status, extraction_progress=100, extraction_error=error)
+    BackgroundJob.objects.bulk_create(jobs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0027_per_user_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(settle_extraction_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0029_ai_limits_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lessonreview',
+            name='error',
+            field=models.CharField(blank=True, default='', help_text='Why the lesson could not be reviewed, if its prompt was rejected', max_length=255),
+        ),
+    ]
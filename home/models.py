@@ -35,6 +35,21 @@ class Standard(models.Model):
         return f"{self.code}: {self.description[:50]}..."
 
 
+class LessonPlanQuerySet(models.QuerySet):
+    # What list pages render, including __str__; the lesson text fields are left unloaded.
+    LIST_FIELDS = ('title', 'subject', 'subject__name', 'grade', 'grade__level', 'lesson_date', 'duration',
+                   'user', 'created_at', 'updated_at', 'is_public', 'is_template', 'is_draft', 'is_archived')
+
+    def for_list(self):
+        """Lessons for list pages: list fields only, with subject and grade joined in."""
+        return self.select_related('subject', 'grade').only(*self.LIST_FIELDS)
+
+    def for_calendar(self, start, end):
+        """``(pk, title, lesson_date)`` of the lessons dated in ``[start, end)``, read from the calendar index."""
+        return self.filter(lesson_date__gte=start, lesson_date__lt=end).order_by('lesson_date').values_list(
+            'pk', 'title', 'lesson_date')
+
+
 class LessonPlan(models.Model):
     """Comprehensive lesson plan model"""
     
@@ -89,11 +104,27 @@ class LessonPlan(models.Model):
     
     # Standards alignment
     standards = models.ManyToManyField(Standard, blank=True, related_name='lesson_plans')
+
+    objects = LessonPlanQuerySet.as_manager()
     
     class Meta:
         ordering = ['-updated_at']
         verbose_name = "Lesson Plan"
         verbose_name_plural = "Lesson Plans"
+        indexes = [
+            # Covers the calendar feed: a date range of one user's lessons, titles included.
+            models.Index(fields=['user', 'lesson_date', 'title'], name='home_lesson_user_date'),
+            # Newest-first lists by status. Boolean filters compile to bare ``"is_draft"`` /
+            # ``NOT "is_archived"`` terms, which an index only serves as a partial-index condition.
+            models.Index(fields=['user', 'updated_at'], condition=models.Q(is_archived=False),
+                         name='home_lesson_user_active'),
+            models.Index(fields=['user', 'updated_at'], condition=models.Q(is_archived=False, is_draft=True),
+                         name='home_lesson_user_drafts'),
+            models.Index(fields=['user', 'updated_at'], condition=models.Q(is_archived=False, is_draft=False),
+                         name='home_lesson_user_published'),
+            models.Index(fields=['user', 'updated_at'], condition=models.Q(is_archived=True),
+                         name='home_lesson_user_archived'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.subject.name} ({self.grade.level})"
@@ -131,6 +162,7 @@ class Material(models.Model):
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [models.Index(fields=['user', 'updated_at'], name='home_material_user_updated')]
 
     def __str__(self):
         return self.title
@@ -166,6 +198,7 @@ class Resource(models.Model):
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [models.Index(fields=['user', 'updated_at'], name='home_resource_user_updated')]
 
     def __str__(self):
         return self.title
@@ -173,10 +206,28 @@ class Resource(models.Model):
 
 class Curriculum(models.Model):
     """Curriculum documents and standards"""
+
+    EXTRACTION_PENDING = 'pending'
+    EXTRACTION_PROCESSING = 'processing'
+    EXTRACTION_READY = 'ready'
+    EXTRACTION_FAILED = 'failed'
+    EXTRACTION_STATUS_CHOICES = [
+        (EXTRACTION_PENDING, 'Pending'),
+        (EXTRACTION_PROCESSING, 'Processing'),
+        (EXTRACTION_READY, 'Ready'),
+        (EXTRACTION_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True, default='')
     file = models.FileField(upload_to="curriculums/", null=True)
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True,
+                                    help_text="SHA-256 of the uploaded file contents")
+    extraction_status = models.CharField(max_length=20, choices=EXTRACTION_STATUS_CHOICES,
+                                         default=EXTRACTION_PENDING)
+    extraction_progress = models.PositiveSmallIntegerField(default=0, help_text="Extraction progress (0-100)")
+    extraction_error = models.CharField(max_length=255, blank=True, default='')
     
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='curriculums', null=True, blank=True)
     grade = models.ForeignKey(Grade, on_delete=models.CASCADE, related_name='curriculums', null=True, blank=True)
@@ -189,11 +240,93 @@ class Curriculum(models.Model):
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [models.Index(fields=['user', 'updated_at'], name='home_curric_user_updated')]
 
     def __str__(self):
         return self.title
 
 
+class CurriculumText(models.Model):
+    """Extracted text for one curriculum file version, shared by identical uploads."""
+    content_hash = models.CharField(max_length=64)
+    extractor_version = models.PositiveSmallIntegerField()
+    text = models.TextField(blank=True, default='')
+    error = models.CharField(max_length=255, blank=True, default='',
+                             help_text="User-facing extraction error, if extraction failed")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['content_hash', 'extractor_version']
+        verbose_name = "Curriculum Text"
+        verbose_name_plural = "Curriculum Texts"
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} (v{self.extractor_version})"
+
+
+class CurriculumChunk(models.Model):
+    """Overlapping passage of curriculum text, with term counts for BM25 retrieval."""
+    curriculum_text = models.ForeignKey(CurriculumText, on_delete=models.CASCADE, related_name='chunks')
+    ordinal = models.PositiveIntegerField()
+    text = models.TextField()
+    term_counts = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ['curriculum_text', 'ordinal']
+        unique_together = ['curriculum_text', 'ordinal']
+
+    def __str__(self):
+        return f"{self.curriculum_text} #{self.ordinal}"
+
+
+class CurriculumPageText(models.Model):
+    """OCR result for a single page, kept while a scanned document is being processed."""
+    content_hash = models.CharField(max_length=64)
+    extractor_version = models.PositiveSmallIntegerField()
+    page_number = models.PositiveIntegerField(help_text="Zero-based page index")
+    text = models.TextField(blank=True, default='')
+
+    class Meta:
+        unique_together = ['content_hash', 'extractor_version', 'page_number']
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} p{self.page_number}"
+
+
+class BackgroundJob(models.Model):
+    """Database-backed job queue processed by the ``run_worker`` management command."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50, help_text="Registered handler name")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after', 'pk']
+        indexes = [models.Index(fields=['status', 'run_after'], name='home_job_status_run_after')]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
 class AIUsageLog(models.Model):
     """Structured log of AI interactions for analytics and debugging."""
 
@@ -210,21 +343,144 @@ class AIUsageLog(models.Model):
     prompt_length = models.IntegerField(default=0, help_text="Character count of the prompt")
     used_curriculum_context = models.BooleanField(default=False)
     response_length = models.IntegerField(default=0, help_text="Character count of the response")
+    prompt_tokens = models.IntegerField(null=True, blank=True,
+                                        help_text="From the API usage field (estimated if not reported)")
+    completion_tokens = models.IntegerField(null=True, blank=True,
+                                            help_text="From the API usage field (estimated if not reported)")
     latency_ms = models.IntegerField(default=0, help_text="Time taken in milliseconds")
+    time_to_first_token_ms = models.IntegerField(null=True, blank=True,
+                                                 help_text="Streamed responses only: wait before the first token")
+    queue_wait_ms = models.IntegerField(default=0, help_text="Part of latency spent waiting for a free "
+                                                             "upstream slot")
+    connect_ms = models.IntegerField(default=0, help_text="Part of latency spent opening connections "
+                                                          "(0 when a pooled connection was reused)")
+    cache_hit = models.BooleanField(default=False, help_text="Answered from the response cache")
+    coalesced = models.BooleanField(default=False, help_text="Shared the upstream call of an identical "
+                                                             "concurrent request")
     success = models.BooleanField(default=True)
     failure_reason = models.CharField(max_length=200, blank=True, default='')
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the record is built, not saved: buffered records are saved later.
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ['-created_at']
         verbose_name = "AI Usage Log"
         verbose_name_plural = "AI Usage Logs"
+        indexes = [
+            models.Index(fields=['created_at', 'request_type'], name='home_aiusage_created_type'),
+            models.Index(fields=['user', 'created_at'], name='home_aiusage_user_created'),
+        ]
 
     def __str__(self):
         status = "OK" if self.success else "FAIL"
         return f"[{status}] {self.get_request_type_display()} – {self.created_at:%Y-%m-%d %H:%M}"
 
 
+class AIUsageRollup(models.Model):
+    """
+    AIUsageLog statistics for one hour or day and request type, maintained by
+    ``manage.py rollup_ai_usage``. Rows without a user cover all users.
+    """
+
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIOD_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day')]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    period_start = models.DateTimeField()
+    request_type = models.CharField(max_length=50, choices=AIUsageLog.REQUEST_TYPE_CHOICES)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name='ai_usage_rollups')
+    request_count = models.IntegerField(default=0)
+    success_count = models.IntegerField(default=0)
+    latency_p50_ms = models.IntegerField(default=0)
+    latency_p95_ms = models.IntegerField(default=0)
+    latency_p99_ms = models.IntegerField(default=0)
+    prompt_length_total = models.BigIntegerField(default=0)
+    response_length_total = models.BigIntegerField(default=0)
+    prompt_tokens_total = models.BigIntegerField(default=0)
+    completion_tokens_total = models.BigIntegerField(default=0)
+    last_log_id = models.BigIntegerField(default=0, help_text="Highest AIUsageLog id included when computed")
+
+    class Meta:
+        ordering = ['-period_start', 'request_type']
+        verbose_name = "AI Usage Rollup"
+        verbose_name_plural = "AI Usage Rollups"
+        indexes = [
+            models.Index(fields=['period', 'period_start'], name='home_airollup_period_start'),
+            models.Index(fields=['user', 'period', 'period_start'], name='home_airollup_user_period'),
+        ]
+
+    def __str__(self):
+        scope = self.user or "all users"
+        return f"{self.get_request_type_display()} {self.period} {self.period_start:%Y-%m-%d %H:%M} ({scope})"
+
+    @property
+    def success_rate(self):
+        return self.success_count / self.request_count if self.request_count else 0
+
+    @property
+    def avg_prompt_length(self):
+        return self.prompt_length_total // self.request_count if self.request_count else 0
+
+    @property
+    def avg_response_length(self):
+        return self.response_length_total // self.request_count if self.request_count else 0
+
+
+class LessonReview(models.Model):
+    """Latest AI review of a lesson plan and a hash of the content it reviewed."""
+    lesson = models.OneToOneField(LessonPlan, on_delete=models.CASCADE, related_name='ai_review')
+    feedback = models.TextField()
+    content_hash = models.CharField(max_length=64, help_text="Hash of the model and review prompt")
+    model = models.CharField(max_length=200, blank=True, default='')
+    error = models.CharField(max_length=255, blank=True, default='',
+                             help_text="Why the lesson could not be reviewed, if its prompt was rejected")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Review of {self.lesson}"
+
+
+class Conversation(models.Model):
+    """Multi-turn AI chat of one user, optionally about one lesson plan."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ai_conversations')
+    lesson = models.ForeignKey(LessonPlan, on_delete=models.CASCADE, null=True, blank=True,
+                               related_name='ai_conversations')
+    request_type = models.CharField(max_length=50, choices=AIUsageLog.REQUEST_TYPE_CHOICES,
+                                    default='general_chat')
+    summary = models.TextField(blank=True, default='', help_text="Condensed earlier turns sent instead of them")
+    summarized_through = models.BigIntegerField(default=0, help_text="Id of the last turn folded into the summary")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-updated_at']
+
+    def __str__(self):
+        return f"{self.get_request_type_display()} conversation of {self.user}"
+
+
+class ConversationTurn(models.Model):
+    """One message of a Conversation."""
+    USER = 'user'
+    ASSISTANT = 'assistant'
+    ROLE_CHOICES = [(USER, 'User'), (ASSISTANT, 'Assistant')]
+
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='turns')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    content = models.TextField()
+    tokens = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['pk']
+
+    def __str__(self):
+        return f"{self.role}: {self.content[:50]}"
+
+
 class LessonSchedule(models.Model):
     """Schedule lessons for specific dates/times"""
     lesson_plan = models.ForeignKey(LessonPlan, on_delete=models.CASCADE, related_name='schedules')
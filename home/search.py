@@ -0,0 +1,92 @@
+"""
+Full-text search over lesson plans.
+
+- SQLite: lessons are indexed in the FTS5 table ``home_lessonplan_fts``. Triggers
+  on ``home_lessonplan`` keep it in sync (migration 0025), so bulk updates are
+  indexed too. Ranked with bm25.
+- PostgreSQL: a weighted ``SearchVector`` over the same fields, backed by a GIN
+  expression index, ranked with ``SearchRank``.
+- Other databases: ``icontains`` over the fields, newest first.
+
+A query is split into words that must all occur; the last word also matches
+as a prefix, so results keep up with the search box while a teacher types.
+Title matches rank above matches in the lesson body.
+
+Django rebuilds a table on SQLite for most AlterField/RemoveField operations,
+which drops its triggers; a migration that does so for LessonPlan must create
+the search index again afterwards (see ``create_search_index`` in 0025).
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.db import connection
+from django.db.models import F, Q, Value
+
+from .models import LessonPlan
+
+FTS_TABLE = "home_lessonplan_fts"
+BODY_FIELDS = (
+    "description", "learning_objectives", "essential_question", "materials_needed",
+    "opening_activity", "main_instruction", "guided_practice", "independent_practice",
+    "closing_activity", "formative_assessment", "summative_assessment",
+    "differentiation_strategies", "homework_assignment", "extension_activities", "reflection_notes",
+)
+SEARCH_FIELDS = ("title", *BODY_FIELDS)
+SEARCH_CONFIG = "english"  # PostgreSQL text search configuration
+TITLE_WEIGHT = 10.0  # bm25 weight of the title relative to each body field
+
+_WORD_RE = re.compile(r"\w+")
+_MAX_TERMS = 16
+
+
+def _terms(query):
+    return [term.lower() for term in _WORD_RE.findall(query)][:_MAX_TERMS]
+
+
+def search_vector():
+    """Weighted PostgreSQL search vector of a lesson (the GIN index is built on this expression)."""
+    from django.contrib.postgres.search import SearchVector  # noqa: PLC0415 - needs psycopg
+
+    return (SearchVector("title", weight="A", config=SEARCH_CONFIG)
+            + SearchVector(*BODY_FIELDS, weight="B", config=SEARCH_CONFIG))
+
+
+def _fts_match(terms):
+    # Quoted terms are taken literally by FTS5, so user input cannot inject query syntax.
+    return " ".join(f'"{term}"' for term in terms) + "*"
+
+
+def _tsquery(terms):
+    from django.contrib.postgres.search import SearchQuery  # noqa: PLC0415
+
+    return SearchQuery(" & ".join(terms) + ":*", search_type="raw", config=SEARCH_CONFIG)
+
+
+def search_lessons(queryset, query):
+    """
+    Lessons of *queryset* matching the words of *query*, annotated with
+    ``search_rank`` (higher is better; order with ``order_by('-search_rank')``).
+    """
+    terms = _terms(query)
+    if not terms:
+        return queryset.annotate(search_rank=Value(0.0)).none()
+    if connection.vendor == "sqlite":
+        # A join, so the FTS index is searched once and bm25 comes from the same scan. The
+        # unary + keeps SQLite from probing the index once per lesson row instead.
+        weights = ", ".join([str(TITLE_WEIGHT)] + ["1.0"] * len(BODY_FIELDS))
+        table = LessonPlan._meta.db_table
+        return queryset.extra(
+            select={"search_rank": f"-bm25({FTS_TABLE}, {weights})"},
+            tables=[FTS_TABLE],
+            where=[f"{table}.id = +{FTS_TABLE}.rowid", f"{FTS_TABLE} MATCH %s"],
+            params=[_fts_match(terms)],
+        )
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.search import SearchRank  # noqa: PLC0415
+
+        search_query = _tsquery(terms)
+        return (queryset.annotate(search_vector=search_vector()).filter(search_vector=search_query)
+                .annotate(search_rank=SearchRank(F("search_vector"), search_query)))
+    return (queryset.filter(reduce(or_, (Q(**{f"{field}__icontains": query}) for field in SEARCH_FIELDS)))
+            .annotate(search_rank=Value(0.0)))
@@ -0,0 +1,49 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .ai.ai_utils import compute_content_hash
+from .ai.curriculum_text import discard_orphaned_texts
+from .dashboard import invalidate_dashboard
+from .models import Curriculum, LessonPlan, Material, Resource
+from .tasks import enqueue_curriculum_extraction
+
+
+@receiver(pre_save, sender=Curriculum)
+def hash_new_curriculum_upload(sender, instance, **kwargs):
+    """Hash freshly uploaded files and remember the hash being replaced."""
+    instance._previous_content_hash = ''
+    if instance.pk:
+        instance._previous_content_hash = (
+            sender.objects.filter(pk=instance.pk).values_list('content_hash', flat=True).first() or ''
+        )
+    if instance.file and not instance.file._committed:
+        instance.content_hash = compute_content_hash(instance.file)
+    elif not instance.file:
+        instance.content_hash = ''
+
+
+@receiver(post_save, sender=Curriculum)
+def queue_curriculum_extraction(sender, instance, **kwargs):
+    """Discard text for a replaced file and extract the new one in the background."""
+    previous_hash = getattr(instance, '_previous_content_hash', '')
+    if previous_hash == instance.content_hash:
+        return
+    if previous_hash:
+        discard_orphaned_texts([previous_hash])
+    if instance.content_hash:
+        enqueue_curriculum_extraction(instance)
+
+
+@receiver(post_delete, sender=Curriculum)
+def discard_deleted_curriculum_text(sender, instance, **kwargs):
+    discard_orphaned_texts([instance.content_hash])
+
+
+@receiver(post_save, sender=LessonPlan)
+@receiver(post_delete, sender=LessonPlan)
+@receiver(post_save, sender=Material)
+@receiver(post_delete, sender=Material)
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+def invalidate_user_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard(instance.user_id)
@@ -0,0 +1,69 @@
+"""
+Server-Sent Events responses that stream under both WSGI and ASGI.
+
+Django serves a synchronous iterator incrementally under WSGI, but under ASGI
+it buffers the whole iterator before sending anything. For ASGI requests the
+iterator is therefore run in its own thread and relayed through an async
+generator, one chunk at a time.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.http import StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(event, data):
+    """Encode one SSE frame; *data* is sent as JSON so newlines survive."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _relay_from_thread(iterator):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:  # event loop already closed
+            stop.set()
+
+    def pump():
+        try:
+            for chunk in iterator:
+                if stop.is_set():
+                    break
+                put(chunk)
+        except Exception:  # noqa: BLE001
+            logger.exception("Event stream failed")
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            # This thread is not managed by Django's request lifecycle.
+            connections.close_all()
+            put(done)
+
+    threading.Thread(target=pump, name="event-stream", daemon=True).start()
+    try:
+        while (chunk := await queue.get()) is not done:
+            yield chunk
+    finally:
+        stop.set()
+
+
+def event_stream_response(request, events):
+    """Return a ``text/event-stream`` response for an iterator of SSE frames."""
+    if isinstance(request, ASGIRequest):
+        events = _relay_from_thread(events)
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
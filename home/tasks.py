@@ -0,0 +1,79 @@
+"""Background job handlers executed by ``python manage.py run_worker``."""
+import logging
+
+from django.conf import settings
+
+from .ai.ai_utils import EXTRACTOR_VERSION
+from .ai.batch_review import review_content_hash, review_lessons
+from .ai.curriculum_text import extract_and_store, set_extraction_state
+from .jobs import enqueue, heartbeat, job_handler
+from .models import BackgroundJob, Curriculum, CurriculumText, LessonReview
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_curriculum_extraction(curriculum, force=False):
+    """Queue text extraction for a newly uploaded curriculum file."""
+    cached = None
+    if not force:
+        cached = CurriculumText.objects.filter(
+            content_hash=curriculum.content_hash, extractor_version=EXTRACTOR_VERSION,
+        ).first()
+    if cached is not None:
+        # An identical file was already extracted; nothing to do in the background.
+        set_extraction_state(
+            curriculum,
+            extraction_status=Curriculum.EXTRACTION_FAILED if cached.error else Curriculum.EXTRACTION_READY,
+            extraction_progress=100,
+            extraction_error=cached.error,
+        )
+        return None
+    set_extraction_state(curriculum, extraction_status=Curriculum.EXTRACTION_PENDING,
+                         extraction_progress=0, extraction_error='')
+    return enqueue('extract_curriculum', {'curriculum_id': curriculum.pk, 'force': force})
+
+
+@job_handler('extract_curriculum')
+def extract_curriculum(curriculum_id, force=False):
+    curriculum = Curriculum.objects.filter(pk=curriculum_id).first()
+    if curriculum is None or not curriculum.file:
+        logger.info("Skipping extraction for missing curriculum %s", curriculum_id)
+        return
+    try:
+        # Progress reports keep the job's lock fresh during long PDF/OCR extractions.
+        extract_and_store(curriculum, force=force, heartbeat=heartbeat)
+    except OSError:
+        set_extraction_state(curriculum, extraction_status=Curriculum.EXTRACTION_FAILED,
+                             extraction_error="The uploaded file could not be read.")
+        raise
+
+
+def enqueue_lesson_review(lesson):
+    """
+    Queue a new AI review of *lesson* if its content changed since the stored review.
+
+    The job runs ``AI_LESSON_REVIEW_DELAY`` seconds later and reviews the lesson as
+    it is then, so a burst of autosaves needs only one queued job.
+    """
+    if not getattr(settings, 'NVIDIA_API_KEY', None):
+        return None
+    stored_hash = LessonReview.objects.filter(lesson=lesson).values_list('content_hash', flat=True).first()
+    if stored_hash == review_content_hash(lesson):
+        return None
+    if BackgroundJob.objects.filter(kind='review_lesson', status=BackgroundJob.QUEUED,
+                                    payload__lesson_id=lesson.pk).exists():
+        return None
+    return enqueue('review_lesson', {'lesson_id': lesson.pk},
+                   delay_seconds=getattr(settings, 'AI_LESSON_REVIEW_DELAY', 60))
+
+
+@job_handler('review_lesson')
+def review_lesson_job(lesson_id):
+    result = review_lessons([lesson_id])
+    if result.rejected:
+        # The prompt itself is refused; retrying cannot help, and the rejection is stored on the review.
+        logger.info("Review of lesson %s rejected: %s", lesson_id, result.rejected[lesson_id])
+        return
+    if result.failed:
+        # Raising lets the job queue retry with backoff (e.g. while the AI service is down).
+        raise RuntimeError(result.failed[lesson_id])
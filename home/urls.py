@@ -19,6 +19,7 @@ urlpatterns = [
     path('lesson/<int:pk>/archive/', views.archive_lesson, name='archive_lesson'),
     path('lesson/autosave/', views.autosave_lesson, name='autosave_lesson'),
     path('lesson/<int:pk>/autosave/', views.autosave_lesson, name='autosave_lesson_pk'),
+    path('lesson/assist/stream/', views.lesson_assist_stream, name='lesson_assist_stream'),
 
     # Resources and Materials
     path('myresources/', views.myresources, name='myresources'),
@@ -33,7 +34,9 @@ urlpatterns = [
     path('mycurriculums/', views.mycurriculums, name='mycurriculums'),
     path('upload-curriculum/', views.upload_curriculum, name='upload_curriculum'),
     path('curriculum/<int:pk>/delete/', views.delete_curriculum, name='delete_curriculum'),
+    path('curriculum/<int:pk>/status/', views.curriculum_status, name='curriculum_status'),
     path('mycalendar/', views.mycalendar_view, name='mycalendar'),
+    path('calendar/events/', views.calendar_events, name='calendar_events'),
 
     # Authentication
     path('signup/', views.signup, name='signup'),
@@ -76,6 +79,7 @@ urlpatterns = [
 
     # AI Features
     path('ai_chat/', views.ai_chat, name='ai_chat'),
+    path('ai-usage/', views.ai_usage_dashboard, name='ai_usage_dashboard'),
 
     # Profile
     path('profile/', views.profile_view, name='profile'),
@@ -1,16 +1,24 @@
+from contextlib import closing
 from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy, reverse # Added for redirecting with reverse
 from django import forms
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, set_response_etag
+from django.utils.http import urlencode
 from django.views.decorators.http import require_POST
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import Max, Sum
 from django.conf import settings
 import json
 import os
@@ -19,13 +27,22 @@ import logging
 from .forms import (LessonPlanForm, MaterialForm, ResourceForm, CurriculumForm,
                    CustomUserCreationForm, LessonSearchForm, UserProfileForm)
 from .models import (LessonPlan, Material, Resource, Curriculum,
-                     Subject, Grade, Standard, LessonSchedule)
-from .ai.ai_review import review_lesson, generate_ai_response
+                     Subject, Grade, Standard, LessonSchedule, AIUsageRollup)
+from .ai.ai_review import MAX_TOKENS, agenerate_ai_result, stream_ai_response
+from .ai.batch_review import review_content_hash
+from .ai.conversations import get_conversation, history_messages, messages_tokens, record_exchange
 from .ai.ai_utils import (
-    extract_text_from_file,
     SUPPORTED_CURRICULUM_EXTENSIONS,
     SUPPORTED_CURRICULUM_MIME_TYPES,
 )
+from .ai.curriculum_text import ExtractionPending, get_curriculum_text_record
+from .ai.prompting import build_prompt, context_token_budget
+from .ai.retrieval import retrieve_chunks
+from . import calendar_feed
+from .dashboard import dashboard_data
+from .search import search_lessons
+from .streaming import event_stream_response, sse_event
+from .tasks import enqueue_lesson_review
 
 logger = logging.getLogger(__name__)
 
@@ -36,34 +53,63 @@ _MAX_CURRICULUM_SIZE_BYTES = 20 * 1024 * 1024  # 20 MB
 _CURRICULUM_CONTENT_TYPES_LENIENT = {"application/octet-stream", ""}
 
 
-def _build_curriculum_context(user, selected_curriculum_ids):
-    context_parts = []
+def async_login_required(view_func):
+    """``login_required`` for async views (Django 4.2's decorator only wraps sync views)."""
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        # Resolving the lazy request.user hits the session/auth tables.
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def _build_curriculum_context(user, selected_curriculum_ids, query='', budget_tokens=None):
+    """
+    Return ``(context_text, warnings)`` holding the curriculum passages most
+    relevant to *query*, within *budget_tokens* (default: the configured
+    context token budget).
+    """
     extraction_warnings = []
     if not selected_curriculum_ids:
         return "", extraction_warnings
 
+    titles_by_hash = {}
+    curriculum_texts = []
     selected_curriculums = Curriculum.objects.filter(user=user, id__in=selected_curriculum_ids)
     for curriculum_doc in selected_curriculums:
         if not curriculum_doc.file:
             continue
         try:
-            with curriculum_doc.file.open('rb') as file_stream:
-                extracted = extract_text_from_file(
-                    file_stream,
-                    curriculum_doc.file.name or curriculum_doc.title,
-                    content_type=getattr(curriculum_doc.file.file, "content_type", None),
-                )
-            if extracted:
-                context_parts.append(f"\n\n--- From Curriculum: {curriculum_doc.title} ---\n{extracted}")
+            stored = get_curriculum_text_record(curriculum_doc)
+        except ExtractionPending as exc:
+            extraction_warnings.append(f"'{curriculum_doc.title}' is still being processed and was skipped. {exc}")
+            continue
         except ValueError as exc:
             warning = f"Could not use '{curriculum_doc.title}': {exc}"
             logger.warning(warning)
             extraction_warnings.append(warning)
+            continue
         except Exception:
             warning = f"Could not use '{curriculum_doc.title}': extraction failed unexpectedly."
             logger.error(warning)
             extraction_warnings.append(warning)
+            continue
+        if stored.content_hash not in titles_by_hash:
+            titles_by_hash[stored.content_hash] = curriculum_doc.title
+            curriculum_texts.append(stored)
+
+    if not curriculum_texts:
+        return "", extraction_warnings
 
+    passages_by_hash = {}
+    for chunk in retrieve_chunks(curriculum_texts, query, budget_tokens=budget_tokens):
+        passages_by_hash.setdefault(chunk['content_hash'], []).append(chunk['text'])
+    context_parts = [
+        f"\n\n--- From Curriculum: {title} ---\n" + "\n[...]\n".join(passages_by_hash[content_hash])
+        for content_hash, title in titles_by_hash.items()
+        if content_hash in passages_by_hash
+    ]
     return "".join(context_parts), extraction_warnings
 
 
@@ -72,43 +118,7 @@ def home(request):
     if not request.user.is_authenticated:
         return redirect(reverse('home:welcome'))
 
-    today = timezone.now().date()
-    recent_lessons = LessonPlan.objects.filter(user=request.user, is_archived=False)[:5]
-    total_lessons = LessonPlan.objects.filter(user=request.user).count()
-    total_materials = Material.objects.filter(user=request.user).count()
-    total_resources = Resource.objects.filter(user=request.user).count()
-    upcoming_lessons = LessonPlan.objects.filter(
-        user=request.user,
-        lesson_date__gte=today,
-        lesson_date__lte=today + timedelta(days=7),
-        is_archived=False,
-    ).order_by('lesson_date')[:5]
-    draft_lessons = LessonPlan.objects.filter(
-        user=request.user, is_draft=True, is_archived=False
-    ).order_by('-updated_at')[:3]
-
-    # Prepare calendar events
-    lesson_plans_for_calendar = LessonPlan.objects.filter(user=request.user, lesson_date__isnull=False)
-    calendar_events = []
-    for lesson in lesson_plans_for_calendar:
-        calendar_events.append({
-            'title': lesson.title,
-            'start': lesson.lesson_date.strftime("%Y-%m-%d"),
-            'url': reverse('home:lesson_detail', args=[lesson.pk]),
-            'allDay': True
-        })
-
-    context = {
-        'recent_lessons': recent_lessons,
-        'total_lessons': total_lessons,
-        'total_materials': total_materials,
-        'total_resources': total_resources,
-        'upcoming_lessons': upcoming_lessons,
-        'draft_lessons': draft_lessons,
-        'calendar_events': json.dumps(calendar_events)
-    }
-
-    return render(request, "pages/home.html", context)
+    return render(request, "pages/home.html", dashboard_data(request.user))
 
 
 def welcome(request):
@@ -117,11 +127,10 @@ def welcome(request):
     return render(request, 'pages/welcome.html')
 
 
-@login_required
-def mylessonplans(request):
-    """Enhanced lesson plans listing with search and filtering"""
-    form = LessonSearchForm(request.GET)
-    lessons_query = LessonPlan.objects.filter(user=request.user)
+def _search_lessons(user, form):
+    """Return ``(lessons, title_query)``: *user*'s lessons narrowed by a bound ``LessonSearchForm``."""
+    lessons_query = LessonPlan.objects.filter(user=user)
+    title_query = ''
 
     if form.is_valid():
         title_query = form.cleaned_data.get('title')
@@ -130,11 +139,7 @@ def mylessonplans(request):
         status = form.cleaned_data.get('status')
 
         if title_query:
-            lessons_query = lessons_query.filter(
-                Q(title__icontains=title_query) |
-                Q(description__icontains=title_query) |
-                Q(learning_objectives__icontains=title_query)
-            )
+            lessons_query = search_lessons(lessons_query, title_query)
         if subject:
             lessons_query = lessons_query.filter(subject=subject)
         if grade:
@@ -151,66 +156,132 @@ def mylessonplans(request):
             lessons_query = lessons_query.filter(is_archived=False)
     else:
         lessons_query = lessons_query.filter(is_archived=False)
+    return lessons_query, title_query
 
-    # Pagination
-    paginator = Paginator(lessons_query.order_by('-updated_at'), 10)
+
+@login_required
+def mylessonplans(request):
+    """Enhanced lesson plans listing with search and filtering"""
+    form = LessonSearchForm(request.GET)
+    lessons_query, title_query = _search_lessons(request.user, form)
+
+    # Pagination; search results come best match first
+    ordering = ('-search_rank', '-updated_at') if title_query else ('-updated_at',)
+    paginator = Paginator(lessons_query.for_list().order_by(*ordering), 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
-    # Prepare calendar events
-    lesson_plans_for_calendar = lessons_query.filter(lesson_date__isnull=False)
-    calendar_events = []
-    for lesson in lesson_plans_for_calendar:
-        calendar_events.append({
-            'title': lesson.title,
-            'start': lesson.lesson_date.strftime("%Y-%m-%d"),
-            'url': reverse('home:lesson_detail', args=[lesson.pk]),
-            'allDay': True
-        })
-
     return render(request, "pages/mylessonplans.html", {
         'page_obj': page_obj,
         'search_form': form,
         'lesson_plans': page_obj.object_list,
         'is_paginated': page_obj.has_other_pages(),
-        'calendar_events': json.dumps(calendar_events)
+        # The calendar feed applies the same search (every field is sent, so archived lessons stay hidden).
+        'calendar_events_url': reverse('home:calendar_events') + '?' + urlencode(
+            {name: request.GET.get(name, '') for name in LessonSearchForm.base_fields}),
     })
 
 
 @login_required
 def lesson_detail(request, pk):
     """Detailed lesson plan view with AI feedback"""
-    lesson = get_object_or_404(LessonPlan, pk=pk, user=request.user)
-    # ai_feedback = analyze_text(lesson.description) # Removed Cohere-specific feedback
-    ai_feedback = None # Or some other placeholder if you plan to add Gemini feedback here later
+    lesson = get_object_or_404(LessonPlan.objects.select_related('subject', 'grade', 'ai_review'),
+                               pk=pk, user=request.user)
+    # The stored review is served as is; saves queue a new one when the content changes.
+    review = getattr(lesson, 'ai_review', None)
     return render(request, "pages/lesson_plan_detail.html", {
         'lesson_plan': lesson,  # Changed context variable name
-        'ai_feedback': ai_feedback
+        'ai_feedback': review.feedback if review else None,
+        'ai_feedback_error': review.error if review else None,
+        'ai_feedback_outdated': review is not None and review.content_hash != review_content_hash(lesson),
     })
 
 
+def _conversation_history(request, request_type):
+    """Return ``(conversation, history messages)`` for the ``conversation_id`` of an AI POST."""
+    lesson_id = request.POST.get("lesson_id", "")
+    lesson = LessonPlan.objects.filter(pk=lesson_id, user=request.user).first() if lesson_id.isdigit() else None
+    conversation = get_conversation(request.user, request.POST.get("conversation_id"), lesson=lesson,
+                                    request_type=request_type)
+    return conversation, history_messages(conversation)
+
+
+def _lesson_assist_prompt(request, history_tokens=0):
+    """Return ``(full_prompt, used_context, extraction_warnings)`` for an AI assist POST."""
+    user_input = request.POST.get("ai_input", "")
+    selected_curriculum_ids = request.POST.getlist("curriculum_ids[]")  # Get selected curriculum IDs
+    # The conversation history shares the context window with the prompt.
+    reserve_tokens = MAX_TOKENS + history_tokens
+    context_text, extraction_warnings = _build_curriculum_context(
+        request.user, selected_curriculum_ids, query=user_input,
+        budget_tokens=context_token_budget(user_input, reserve_tokens),
+    )
+    full_prompt, _, used_context = build_prompt(user_input, context_text, reserve_tokens=reserve_tokens)
+    return full_prompt, used_context, extraction_warnings
+
+
 @login_required
-def createnewlesson(request):
+@require_POST
+def lesson_assist_stream(request):
+    """Stream AI lesson assistance to the lesson form as Server-Sent Events."""
+    conversation, history = _conversation_history(request, 'lesson_assist')
+    full_prompt, used_context, extraction_warnings = _lesson_assist_prompt(request, messages_tokens(history))
+
+    def events():
+        if extraction_warnings:
+            yield sse_event("warnings", extraction_warnings)
+        response_parts = []
+        failed = False
+        with closing(stream_ai_response(full_prompt, request_type='lesson_assist', user=request.user,
+                                        used_curriculum_context=used_context, history=history)) as stream:
+            for event, text in stream:
+                if event == "token":
+                    response_parts.append(text)
+                else:
+                    failed = True
+                yield sse_event(event, {"text": text})
+        if response_parts and not failed:
+            # The turn stores what the teacher typed, not the curriculum context sent with it.
+            record_exchange(conversation, request.POST.get("ai_input", ""), "".join(response_parts))
+            yield sse_event("conversation", {"id": conversation.pk})
+        yield sse_event("done", {})
+
+    return event_stream_response(request, events())
+
+
+async def _lesson_assist_json(request):
+    """Answer the lesson form's AJAX AI chat request without holding a worker thread."""
+    conversation, history = await sync_to_async(_conversation_history)(request, 'lesson_assist')
+    full_prompt, used_context, extraction_warnings = await sync_to_async(_lesson_assist_prompt)(
+        request, messages_tokens(history))
+    ai_response, success = await agenerate_ai_result(
+        full_prompt,
+        request_type='lesson_assist',
+        user=request.user,
+        used_curriculum_context=used_context,
+        history=history,
+    )
+    if success:
+        await sync_to_async(record_exchange)(conversation, request.POST.get("ai_input", ""), ai_response)
+    return JsonResponse({"ai_response": ai_response, "extraction_warnings": extraction_warnings,
+                         "conversation_id": conversation.pk})
+
+
+def _is_ajax(request):
+    return request.headers.get("X-Requested-With") == "XMLHttpRequest"
+
+
+@async_login_required
+async def createnewlesson(request):
     """Enhanced lesson creation with comprehensive form"""
+    # Handle AJAX AI chat requests asynchronously; the form itself is sync code.
+    if request.method == "POST" and _is_ajax(request):
+        return await _lesson_assist_json(request)
+    return await sync_to_async(_createnewlesson_form)(request)
+
+
+def _createnewlesson_form(request):
     if request.method == "POST":
-        # Handle AJAX AI chat requests
-        if request.headers.get("X-Requested-With") == "XMLHttpRequest":
-            user_input = request.POST.get("ai_input", "")
-            selected_curriculum_ids = request.POST.getlist("curriculum_ids[]") # Get selected curriculum IDs
-            context_text, extraction_warnings = _build_curriculum_context(request.user, selected_curriculum_ids)
-            
-            full_prompt = user_input
-            if context_text:
-                full_prompt += f"\n\n--- Relevant Curriculum Context ---{context_text}" # Corrected string concatenation
-
-            ai_response = generate_ai_response(
-                full_prompt,
-                request_type='lesson_assist',
-                user=request.user,
-                used_curriculum_context=bool(context_text),
-            )
-            return JsonResponse({"ai_response": ai_response, "extraction_warnings": extraction_warnings})
-        
         # Handle lesson creation
         form = LessonPlanForm(request.POST, user=request.user)
         if form.is_valid():
@@ -218,6 +289,7 @@ def createnewlesson(request):
             lesson.user = request.user
             lesson.save()
             form.save_m2m()  # Save many-to-many relationships (including selected curriculums)
+            enqueue_lesson_review(lesson)
             messages.success(request, f"Lesson '{lesson.title}' created successfully!")
             return redirect('home:lesson_detail', pk=lesson.pk)
         else:
@@ -230,34 +302,25 @@ def createnewlesson(request):
     return render(request, "pages/lesson_plan_form.html", {"form": form, "user_curriculums": user_curriculums})
 
 
-@login_required
-def edit_lesson(request, pk):
+@async_login_required
+async def edit_lesson(request, pk):
     """Edit existing lesson plan"""
+    # Handle AJAX AI chat requests (similar to createnewlesson)
+    if request.method == "POST" and _is_ajax(request):
+        if not await LessonPlan.objects.filter(pk=pk, user=request.user).aexists():
+            raise Http404("No LessonPlan matches the given query.")
+        return await _lesson_assist_json(request)
+    return await sync_to_async(_edit_lesson_form)(request, pk)
+
+
+def _edit_lesson_form(request, pk):
     lesson = get_object_or_404(LessonPlan, pk=pk, user=request.user)
-    
-    if request.method == "POST":
-        # Handle AJAX AI chat requests (similar to createnewlesson)
-        if request.headers.get("X-Requested-With") == "XMLHttpRequest":
-            user_input = request.POST.get("ai_input", "")
-            selected_curriculum_ids = request.POST.getlist("curriculum_ids[]")
-            context_text, extraction_warnings = _build_curriculum_context(request.user, selected_curriculum_ids)
-            
-            full_prompt = user_input
-            if context_text:
-                full_prompt += f"\n\n--- Relevant Curriculum Context ---{context_text}" # Corrected string concatenation
-
-            ai_response = generate_ai_response(
-                full_prompt,
-                request_type='lesson_assist',
-                user=request.user,
-                used_curriculum_context=bool(context_text),
-            )
-            return JsonResponse({"ai_response": ai_response, "extraction_warnings": extraction_warnings})
 
+    if request.method == "POST":
         form = LessonPlanForm(request.POST, instance=lesson, user=request.user)
         if form.is_valid():
-            lesson = form.save()
-            form.save_m2m() # Ensure curriculums are saved on edit too
+            lesson = form.save()  # commit=True also saves the many-to-many fields (curriculums)
+            enqueue_lesson_review(lesson)
             messages.success(request, f"Lesson '{lesson.title}' updated successfully!")
             return redirect('home:lesson_detail', pk=lesson.pk) # Added namespace
         else:
@@ -370,6 +433,7 @@ def autosave_lesson(request, pk=None):
         except Exception as exc:
             logger.exception("Autosave failed: %s", exc)
             return JsonResponse({'status': 'error', 'message': 'Save failed'}, status=500)
+        enqueue_lesson_review(lesson)
 
     return JsonResponse({
         'status': 'ok',
@@ -392,16 +456,29 @@ def archive_lesson(request, pk):
 
 @login_required
 def mycalendar_view(request):
-    lesson_plans = LessonPlan.objects.filter(user=request.user, lesson_date__isnull=False)
-    events = []
-    for lesson in lesson_plans:
-        events.append({
-            'title': lesson.title,
-            'start': lesson.lesson_date.strftime("%Y-%m-%d"),
-            'url': reverse('home:lesson_detail', args=[lesson.pk]),
-            'allDay': True
-        })
-    return render(request, 'pages/mycalendar.html', {'events': json.dumps(events)})
+    return render(request, 'pages/mycalendar.html')
+
+
+@login_required
+def calendar_events(request):
+    """
+    JSON events for the date range FullCalendar shows (``start``/``end`` GET params).
+
+    With any "My Lesson Plans" search field in the query string, only the
+    lessons matching that search (and their schedules) are included.
+    """
+    date_range = calendar_feed.parse_range(request.GET.get('start'), request.GET.get('end'))
+    if date_range is None:
+        return JsonResponse({'error': 'start and end must be dates at most '
+                                      f'{calendar_feed.MAX_RANGE.days} days apart.'}, status=400)
+    lessons = None
+    if request.GET.keys() & LessonSearchForm.base_fields.keys():
+        lessons, _ = _search_lessons(request.user, LessonSearchForm(request.GET))
+    response = JsonResponse(calendar_feed.calendar_events(request.user, *date_range, lessons=lessons), safe=False)
+    # Revalidate every time (an edited lesson shows up at once), but only resend changed ranges.
+    patch_cache_control(response, private=True, no_cache=True)
+    set_response_etag(response)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
 
 
 @login_required
@@ -411,6 +488,23 @@ def mycurriculums(request):
     return render(request, "pages/mycurriculums.html", {"curriculums": curriculums})
 
 
+@login_required
+def curriculum_status(request, pk):
+    """Lightweight JSON status for background curriculum text extraction."""
+    status = (
+        Curriculum.objects.filter(pk=pk, user=request.user)
+        .values('extraction_status', 'extraction_progress', 'extraction_error')
+        .first()
+    )
+    if status is None:
+        return JsonResponse({'error': 'Not found'}, status=404)
+    return JsonResponse({
+        'status': status['extraction_status'],
+        'progress': status['extraction_progress'],
+        'error': status['extraction_error'],
+    })
+
+
 @login_required
 @require_POST # Ensure this view only accepts POST requests for safety
 def delete_curriculum(request, pk):
@@ -567,25 +661,35 @@ def user_login(request):
         return render(request, "pages/login.html")
 
 
-@login_required
-def ai_chat(request):
+@async_login_required
+async def ai_chat(request):
     """AI chat functionality"""
     ai_response = ""
     user_input = ""
+    conversation_id = None
 
     if request.method == "POST":
         user_input = request.POST.get("ai_input", "")
         
         if user_input:
-            ai_response = generate_ai_response(
-                user_input,
+            conversation, history = await sync_to_async(_conversation_history)(request, 'general_chat')
+            prompt, _, _ = build_prompt(user_input, reserve_tokens=MAX_TOKENS + messages_tokens(history))
+            ai_response, success = await agenerate_ai_result(
+                prompt,
                 request_type='general_chat',
                 user=request.user,
+                history=history,
             )
+            if success:
+                await sync_to_async(record_exchange)(conversation, user_input, ai_response)
+            conversation_id = conversation.pk
 
-    return render(request, "ai/ai_chat.html", {
+    if _is_ajax(request):
+        return JsonResponse({"ai_response": ai_response, "conversation_id": conversation_id})
+    return await sync_to_async(render)(request, "ai/ai_chat.html", {
         "ai_response": ai_response, 
-        "user_input": user_input
+        "user_input": user_input,
+        "conversation_id": conversation_id,
     })
 
 
@@ -642,6 +746,8 @@ def upload_curriculum(request):
         "file_name": uploaded_file.name,
         "file_url": curriculum.file.url,
         "curriculum_pk": curriculum.pk,
+        "extraction_status": curriculum.extraction_status,
+        "status_url": reverse('home:curriculum_status', args=[curriculum.pk]),
     })
 
 
@@ -656,3 +762,39 @@ def profile_view(request):
     else:
         form = UserProfileForm(instance=request.user)
     return render(request, 'pages/profile.html', {'form': form})
+
+
+_DASHBOARD_RANGES = {AIUsageRollup.HOUR: timedelta(hours=48), AIUsageRollup.DAY: timedelta(days=30)}
+
+
+@staff_member_required
+def ai_usage_dashboard(request):
+    """AI usage statistics for staff, read from the rollups only (see ``manage.py rollup_ai_usage``)."""
+    period = request.GET.get('period')
+    if period not in _DASHBOARD_RANGES:
+        period = AIUsageRollup.DAY
+    rollups = AIUsageRollup.objects.filter(period=period,
+                                           period_start__gte=timezone.now() - _DASHBOARD_RANGES[period])
+    all_users = rollups.filter(user__isnull=True)
+    totals = list(all_users.values('request_type')
+              .annotate(requests=Sum('request_count'), successes=Sum('success_count'),
+                        prompt_chars=Sum('prompt_length_total'), response_chars=Sum('response_length_total'),
+                        tokens=Sum('prompt_tokens_total') + Sum('completion_tokens_total'),
+                        worst_p95_ms=Max('latency_p95_ms'))
+              .order_by('request_type'))
+    for row in totals:
+        row['success_rate'] = row['successes'] / row['requests'] if row['requests'] else 0
+        row['avg_prompt_length'] = row['prompt_chars'] // row['requests'] if row['requests'] else 0
+        row['avg_response_length'] = row['response_chars'] // row['requests'] if row['requests'] else 0
+    top_users = (rollups.filter(user__isnull=False)
+                 .values('user__username')
+                 .annotate(requests=Sum('request_count'), successes=Sum('success_count'),
+                           tokens=Sum('prompt_tokens_total') + Sum('completion_tokens_total'))
+                 .order_by('-requests')[:20])
+    return render(request, 'pages/ai_usage_dashboard.html', {
+        'period': period,
+        'periods': AIUsageRollup.PERIOD_CHOICES,
+        'totals': totals,
+        'series': all_users.order_by('-period_start', 'request_type'),
+        'top_users': top_users,
+    })